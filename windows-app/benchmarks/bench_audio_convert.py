@@ -0,0 +1,82 @@
+"""
+Per-frame cost of turning decoded AAC frames into interleaved int16 PCM:
+the old to_ndarray/reshape/multiply/astype path vs the persistent resampler
+"""
+import os
+import sys
+import time
+
+import av
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming.audio_output import AudioRingBuffer
+
+SAMPLE_RATE = 48000
+CHANNELS = 2
+ROUNDS = 50
+
+def decoded_frames(seconds: int = 2) -> list:
+    """A stereo tone through the AAC encoder and decoder, as the receiver sees it"""
+    encoder = av.CodecContext.create('aac', 'w')
+    encoder.sample_rate = SAMPLE_RATE
+    encoder.layout = 'stereo'
+    encoder.format = 'fltp'
+    encoder.open()
+    
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    planar = np.stack([0.5 * np.sin(2 * np.pi * 440 * t), 0.5 * np.sin(2 * np.pi * 660 * t)]).astype(np.float32)
+    packets = []
+    for start in range(0, planar.shape[1] - 1023, 1024):
+        frame = av.AudioFrame.from_ndarray(np.ascontiguousarray(planar[:, start:start + 1024]),
+                                           format='fltp', layout='stereo')
+        frame.sample_rate = SAMPLE_RATE
+        frame.pts = start
+        packets += list(encoder.encode(frame))
+    packets += list(encoder.encode(None))
+    
+    decoder = av.CodecContext.create('aac', 'r')
+    decoder.extradata = encoder.extradata
+    decoder.open()
+    return [frame for packet in packets for frame in decoder.decode(av.Packet(bytes(packet)))]
+
+def legacy_convert(frame) -> np.ndarray:
+    """Previous AudioDecoder path (planar data serialized channel after channel)"""
+    audio_array = frame.to_ndarray()
+    if len(audio_array.shape) > 1:
+        audio_array = audio_array.reshape(-1)
+    return (audio_array * 32767).astype(np.int16)
+
+def resampler_convert():
+    resampler = av.AudioResampler(format='s16', layout='stereo', rate=SAMPLE_RATE)
+    def convert(frame) -> np.ndarray:
+        converted = resampler.resample(frame)[0]
+        return np.frombuffer(converted.planes[0], dtype=np.int16, count=converted.samples * CHANNELS)
+    return convert
+
+def run(name: str, convert, frames: list):
+    ring = AudioRingBuffer(SAMPLE_RATE, CHANNELS)
+    out = np.empty((1024, CHANNELS), dtype=np.int16)
+    timings = []
+    for _ in range(ROUNDS):
+        for frame in frames:
+            start = time.perf_counter()
+            ring.write(convert(frame))
+            timings.append(time.perf_counter() - start)
+            ring.read_into(out)
+    
+    timings = np.array(timings) * 1e6
+    print(f"{name:<10} p50 {np.percentile(timings, 50):6.1f} us  p99 {np.percentile(timings, 99):6.1f} us  "
+          f"mean {timings.mean():6.1f} us  ({len(timings)} frames, incl. ring write)")
+    return np.median(timings)
+
+def main():
+    frames = decoded_frames()
+    print(f"Decoder output: {frames[0].format.name} {frames[0].layout.name}, {frames[0].samples} samples/frame")
+    legacy = run("legacy", legacy_convert, frames)
+    resampled = run("resampler", resampler_convert(), frames)
+    print(f"resampler/legacy: {resampled / legacy:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Virtual camera transport benchmark: persistent IOCTL buffer vs shared-memory frame ring,
+with a reader process consuming the ring concurrently
+"""
+import os
+import sys
+import time
+import multiprocessing
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from virtual_camera.driver_backend import LoopbackDriverBackend
+from virtual_camera.frame_ring import SharedFrameRing, SharedFrameRingReader
+from virtual_camera.virtucore_camera import VirtuCoreCamera
+
+WIDTH = 1920
+HEIGHT = 1080
+
+def make_planes(seed: int = 1):
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, 255, (HEIGHT, WIDTH), dtype=np.uint8)
+    uv = rng.integers(0, 255, (HEIGHT // 2, WIDTH), dtype=np.uint8)
+    return y, uv
+
+def send_loop(camera: VirtuCoreCamera, planes, count: int) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        camera.send_planes(planes, 'nv12', timestamp=i)
+    return count / (time.perf_counter() - start)
+
+def reader_process(name: str, stop, results):
+    reader = SharedFrameRingReader(name)
+    while not stop.is_set():
+        if reader.read_latest() is None:
+            time.sleep(0.001)
+    results.update(reader.get_stats())
+    reader.close()
+
+def main():
+    planes = make_planes()
+    count = 300
+    
+    camera = VirtuCoreCamera(backend=LoopbackDriverBackend(record=False))
+    camera.open()
+    camera.negotiate_format(WIDTH, HEIGHT)
+    print(f"IOCTL buffer (loopback)   {send_loop(camera, planes, count):8.0f} frames/s")
+    
+    ring = SharedFrameRing(f"vcam_bench_{os.getpid()}", slot_count=3, slot_capacity=WIDTH * HEIGHT * 3)
+    camera = VirtuCoreCamera(frame_ring=ring)
+    camera.open()
+    camera.negotiate_format(WIDTH, HEIGHT)
+    print(f"shared-memory ring        {send_loop(camera, planes, count):8.0f} frames/s")
+    
+    with multiprocessing.Manager() as manager:
+        results = manager.dict()
+        stop = multiprocessing.Event()
+        process = multiprocessing.Process(target=reader_process, args=(ring.name, stop, results))
+        process.start()
+        time.sleep(0.5)
+        fps = send_loop(camera, planes, count)
+        time.sleep(0.1)
+        stop.set()
+        process.join()
+        print(f"ring + reader process     {fps:8.0f} frames/s  reader: {dict(results)}")
+    
+    ring.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Throughput benchmark for the Annex-B NAL unit scanner on multi-megabyte inputs
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streaming.h264 import index_nal_units, classify_access_unit, NAL_IDR, NAL_SLICE, NAL_SPS, NAL_PPS
+
+def make_nal(nal_type: int, ref_idc: int, size: int, rng: random.Random) -> bytes:
+    """Random NAL body with emulation prevention applied (no 00 00 sequences)"""
+    body = rng.randbytes(size).replace(b'\x00\x00', b'\x00\x03')
+    return bytes([(ref_idc << 5) | nal_type]) + body
+
+def build_stream(total_size: int, seed: int = 1) -> bytes:
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    frame = 0
+    while size < total_size:
+        if frame % 30 == 0:
+            units = [make_nal(NAL_SPS, 3, 20, rng), make_nal(NAL_PPS, 3, 5, rng), make_nal(NAL_IDR, 3, 150000, rng)]
+        else:
+            units = [make_nal(NAL_SLICE, 2, rng.randint(5000, 30000), rng)]
+        for unit in units:
+            start_code = b'\x00\x00\x00\x01' if rng.random() < 0.5 else b'\x00\x00\x01'
+            parts.append(start_code + unit)
+            size += len(start_code) + len(unit)
+        frame += 1
+    return b''.join(parts)
+
+def naive_index(data: bytes) -> list:
+    """Per-byte Python scan, for comparison"""
+    units = []
+    zeros = 0
+    for i, byte in enumerate(data):
+        if byte == 1 and zeros >= 2 and i + 1 < len(data):
+            units.append((i + 1, data[i + 1] & 0x1F))
+        zeros = zeros + 1 if byte == 0 else 0
+    return units
+
+def run(name: str, func, data: bytes, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(data)
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{name:<22} {len(data) / elapsed / 1e6:10.1f} MB/s  {len(result) / elapsed:>14,.0f} NAL/s")
+    return len(data) / elapsed
+
+def main():
+    for megabytes in (4, 32):
+        data = build_stream(megabytes * 1024 * 1024)
+        print(f"Input: {len(data) / 1e6:.1f} MB")
+        fast = run("index_nal_units", index_nal_units, data, 5)
+        if megabytes == 4:
+            slow = run("naive python loop", naive_index, data, 1)
+            print(f"speedup: {fast / slow:.0f}x")
+    
+    frames = [data[unit.offset - 3:unit.offset + unit.size] for unit in index_nal_units(data)[:2000]]
+    start = time.perf_counter()
+    for frame in frames:
+        classify_access_unit(memoryview(frame))
+    elapsed = time.perf_counter() - start
+    print(f"classify_access_unit   {len(frames) / elapsed:>14,.0f} frames/s")
+
+if __name__ == "__main__":
+    main()
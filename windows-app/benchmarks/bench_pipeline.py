@@ -0,0 +1,473 @@
+"""
+End-to-end benchmark of the receive pipeline over loopback:
+emulated phone (protocol.emulator) -> ConnectionManager -> StreamReceiver
+-> VideoDecoder / AudioDecoder -> stub sinks (bgr24 conversion, collecting microphone)
+
+    python benchmarks/bench_pipeline.py [--scenarios 720p30,1080p60] [--mode realtime|fast|both]
+                                        [--seconds 5] [--output results.json] [--compare old.json]
+
+Synthetic H.264 (libx264, MediaCodec-like: separate SPS/PPS, no B-frames,
+one IDR per second) and AAC streams are generated once per scenario and cached
+as protocol captures. Every scenario and mode runs in its own process so peak
+RSS and CPU time belong to that run only; the emulator runs in another one.
+
+realtime replays at the original timing with the app's receiver settings
+and is the one to read latencies from (counted from the moment the emulator
+sent the packet). fast replays as fast as the socket takes it, with frame
+dropping off, and gives throughput; its latencies are mostly queueing.
+Results are written as JSON with the commit they were measured on, and
+--compare prints the change against an earlier result file.
+"""
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import platform
+import subprocess
+import tempfile
+import multiprocessing
+from fractions import Fraction
+
+import av
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import Packet, PacketType, CaptureWriter, CaptureReader
+from protocol.emulator import DeviceEmulator
+from streaming.h264 import index_nal_units, NAL_IDR
+
+RESOLUTIONS = {'720p': (1280, 720), '1080p': (1920, 1080), '4k': (3840, 2160)}
+FRAME_RATES = [30, 60]
+# Roughly what the Android encoder is configured with at each size
+BITRATES = {'720p': 5_000_000, '1080p': 10_000_000, '4k': 35_000_000}
+SAMPLE_RATE = 48000
+AAC_FRAME_SAMPLES = 1024
+
+SCENARIOS = [f"{name}{fps}" for name in RESOLUTIONS for fps in FRAME_RATES]
+
+def parse_scenario(scenario: str):
+    for name in RESOLUTIONS:
+        if scenario.startswith(name):
+            return name, RESOLUTIONS[name], int(scenario[len(name):])
+    raise ValueError(f"Unknown scenario {scenario!r}, expected one of {', '.join(SCENARIOS)}")
+
+def encode_video(width: int, height: int, fps: int, seconds: float, bit_rate: int):
+    """(config, [access units]): a scrolling noise texture, so the encoder has real work"""
+    codec = av.CodecContext.create('libx264', 'w')
+    codec.width = width
+    codec.height = height
+    codec.pix_fmt = 'yuv420p'
+    codec.time_base = Fraction(1, fps)
+    codec.framerate = Fraction(fps, 1)
+    codec.gop_size = fps
+    codec.bit_rate = bit_rate
+    codec.options = {'preset': 'ultrafast', 'tune': 'zerolatency', 'bf': '0',
+                     'repeat-headers': '0', 'sc_threshold': '0'}
+    codec.open()
+    
+    rng = np.random.default_rng(1)
+    texture = rng.integers(0, 256, (height, width + 64 * fps), dtype=np.uint8)
+    chroma = np.full((height // 2, width // 2), 128, dtype=np.uint8)
+    frame = av.VideoFrame(width, height, 'yuv420p')
+    packets = []
+    for i in range(int(seconds * fps)):
+        shift = (i * 8) % (64 * fps)
+        frame.planes[0].update(np.ascontiguousarray(texture[:, shift:shift + width]))
+        frame.planes[1].update(chroma)
+        frame.planes[2].update(chroma)
+        frame.pts = i
+        packets.extend(bytes(p) for p in codec.encode(frame))
+    packets.extend(bytes(p) for p in codec.encode(None))
+    
+    first = packets[0]
+    idr = next(unit for unit in index_nal_units(first) if unit.nal_type == NAL_IDR)
+    config_end = idr.offset - 4 if first[idr.offset - 4] == 0 else idr.offset - 3
+    packets[0] = first[config_end:]
+    return first[:config_end], packets
+
+def encode_audio(seconds: float):
+    """(AUDIO_CONFIG payload, [AAC frames]) of a stereo tone"""
+    encoder = av.CodecContext.create('aac', 'w')
+    encoder.sample_rate = SAMPLE_RATE
+    encoder.layout = 'stereo'
+    encoder.format = 'fltp'
+    encoder.open()
+    
+    count = int(seconds * SAMPLE_RATE / AAC_FRAME_SAMPLES)
+    t = np.arange((count + 2) * AAC_FRAME_SAMPLES) / SAMPLE_RATE
+    planar = np.stack([np.sin(2 * np.pi * 440 * t), np.sin(2 * np.pi * 660 * t)]).astype(np.float32) * 0.3
+    packets = []
+    for i in range(count + 2):
+        chunk = np.ascontiguousarray(planar[:, i * AAC_FRAME_SAMPLES:(i + 1) * AAC_FRAME_SAMPLES])
+        frame = av.AudioFrame.from_ndarray(chunk, format='fltp', layout='stereo')
+        frame.sample_rate = SAMPLE_RATE
+        frame.pts = i * AAC_FRAME_SAMPLES
+        packets.extend(bytes(p) for p in encoder.encode(frame))
+    config = struct.pack('>II', SAMPLE_RATE, 2) + bytes(encoder.extradata)
+    return config, packets[:count]
+
+def build_capture(path: str, scenario: str, seconds: float):
+    """Write the scenario as a capture whose arrival times are the device timestamps"""
+    name, (width, height), fps = parse_scenario(scenario)
+    video_config, video = encode_video(width, height, fps, seconds, BITRATES[name])
+    audio_config, audio = encode_audio(seconds)
+    
+    frame_us = 1_000_000 / fps
+    aac_frame_us = AAC_FRAME_SAMPLES * 1_000_000 / SAMPLE_RATE
+    packets = [(0, PacketType.VIDEO_CONFIG, video_config), (0, PacketType.AUDIO_CONFIG, audio_config)]
+    packets += [(int(i * frame_us), PacketType.VIDEO_FRAME, data) for i, data in enumerate(video)]
+    packets += [(int(i * aac_frame_us), PacketType.AUDIO_FRAME, data) for i, data in enumerate(audio)]
+    packets.sort(key=lambda packet: packet[0])
+    
+    writer = CaptureWriter(path + '.tmp')
+    for timestamp, packet_type, data in packets:
+        packet = Packet(packet_type, data, timestamp)
+        writer.write_packet(packet.header, data, arrival_us=timestamp)
+    writer.close()
+    os.replace(path + '.tmp', path)
+
+def cached_capture(cache_dir: str, scenario: str, seconds: float) -> str:
+    path = os.path.join(cache_dir, f"{scenario}_{seconds:g}s.awscap")
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        print(f"  generating {scenario} ({seconds:g} s)...", file=sys.stderr, flush=True)
+        build_capture(path, scenario, seconds)
+    return path
+
+def peak_rss_mb():
+    """Peak resident set size of this process"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+        
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+        
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize / (1024 * 1024)
+    except Exception:
+        pass
+    return None
+
+class StubMicrophone:
+    """Stands in for VirtuCoreMicrophone: counts PCM and stamps when it arrives"""
+    def __init__(self, on_audio):
+        self.output = None
+        self.on_audio = on_audio
+    
+    def open(self):
+        return True
+    
+    def configure(self, sample_rate, channels):
+        pass
+    
+    def send_audio(self, audio_data):
+        self.on_audio(len(audio_data))
+        return True
+    
+    def get_stats(self) -> dict:
+        return {}
+    
+    def close(self):
+        pass
+
+class StageTimer:
+    """Latency samples and CPU time of one pipeline stage"""
+    def __init__(self):
+        self.latencies = []
+        self.cpu = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.first = None
+        self.last = None
+    
+    def add(self, now: float, latency: float = None, cpu: float = 0.0, size: int = 0):
+        if self.first is None:
+            self.first = now
+        self.last = now
+        self.items += 1
+        self.bytes += size
+        self.cpu += cpu
+        if latency is not None:
+            self.latencies.append(latency)
+    
+    def summary(self) -> dict:
+        span = (self.last - self.first) if self.items > 1 else 0.0
+        result = {
+            'count': self.items,
+            'per_second': self.items / span if span else None,
+            'mb_per_second': self.bytes / span / 1e6 if span and self.bytes else None,
+            'cpu_s': round(self.cpu, 4)
+        }
+        if self.latencies:
+            latencies = np.asarray(self.latencies) * 1000
+            result['p50_ms'] = round(float(np.percentile(latencies, 50)), 3)
+            result['p99_ms'] = round(float(np.percentile(latencies, 99)), 3)
+            result['max_ms'] = round(float(latencies.max()), 3)
+        return result
+
+def serve_capture(path: str, realtime: bool, conn):
+    """Emulator process: serve one client and report when the replay started"""
+    emulator = DeviceEmulator(path, '127.0.0.1', 0, realtime=realtime)
+    conn.send(emulator.start())
+    conn.recv()
+    conn.send(emulator.get_stats())
+    emulator.stop()
+
+def run_scenario(path: str, realtime: bool, timeout: float) -> dict:
+    """One measured run in this process; the emulator runs in a child process"""
+    import logging
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    from streaming.connection import ConnectionManager
+    from streaming.receiver import StreamReceiver
+    from streaming.decoder import VideoDecoder, AudioDecoder
+    from streaming.pipeline import OverflowPolicy
+    
+    with CaptureReader(path) as capture:
+        headers = capture.headers()
+        video_count = int((headers['packet_type'] == PacketType.VIDEO_FRAME).sum())
+        audio_count = int((headers['packet_type'] == PacketType.AUDIO_FRAME).sum())
+        first_arrival = int(capture.index['arrival_us'][0])
+        # Device timestamp -> seconds after replay start at which the packet was sent
+        due_s = {int(ts): (int(arrival) - first_arrival) / 1e6
+                 for ts, arrival, kind in zip(headers['timestamp'], capture.index['arrival_us'], headers['packet_type'])
+                 if kind == PacketType.VIDEO_FRAME}
+        del headers
+    
+    connection = ConnectionManager()
+    if realtime:
+        # The app's own configuration
+        receiver = StreamReceiver(connection)
+    else:
+        # Nothing may be dropped or paced when measuring throughput
+        receiver = StreamReceiver(connection, video_overflow=OverflowPolicy.BLOCK,
+                                  audio_jitter_buffer=False, audio_overflow=OverflowPolicy.BLOCK)
+        receiver.drop_policy.enabled = False
+    
+    stages = {name: StageTimer() for name in ('receive', 'video_decode', 'convert', 'audio_decode', 'end_to_end')}
+    received_at = {}
+    current_audio = [None]
+    
+    receive_cpu = []
+    
+    def on_packet(header, payload):
+        now = time.perf_counter()
+        if header.packet_type == PacketType.VIDEO_FRAME:
+            received_at[header.timestamp] = now
+        if header.packet_type in (PacketType.VIDEO_FRAME, PacketType.AUDIO_FRAME):
+            stages['receive'].add(now, size=len(payload))
+            # Runs on the receive thread: its CPU clock covers recv, framing and dispatch
+            receive_cpu.append(time.thread_time())
+    
+    def on_audio(samples: int):
+        stages['audio_decode'].add(time.perf_counter())
+    
+    video_decoder = VideoDecoder()
+    audio_decoder = AudioDecoder(virtual_microphone=StubMicrophone(on_audio))
+    
+    def decode_video(data, timestamp, is_keyframe):
+        cpu = time.thread_time()
+        video_decoder.decode(data, timestamp, is_keyframe)
+        stages['video_decode'].cpu += time.thread_time() - cpu
+    
+    def decode_audio(data, timestamp):
+        cpu = time.thread_time()
+        audio_decoder.decode(data, timestamp)
+        stages['audio_decode'].cpu += time.thread_time() - cpu
+    
+    converted_at = []
+    
+    def on_frame(frame):
+        start = time.perf_counter()
+        cpu = time.thread_time()
+        # What the virtual camera and preview ask for
+        frame.to_ndarray('bgr24')
+        end = time.perf_counter()
+        received = received_at.get(frame.timestamp)
+        stages['video_decode'].add(start, None if received is None else start - received)
+        stages['convert'].add(end, end - start, time.thread_time() - cpu)
+        converted_at.append((frame.timestamp, end))
+    
+    video_decoder.add_sink(on_frame)
+    receiver.on_video_config = video_decoder.set_config
+    receiver.on_video_frame = decode_video
+    receiver.on_audio_config = audio_decoder.set_config
+    receiver.on_audio_frame = decode_audio
+    receiver.on_audio_conceal = audio_decoder.conceal
+    receiver.add_packet_sink(on_packet)
+    
+    context = multiprocessing.get_context('spawn')
+    parent, child = context.Pipe()
+    emulator = context.Process(target=serve_capture, args=(path, realtime, child), daemon=True)
+    emulator.start()
+    port = parent.recv()
+    
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    connection.connect_wifi('127.0.0.1', port)
+    receiver.start()
+    
+    # Done when every frame made it out (or was dropped) or nothing has moved for a while
+    deadline = time.perf_counter() + timeout
+    last_progress = (0, 0)
+    idle_since = time.perf_counter()
+    while time.perf_counter() < deadline:
+        time.sleep(0.05)
+        dropped = receiver.drop_policy.frames_dropped + (receiver.video_stage.dropped if receiver.video_stage else 0)
+        progress = (stages['convert'].items + dropped, stages['audio_decode'].items)
+        if progress[0] >= video_count and (progress[1] >= audio_count or realtime):
+            break
+        if progress != last_progress:
+            last_progress = progress
+            idle_since = time.perf_counter()
+        elif time.perf_counter() - idle_since > 2.0:
+            break
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    
+    parent.send('done')
+    emulator_stats = parent.recv()
+    emulator.join(timeout=5.0)
+    receiver_stats = receiver.get_stats()
+    receiver.stop()
+    connection.disconnect()
+    video_decoder.close()
+    audio_decoder.close()
+    
+    if receive_cpu:
+        stages['receive'].cpu = receive_cpu[-1] - receive_cpu[0]
+    if realtime:
+        # perf_counter is system-wide (CLOCK_MONOTONIC / QueryPerformanceCounter), so the
+        # emulator's replay start is on the same clock: latency counts from the moment of sending
+        started = emulator_stats['replay_started']
+        stages['receive'].latencies = [at - started - due_s[ts] for ts, at in received_at.items() if ts in due_s]
+        for ts, at in converted_at:
+            if ts in due_s:
+                stages['end_to_end'].add(at, at - started - due_s[ts])
+    else:
+        del stages['end_to_end']
+    
+    return {
+        'video_frames': video_count,
+        'audio_frames': audio_count,
+        'wall_s': round(wall, 3),
+        'cpu_s': round(cpu, 3),
+        'cpu_percent': round(cpu / wall * 100, 1) if wall else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'frames_dropped': receiver_stats['video_drop']['frames_dropped'] if 'video_drop' in receiver_stats else 0,
+        'emulator_max_lateness_ms': round(emulator_stats['max_lateness_ms'], 3),
+        'stages': {name: timer.summary() for name, timer in stages.items()}
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def run_isolated(path: str, mode: str, timeout: float) -> dict:
+    """Run one scenario in a fresh interpreter so peak RSS is its own"""
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', path, '--mode', mode,
+                             '--timeout', str(timeout)], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark run failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def print_result(scenario: str, mode: str, result: dict):
+    print(f"\n{scenario} {mode}: wall {result['wall_s']:.2f} s, CPU {result['cpu_s']:.2f} s "
+          f"({result['cpu_percent']}%), peak RSS {result['peak_rss_mb'] or 0:.0f} MB, "
+          f"dropped {result['frames_dropped']}")
+    for name, stage in result['stages'].items():
+        rate = f"{stage['per_second']:8.1f}/s" if stage['per_second'] else "       -  "
+        mbps = f"{stage['mb_per_second']:7.1f} MB/s" if stage['mb_per_second'] else "            "
+        latency = (f"p50 {stage['p50_ms']:8.2f} ms  p99 {stage['p99_ms']:8.2f} ms"
+                   if 'p50_ms' in stage else "")
+        print(f"  {name:<13} {stage['count']:6d} {rate} {mbps}  {latency}  cpu {stage['cpu_s']:.3f} s")
+
+def compare(results: dict, baseline_path: str):
+    """Print the relative change of the headline numbers against an earlier run"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline.get('commit')} ({baseline_path}):")
+    old_runs = {(run['scenario'], run['mode']): run for run in baseline['runs']}
+    for run in results['runs']:
+        old = old_runs.get((run['scenario'], run['mode']))
+        if not old:
+            continue
+        changes = []
+        for label, path in (('cpu_s', ('cpu_s',)), ('rss', ('peak_rss_mb',)),
+                            ('decode/s', ('stages', 'video_decode', 'per_second')),
+                            ('e2e p50', ('stages', 'end_to_end', 'p50_ms')),
+                            ('e2e p99', ('stages', 'end_to_end', 'p99_ms'))):
+            new_value, old_value = run, old
+            for key in path:
+                new_value = (new_value or {}).get(key)
+                old_value = (old_value or {}).get(key)
+            if new_value and old_value:
+                changes.append(f"{label} {(new_value - old_value) / old_value * 100:+.1f}%")
+        print(f"  {run['scenario']:<8} {run['mode']:<8} " + ", ".join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end receive pipeline benchmark over loopback")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"comma separated: {', '.join(SCENARIOS)}")
+    parser.add_argument('--mode', choices=['realtime', 'fast', 'both'], default='both')
+    parser.add_argument('--seconds', type=float, default=5.0, help="length of the generated streams")
+    parser.add_argument('--cache-dir', default=os.path.join(tempfile.gettempdir(), 'android-stream-bench'))
+    parser.add_argument('--output', help="JSON results file (default: bench_pipeline_<commit>.json)")
+    parser.add_argument('--compare', help="earlier JSON results to compare against")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.run:
+        print(json.dumps(run_scenario(args.run, args.mode == 'realtime', args.timeout)))
+        return
+    
+    commit = git_commit()
+    results = {
+        'commit': commit,
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'pyav': av.__version__,
+        'seconds': args.seconds,
+        'runs': []
+    }
+    modes = ['realtime', 'fast'] if args.mode == 'both' else [args.mode]
+    for scenario in args.scenarios.split(','):
+        parse_scenario(scenario)
+        path = cached_capture(args.cache_dir, scenario, args.seconds)
+        for mode in modes:
+            result = run_isolated(path, mode, args.timeout)
+            print_result(scenario, mode, result)
+            results['runs'].append({'scenario': scenario, 'mode': mode, **result})
+    
+    output = args.output or f"bench_pipeline_{commit or 'unknown'}.json"
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
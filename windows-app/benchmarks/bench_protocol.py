@@ -0,0 +1,88 @@
+"""
+Microbenchmark for PacketHeader parsing: legacy codec vs precompiled codec vs bulk parsing
+"""
+import os
+import sys
+import time
+import struct
+from dataclasses import dataclass
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import Packet, PacketHeader, PacketType, parse_headers
+
+PACKET_COUNT = 200000
+
+@dataclass
+class LegacyPacketHeader:
+    magic: int
+    packet_type: PacketType
+    payload_size: int
+    timestamp: int
+    sequence_number: int
+    
+    @staticmethod
+    def from_bytes(data: bytes) -> 'LegacyPacketHeader':
+        magic, packet_type, payload_size, timestamp, seq_num = struct.unpack('>IBIQI', data)
+        return LegacyPacketHeader(
+            magic=magic,
+            packet_type=PacketType(packet_type),
+            payload_size=payload_size,
+            timestamp=timestamp,
+            sequence_number=seq_num
+        )
+
+def build_stream(count: int) -> bytes:
+    """Audio-sized packets with an occasional video frame"""
+    packets = []
+    for i in range(count):
+        if i % 3 == 0:
+            packets.append(Packet(PacketType.VIDEO_FRAME, b'\x00' * 2000, i * 33333, i).to_bytes())
+        else:
+            packets.append(Packet(PacketType.AUDIO_FRAME, b'\x00' * 300, i * 21333, i).to_bytes())
+    return b''.join(packets)
+
+def bench_legacy(data: bytes) -> int:
+    offset = 0
+    count = 0
+    header_size = PacketHeader.HEADER_SIZE
+    while offset < len(data):
+        header = LegacyPacketHeader.from_bytes(data[offset:offset + header_size])
+        payload = data[offset + header_size:offset + header_size + header.payload_size]
+        offset += header_size + len(payload)
+        count += 1
+    return count
+
+def bench_codec(data: bytes) -> int:
+    view = memoryview(data)
+    offset = 0
+    count = 0
+    header_size = PacketHeader.HEADER_SIZE
+    from_buffer = PacketHeader.from_buffer
+    while offset < len(data):
+        header = from_buffer(view, offset)
+        payload = view[offset + header_size:offset + header_size + header.payload_size]
+        offset += header_size + header.payload_size
+        count += 1
+    return count
+
+def bench_bulk(data: bytes) -> int:
+    return len(parse_headers(data))
+
+def run(name: str, func, data: bytes):
+    start = time.perf_counter()
+    count = func(data)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12} {count:>8} packets  {elapsed * 1000:8.1f} ms  {count / elapsed:>12,.0f} packets/s")
+    return count / elapsed
+
+def main():
+    data = build_stream(PACKET_COUNT)
+    print(f"Stream: {PACKET_COUNT} packets, {len(data) / 1e6:.1f} MB")
+    legacy = run("legacy", bench_legacy, data)
+    codec = run("codec", bench_codec, data)
+    bulk = run("bulk", bench_bulk, data)
+    print(f"codec speedup: {codec / legacy:.2f}x, bulk speedup: {bulk / legacy:.2f}x")
+
+if __name__ == "__main__":
+    main()
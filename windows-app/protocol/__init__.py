@@ -1,4 +1,7 @@
-from .protocol import PacketType, Packet, PacketHeader, ControlCommand, MAGIC_NUMBER
-
-__all__ = ['PacketType', 'Packet', 'PacketHeader', 'ControlCommand', 'MAGIC_NUMBER']
+from .protocol import (PacketType, Packet, PacketHeader, ControlCommand, MAGIC_NUMBER,
+                       PACKET_TYPES, HEADER_STRUCT, HEADER_DTYPE, parse_headers)
+from .capture import CaptureWriter, CaptureReader
 
+__all__ = ['PacketType', 'Packet', 'PacketHeader', 'ControlCommand', 'MAGIC_NUMBER',
+           'PACKET_TYPES', 'HEADER_STRUCT', 'HEADER_DTYPE', 'parse_headers',
+           'CaptureWriter', 'CaptureReader']
@@ -0,0 +1,170 @@
+import mmap
+import time
+import struct
+import logging
+import numpy as np
+from typing import Optional, Iterator, Tuple
+from threading import Lock
+from .protocol import PacketHeader, PAYLOAD_SIZE_STRUCT, PAYLOAD_SIZE_OFFSET, parse_headers
+
+logger = logging.getLogger(__name__)
+
+# File header: magic, version, reserved
+CAPTURE_MAGIC = b'AWSMCAP1'
+CAPTURE_HEADER = struct.Struct('<8sII')
+# Footer at the very end of a finalized capture: magic, index offset, packet count
+INDEX_MAGIC = b'AWSMIDX1'
+CAPTURE_FOOTER = struct.Struct('<8sQQ')
+CAPTURE_VERSION = 1
+
+# One record per packet: offset of its header from the start of the data section, host arrival time
+INDEX_DTYPE = np.dtype([('offset', '<i8'), ('arrival_us', '<i8')])
+
+class CaptureWriter:
+    """Writes received packets to a capture file, byte for byte as they came off the wire.
+    
+    Layout: file header, the raw packet stream (headers and payloads exactly
+    as the phone sent them, so parse_headers and a socket can use it as is),
+    then an INDEX_DTYPE array and a fixed footer pointing at it. A capture
+    that was never closed has no index; CaptureReader rebuilds it from the
+    headers, with device timestamps standing in for arrival times.
+    
+    write_packet is a StreamReceiver packet sink. It only appends to a
+    large buffered file, so it costs one copy on the receive thread.
+    """
+    def __init__(self, path: str, buffer_size: int = 4 * 1024 * 1024):
+        self.path = path
+        self._file = open(path, 'wb', buffering=buffer_size)
+        self._file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, 0))
+        self._header_buffer = bytearray(PacketHeader.HEADER_SIZE)
+        self._offsets = []
+        self._arrivals = []
+        self._data_size = 0
+        self._lock = Lock()
+        self.closed = False
+    
+    def write_packet(self, header: PacketHeader, payload, arrival_us: Optional[int] = None):
+        if arrival_us is None:
+            arrival_us = time.monotonic_ns() // 1000
+        with self._lock:
+            if self.closed:
+                return
+            header.pack_into(self._header_buffer)
+            self._file.write(self._header_buffer)
+            self._file.write(payload)
+            self._offsets.append(self._data_size)
+            self._arrivals.append(arrival_us)
+            self._data_size += PacketHeader.HEADER_SIZE + len(payload)
+    
+    def close(self):
+        """Append the index and footer"""
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            index = np.empty(len(self._offsets), dtype=INDEX_DTYPE)
+            index['offset'] = self._offsets
+            index['arrival_us'] = self._arrivals
+            index_offset = CAPTURE_HEADER.size + self._data_size
+            self._file.write(index.tobytes())
+            self._file.write(CAPTURE_FOOTER.pack(INDEX_MAGIC, index_offset, len(index)))
+            self._file.close()
+        logger.info(f"Capture closed: {len(index)} packets, {self._data_size / 1e6:.1f} MB in {self.path}")
+    
+    @property
+    def packet_count(self) -> int:
+        return len(self._offsets)
+    
+    def get_stats(self) -> dict:
+        return {
+            'path': self.path,
+            'packets': len(self._offsets),
+            'bytes': self._data_size
+        }
+
+class CaptureReader:
+    """Memory-mapped view of a capture file.
+    
+    data is the raw packet stream as a zero-copy memoryview of the map,
+    index gives each packet's offset in it and its original arrival time,
+    so a replay can slice runs of packets straight out of the map.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, version, _ = CAPTURE_HEADER.unpack_from(self._map, 0)
+        if magic != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a packet capture")
+        if version != CAPTURE_VERSION:
+            raise ValueError(f"Unsupported capture version {version}")
+        
+        data_start = CAPTURE_HEADER.size
+        data_end = len(self._map)
+        self.index: Optional[np.ndarray] = None
+        if len(self._map) >= data_start + CAPTURE_FOOTER.size:
+            index_magic, index_offset, count = CAPTURE_FOOTER.unpack_from(self._map, len(self._map) - CAPTURE_FOOTER.size)
+            if index_magic == INDEX_MAGIC:
+                data_end = index_offset
+                self.index = np.frombuffer(self._map, dtype=INDEX_DTYPE, count=count, offset=index_offset)
+        
+        self.data = memoryview(self._map)[data_start:data_end]
+        self._headers: Optional[np.ndarray] = None
+        if self.index is None:
+            # Unfinalized capture: index the complete packets, arrival = device timestamp
+            logger.warning(f"Capture {path} has no index, rebuilding it from the packet headers")
+            headers = self.headers()
+            self.index = np.empty(len(headers), dtype=INDEX_DTYPE)
+            self.index['offset'] = headers['offset']
+            self.index['arrival_us'] = headers['timestamp'].astype(np.int64)
+            self.data = self.data[:self.end_offset(len(headers) - 1)] if len(headers) else self.data[:0]
+    
+    def __len__(self) -> int:
+        return len(self.index)
+    
+    def headers(self) -> np.ndarray:
+        """All headers as a structured array (parse_headers), parsed once"""
+        if self._headers is None:
+            self._headers = parse_headers(self.data)
+        return self._headers
+    
+    def end_offset(self, i: int) -> int:
+        """Offset just past packet i"""
+        offset = int(self.index['offset'][i])
+        payload_size = PAYLOAD_SIZE_STRUCT.unpack_from(self.data, offset + PAYLOAD_SIZE_OFFSET)[0]
+        return offset + PacketHeader.HEADER_SIZE + payload_size
+    
+    def packet(self, i: int) -> Tuple[PacketHeader, memoryview]:
+        """Header and zero-copy payload view of packet i"""
+        offset = int(self.index['offset'][i])
+        header = PacketHeader.from_buffer(self.data, offset)
+        start = offset + PacketHeader.HEADER_SIZE
+        return header, self.data[start:start + header.payload_size]
+    
+    def __iter__(self) -> Iterator[Tuple[PacketHeader, memoryview]]:
+        for i in range(len(self.index)):
+            yield self.packet(i)
+    
+    def duration_s(self) -> float:
+        if len(self.index) < 2:
+            return 0.0
+        arrivals = self.index['arrival_us']
+        return float(arrivals[-1] - arrivals[0]) / 1e6
+    
+    def close(self):
+        self.data.release()
+        self.index = None
+        self._headers = None
+        try:
+            self._map.close()
+        except BufferError:
+            # Views handed out by packet() are still alive; the map goes with them
+            pass
+        self._file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
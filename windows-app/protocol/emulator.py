@@ -0,0 +1,190 @@
+"""
+Device emulator: replays a packet capture over TCP in place of the phone.
+
+    python -m protocol.emulator session.awscap [--port 8888] [--fast] [--speed 2.0] [--loop]
+
+Point the app's WiFi connection at this machine. Packets are sent exactly as
+captured, either at their original arrival timing or as fast as the socket
+takes them, which gives repeatable throughput and latency runs without a
+phone.
+"""
+import time
+import socket
+import logging
+import argparse
+import numpy as np
+from typing import Optional
+from threading import Thread
+from .capture import CaptureReader
+
+logger = logging.getLogger(__name__)
+
+class DeviceEmulator:
+    """TCP server that replays a capture to each client that connects.
+    
+    Runs of packets that are due together are sent with one sendall straight
+    from the memory-mapped capture, so pacing costs one syscall per burst
+    rather than one per packet. Fast mode sends the stream in chunk_size
+    slices. Clients are served one at a time, like the phone; control
+    commands they send are not answered.
+    """
+    def __init__(self, capture_path: str, host: str = '0.0.0.0', port: int = 8888,
+                 realtime: bool = True, speed: float = 1.0, loop: bool = False,
+                 chunk_size: int = 1024 * 1024):
+        self.capture = CaptureReader(capture_path)
+        if not len(self.capture):
+            self.capture.close()
+            raise ValueError(f"Capture {capture_path} has no packets to replay")
+        self.host = host
+        self.port = port
+        self.realtime = realtime
+        self.speed = speed
+        self.loop = loop
+        self.chunk_size = chunk_size
+        
+        self._server: Optional[socket.socket] = None
+        self._client: Optional[socket.socket] = None
+        self._thread: Optional[Thread] = None
+        self._running = False
+        
+        self.clients_served = 0
+        self.packets_sent = 0
+        self.bytes_sent = 0
+        self.sends = 0
+        self.max_lateness_ms = 0.0
+        self.last_replay_s = 0.0
+        # perf_counter() when the last replay began; packet i was due at this + its arrival offset
+        self.replay_started = 0.0
+    
+    def start(self):
+        """Listen and serve in the background; returns the bound port (port=0 picks a free one)"""
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen(1)
+        self.port = self._server.getsockname()[1]
+        self._running = True
+        self._thread = Thread(target=self._serve_loop, name='device-emulator', daemon=True)
+        self._thread.start()
+        logger.info(f"Device emulator listening on {self.host}:{self.port} "
+                    f"({len(self.capture)} packets, {self.capture.duration_s():.1f} s, "
+                    f"{'realtime x' + str(self.speed) if self.realtime else 'as fast as possible'})")
+        return self.port
+    
+    def stop(self):
+        self._running = False
+        for sock in (self._client, self._server):
+            if sock:
+                try:
+                    sock.close()
+                except:
+                    pass
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.capture.close()
+    
+    def _serve_loop(self):
+        while self._running:
+            try:
+                client, address = self._server.accept()
+            except OSError:
+                break
+            logger.info(f"Emulator client connected from {address[0]}:{address[1]}")
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._client = client
+            try:
+                while True:
+                    self.replay(client)
+                    if not self.loop or not self._running:
+                        break
+            except OSError as e:
+                logger.info(f"Emulator client disconnected: {e}")
+            finally:
+                try:
+                    client.close()
+                except:
+                    pass
+                self._client = None
+                self.clients_served += 1
+    
+    def replay(self, sock: socket.socket):
+        """Send the whole capture once over a connected socket"""
+        data = self.capture.data
+        index = self.capture.index
+        started = self.replay_started = time.perf_counter()
+        if not self.realtime:
+            for start in range(0, len(data), self.chunk_size):
+                sock.sendall(data[start:start + self.chunk_size])
+                self.sends += 1
+            self.packets_sent += len(index)
+            self.bytes_sent += len(data)
+        else:
+            self._replay_paced(sock, data, index, started)
+        self.last_replay_s = time.perf_counter() - started
+    
+    def _replay_paced(self, sock: socket.socket, data: memoryview, index: np.ndarray, started: float):
+        offsets = index['offset']
+        # Seconds after the start at which each packet is due. Packets go out in capture order,
+        # so a packet is never due before the one ahead of it (rebuilt indexes use device
+        # timestamps, which interleave out of order across audio and video)
+        due = np.maximum.accumulate((index['arrival_us'] - index['arrival_us'][0]) / (1e6 * self.speed))
+        count = len(index)
+        i = 0
+        while i < count and self._running:
+            delay = due[i] - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            elapsed = time.perf_counter() - started
+            self.max_lateness_ms = max(self.max_lateness_ms, (elapsed - due[i]) * 1000)
+            
+            # Everything already due goes out in one burst
+            end = int(np.searchsorted(due, elapsed, side='right'))
+            end = max(end, i + 1)
+            stop = int(offsets[end]) if end < count else len(data)
+            sock.sendall(data[int(offsets[i]):stop])
+            self.sends += 1
+            self.packets_sent += end - i
+            self.bytes_sent += stop - int(offsets[i])
+            i = end
+    
+    def get_stats(self) -> dict:
+        return {
+            'clients_served': self.clients_served,
+            'packets_sent': self.packets_sent,
+            'bytes_sent': self.bytes_sent,
+            'sends': self.sends,
+            'max_lateness_ms': self.max_lateness_ms,
+            'last_replay_s': self.last_replay_s,
+            'replay_started': self.replay_started,
+            'throughput_mbps': self.bytes_sent * 8 / self.last_replay_s / 1e6 if self.last_replay_s else 0.0
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a packet capture as an emulated Android device")
+    parser.add_argument('capture', help="capture file written by StreamReceiver.start_capture")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--fast', action='store_true', help="send as fast as possible instead of original timing")
+    parser.add_argument('--speed', type=float, default=1.0, help="timing multiplier for realtime replay")
+    parser.add_argument('--loop', action='store_true', help="repeat the capture until the client disconnects")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    emulator = DeviceEmulator(args.capture, args.host, args.port, realtime=not args.fast,
+                              speed=args.speed, loop=args.loop)
+    emulator.start()
+    try:
+        while True:
+            time.sleep(5.0)
+            stats = emulator.get_stats()
+            if stats['packets_sent']:
+                logger.info(f"Sent {stats['packets_sent']} packets, {stats['bytes_sent'] / 1e6:.1f} MB, "
+                            f"max lateness {stats['max_lateness_ms']:.1f} ms")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        emulator.stop()
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
 import struct
 import json
+import numpy as np
 from enum import IntEnum
 from dataclasses import dataclass
-from typing import Optional
 
 MAGIC_NUMBER = 0x4157534D
 
@@ -18,7 +18,23 @@ class PacketType(IntEnum):
     KEEPALIVE = 0x30
     ERROR = 0xFF
 
-@dataclass
+PACKET_TYPES = {t.value: t for t in PacketType}
+
+HEADER_STRUCT = struct.Struct('>IBIQI')
+# payload_size alone, at PAYLOAD_SIZE_OFFSET in a header
+PAYLOAD_SIZE_STRUCT = struct.Struct('>I')
+PAYLOAD_SIZE_OFFSET = 5
+
+# Packed big-endian layout of a header; used for bulk parsing of captures
+HEADER_DTYPE = np.dtype([
+    ('magic', '>u4'),
+    ('packet_type', 'u1'),
+    ('payload_size', '>u4'),
+    ('timestamp', '>u8'),
+    ('sequence_number', '>u4')
+])
+
+@dataclass(slots=True)
 class PacketHeader:
     magic: int
     packet_type: PacketType
@@ -29,8 +45,17 @@ class PacketHeader:
     HEADER_SIZE = 21
     
     def to_bytes(self) -> bytes:
-        return struct.pack(
-            '>IBIQI',
+        return HEADER_STRUCT.pack(
+            self.magic,
+            self.packet_type,
+            self.payload_size,
+            self.timestamp,
+            self.sequence_number
+        )
+    
+    def pack_into(self, buffer, offset: int = 0):
+        HEADER_STRUCT.pack_into(
+            buffer, offset,
             self.magic,
             self.packet_type,
             self.payload_size,
@@ -38,16 +63,19 @@ class PacketHeader:
             self.sequence_number
         )
     
+    @staticmethod
+    def from_buffer(buffer, offset: int = 0) -> 'PacketHeader':
+        """Parse a header in place from any bytes-like object without slicing"""
+        magic, packet_type, payload_size, timestamp, seq_num = HEADER_STRUCT.unpack_from(buffer, offset)
+        try:
+            packet_type = PACKET_TYPES[packet_type]
+        except KeyError:
+            raise ValueError(f"{packet_type} is not a valid PacketType") from None
+        return PacketHeader(magic, packet_type, payload_size, timestamp, seq_num)
+    
     @staticmethod
     def from_bytes(data: bytes) -> 'PacketHeader':
-        magic, packet_type, payload_size, timestamp, seq_num = struct.unpack('>IBIQI', data)
-        return PacketHeader(
-            magic=magic,
-            packet_type=PacketType(packet_type),
-            payload_size=payload_size,
-            timestamp=timestamp,
-            sequence_number=seq_num
-        )
+        return PacketHeader.from_buffer(data)
 
 class Packet:
     def __init__(self, packet_type: PacketType, payload: bytes, timestamp: int = 0, seq_num: int = 0):
@@ -64,13 +92,52 @@ class Packet:
         return self.header.to_bytes() + self.payload
     
     @staticmethod
-    def from_bytes(data: bytes) -> 'Packet':
-        header = PacketHeader.from_bytes(data[:PacketHeader.HEADER_SIZE])
-        payload = data[PacketHeader.HEADER_SIZE:PacketHeader.HEADER_SIZE + header.payload_size]
-        packet = Packet(header.packet_type, payload)
+    def from_bytes(data: bytes, offset: int = 0) -> 'Packet':
+        """Parse a packet at offset; the payload is a memoryview into data, not a copy"""
+        header = PacketHeader.from_buffer(data, offset)
+        start = offset + PacketHeader.HEADER_SIZE
+        packet = Packet.__new__(Packet)
         packet.header = header
+        packet.payload = memoryview(data)[start:start + header.payload_size]
         return packet
 
+def parse_headers(buffer) -> np.ndarray:
+    """Parse every header of a contiguous packet stream into a structured array.
+    
+    Intended for offline captures. Besides the header fields, each record
+    holds the offset of its header in the buffer. Parsing stops at the first
+    truncated packet; a header with a bad magic number or packet type raises
+    ValueError, since the payload size that chains to the next one cannot be
+    trusted either.
+    """
+    data = np.frombuffer(buffer, dtype=np.uint8)
+    header_size = PacketHeader.HEADER_SIZE
+    unpack_header = HEADER_STRUCT.unpack_from
+    
+    # Payload sizes chain the offsets, so only this walk is sequential
+    offsets = []
+    offset = 0
+    end = len(data)
+    while offset + header_size <= end:
+        magic, packet_type, payload_size, _, _ = unpack_header(buffer, offset)
+        if magic != MAGIC_NUMBER or packet_type not in PACKET_TYPES:
+            raise ValueError(f"Invalid packet header at offset {offset}: "
+                             f"magic={magic:#x}, type={packet_type}")
+        if offset + header_size + payload_size > end:
+            break
+        offsets.append(offset)
+        offset += header_size + payload_size
+    
+    offsets = np.asarray(offsets, dtype=np.int64)
+    raw = data[offsets[:, None] + np.arange(header_size)]
+    headers = np.ascontiguousarray(raw).view(HEADER_DTYPE).reshape(-1)
+    
+    result = np.empty(len(offsets), dtype=HEADER_DTYPE.descr + [('offset', '<i8')])
+    for name in HEADER_DTYPE.names:
+        result[name] = headers[name]
+    result['offset'] = offsets
+    return result
+
 class ControlCommand:
     @staticmethod
     def create_command(command: str, parameters: dict) -> str:
@@ -1,5 +1,5 @@
 from .receiver import StreamReceiver
-from .decoder import VideoDecoder, AudioDecoder
+from .decoder import VideoDecoder, AudioDecoder, DecodeMode
 
-__all__ = ['StreamReceiver', 'VideoDecoder', 'AudioDecoder']
+__all__ = ['StreamReceiver', 'VideoDecoder', 'AudioDecoder', 'DecodeMode']
 
@@ -0,0 +1,201 @@
+import logging
+import numpy as np
+import pyaudio
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class AudioRingBuffer:
+    """Preallocated single-producer/single-consumer ring of interleaved samples.
+    
+    The producer only advances the write position and the consumer only the
+    read position, so neither side takes a lock or waits on the other.
+    Positions count frames (one sample per channel) and never wrap.
+    """
+    def __init__(self, capacity_frames: int, channels: int, dtype=np.int16):
+        self.capacity = capacity_frames
+        self.channels = channels
+        self.buffer = np.zeros((capacity_frames, channels), dtype=dtype)
+        
+        self._write_pos = 0
+        self._read_pos = 0
+        
+        self.frames_written = 0
+        self.frames_read = 0
+        self.overruns = 0
+        self.overrun_frames = 0
+    
+    def available(self) -> int:
+        """Frames buffered and ready to read"""
+        return self._write_pos - self._read_pos
+    
+    def free_space(self) -> int:
+        return self.capacity - self.available()
+    
+    def write(self, samples: np.ndarray) -> int:
+        """Copy interleaved samples in; frames that do not fit are dropped and counted as an overrun"""
+        samples = samples.reshape(-1, self.channels)
+        count = len(samples)
+        free = self.free_space()
+        if count > free:
+            self.overruns += 1
+            self.overrun_frames += count - free
+            count = free
+            samples = samples[:count]
+        
+        if count:
+            start = self._write_pos % self.capacity
+            first = min(count, self.capacity - start)
+            self.buffer[start:start + first] = samples[:first]
+            if count > first:
+                self.buffer[:count - first] = samples[first:]
+            # Publish only after the copy is complete
+            self._write_pos += count
+            self.frames_written += count
+        return count
+    
+    def read_into(self, out: np.ndarray) -> int:
+        """Fill out (frames x channels) from the ring; missing frames are zeroed. Returns frames read."""
+        wanted = len(out)
+        count = min(wanted, self.available())
+        
+        if count:
+            start = self._read_pos % self.capacity
+            first = min(count, self.capacity - start)
+            out[:first] = self.buffer[start:start + first]
+            if count > first:
+                out[first:count] = self.buffer[:count - first]
+            self._read_pos += count
+            self.frames_read += count
+        
+        if count < wanted:
+            out[count:] = 0
+        return count
+    
+    def clear(self):
+        """Drop everything buffered (consumer side)"""
+        self._read_pos = self._write_pos
+
+class CallbackAudioOutput:
+    """PyAudio output stream in callback mode, fed from an AudioRingBuffer.
+    
+    write() never blocks: it copies into the ring and returns. The sound card
+    pulls from the ring in its own callback thread. Playback (re)starts only
+    once target_latency_ms of audio is buffered, so an underrun rebuffers to
+    the target instead of stuttering on every callback.
+    """
+    def __init__(self, pa: pyaudio.PyAudio, sample_rate: int = 48000, channels: int = 2,
+                 target_latency_ms: float = 60.0, max_latency_ms: Optional[float] = None,
+                 frames_per_buffer: int = 256, device_index: Optional[int] = None):
+        self.pa = pa
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.target_latency_ms = target_latency_ms
+        self.max_latency_ms = max_latency_ms or max(4 * target_latency_ms, 200.0)
+        self.frames_per_buffer = frames_per_buffer
+        self.device_index = device_index
+        
+        self.stream: Optional[pyaudio.Stream] = None
+        self.output_latency_ms = 0.0
+        self.ring = None
+        self._out = None
+        self._playing = False
+        
+        self.callbacks = 0
+        self.underruns = 0
+        self.underrun_frames = 0
+        
+        self._allocate()
+    
+    @property
+    def target_frames(self) -> int:
+        return int(self.sample_rate * self.target_latency_ms / 1000)
+    
+    def _allocate(self):
+        capacity = max(int(self.sample_rate * self.max_latency_ms / 1000), 2 * self.frames_per_buffer)
+        self.ring = AudioRingBuffer(capacity, self.channels)
+        self._out = np.zeros((self.frames_per_buffer, self.channels), dtype=np.int16)
+        self._playing = False
+    
+    def open(self) -> bool:
+        try:
+            self.stream = self.pa.open(
+                format=pyaudio.paInt16,
+                channels=self.channels,
+                rate=self.sample_rate,
+                output=True,
+                output_device_index=self.device_index,
+                frames_per_buffer=self.frames_per_buffer,
+                stream_callback=self._callback
+            )
+            self.stream.start_stream()
+            # Latency of the device buffers behind the ring, as reported by PortAudio
+            self.output_latency_ms = self.stream.get_output_latency() * 1000
+            return True
+        except Exception as e:
+            logger.error(f"Failed to open callback audio stream: {e}")
+            self.stream = None
+            return False
+    
+    def reconfigure(self, sample_rate: int, channels: int) -> bool:
+        """Reopen the stream and ring for a new format"""
+        self.close()
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._allocate()
+        return self.open()
+    
+    def close(self):
+        if self.stream:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except:
+                pass
+            self.stream = None
+    
+    def set_target_latency(self, target_latency_ms: float):
+        """Change the buffered latency playback starts from; the ring capacity is kept"""
+        self.target_latency_ms = min(target_latency_ms, self.max_latency_ms / 2)
+    
+    def write(self, samples: np.ndarray) -> int:
+        """Queue interleaved int16 samples for playback without blocking"""
+        return self.ring.write(samples)
+    
+    def _callback(self, in_data, frame_count, time_info, status):
+        self.callbacks += 1
+        if len(self._out) < frame_count:
+            self._out = np.zeros((frame_count, self.channels), dtype=np.int16)
+        out = self._out[:frame_count]
+        
+        if not self._playing:
+            if self.ring.available() >= max(self.target_frames, frame_count):
+                self._playing = True
+            else:
+                out[:] = 0
+                return out.tobytes(), pyaudio.paContinue
+        
+        read = self.ring.read_into(out)
+        if read < frame_count:
+            self.underruns += 1
+            self.underrun_frames += frame_count - read
+            self._playing = False
+        return out.tobytes(), pyaudio.paContinue
+    
+    def buffered_ms(self) -> float:
+        return self.ring.available() * 1000 / self.sample_rate
+    
+    def get_stats(self) -> dict:
+        return {
+            'buffered_ms': self.buffered_ms(),
+            'target_latency_ms': self.target_latency_ms,
+            'max_latency_ms': self.max_latency_ms,
+            'playing': self._playing,
+            'callbacks': self.callbacks,
+            'underruns': self.underruns,
+            'underrun_frames': self.underrun_frames,
+            'overruns': self.ring.overruns,
+            'overrun_frames': self.ring.overrun_frames,
+            'frames_written': self.ring.frames_written,
+            'frames_read': self.ring.frames_read
+        }
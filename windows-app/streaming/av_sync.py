@@ -0,0 +1,263 @@
+import time
+import logging
+import numpy as np
+from collections import deque
+from typing import Optional
+from threading import Lock
+
+logger = logging.getLogger(__name__)
+
+def host_now_us() -> float:
+    """Host monotonic clock in microseconds (QueryPerformanceCounter on Windows)"""
+    return time.monotonic() * 1e6
+
+class ClockMapper:
+    """Maps device timestamps (Android presentationTimeUs) onto the host monotonic clock.
+    
+    Arrivals are grouped into buckets of bucket_ms of device time and only the
+    fastest arrival per bucket is kept, which is the lower envelope where
+    network queueing is smallest. A least-squares line through those minima
+    gives host = ref_host + slope * (device - ref_device). slope - 1 is the
+    drift between the two crystals, typically tens of ppm.
+    """
+    def __init__(self, bucket_ms: float = 500.0, buckets: int = 240, min_fit_buckets: int = 4):
+        self.bucket_us = bucket_ms * 1000
+        self.restart_us = 10_000_000
+        self.min_fit_buckets = min_fit_buckets
+        self._minima = deque(maxlen=buckets)
+        self._bucket = None
+        self.reset()
+    
+    def reset(self):
+        self._minima.clear()
+        self._bucket = None
+        self.ref_device = None
+        self.ref_host = None
+        self.slope = 1.0
+        self.samples = 0
+    
+    @property
+    def ready(self) -> bool:
+        return self.ref_device is not None
+    
+    @property
+    def drift_ppm(self) -> float:
+        return (self.slope - 1.0) * 1e6
+    
+    def add_sample(self, device_us: int, host_us: float):
+        self.samples += 1
+        index = int(device_us // self.bucket_us)
+        if self._bucket is not None and device_us < self._bucket[1] - self.restart_us:
+            # Device clock restarted (new encoder session)
+            self.reset()
+            self.samples = 1
+        
+        if self._bucket is None or index > self._bucket[0]:
+            if self._bucket is not None:
+                self._minima.append((self._bucket[1], self._bucket[2]))
+                self._fit()
+            self._bucket = [index, device_us, host_us]
+        elif index == self._bucket[0] and host_us - device_us < self._bucket[2] - self._bucket[1]:
+            # Audio and video interleave slightly out of timestamp order; older buckets stay closed
+            self._bucket[1] = device_us
+            self._bucket[2] = host_us
+        
+        if self.ref_device is None:
+            self.ref_device = device_us
+            self.ref_host = host_us
+    
+    def _fit(self):
+        if len(self._minima) < self.min_fit_buckets:
+            device, host = min(self._minima, key=lambda point: point[1] - point[0])
+            self.ref_device, self.ref_host, self.slope = device, host, 1.0
+            return
+        
+        points = np.array(self._minima, dtype=np.float64)
+        ref_device = points[-1, 0]
+        x = points[:, 0] - ref_device
+        y = points[:, 1] - points[-1, 1]
+        slope, intercept = np.polyfit(x, y, 1)
+        # The fit should not wander further than any real oscillator pair
+        self.slope = float(min(max(slope, 1 - 2e-3), 1 + 2e-3))
+        self.ref_device = ref_device
+        self.ref_host = points[-1, 1] + intercept
+    
+    def to_host(self, device_us: float) -> Optional[float]:
+        if self.ref_device is None:
+            return None
+        return self.ref_host + self.slope * (device_us - self.ref_device)
+    
+    def to_device(self, host_us: float) -> Optional[float]:
+        if self.ref_device is None:
+            return None
+        return self.ref_device + (host_us - self.ref_host) / self.slope
+
+class DriftCorrector:
+    """Holds an output buffer at its target level with sub-audible resampling.
+    
+    The buffer level error, smoothed, is turned into a rate correction of at
+    most max_ppm (1000 ppm = 1 sample per 1024-sample AAC frame). Frames are
+    only resampled when the accumulated correction reaches a whole sample, so
+    most frames pass through untouched.
+    """
+    def __init__(self, max_ppm: float = 1000.0, time_constant_s: float = 20.0, smoothing: float = 0.02):
+        self.max_ppm = max_ppm
+        self.time_constant_s = time_constant_s
+        self.smoothing = smoothing
+        self.reset()
+    
+    def reset(self):
+        self._error_s = None
+        self._fraction = 0.0
+        self.ppm = 0.0
+        self.samples_added = 0
+        self.samples_removed = 0
+    
+    def update(self, buffered_frames: int, target_frames: int, sample_rate: int):
+        error_s = (buffered_frames - target_frames) / sample_rate
+        if self._error_s is None:
+            self._error_s = error_s
+        else:
+            self._error_s += self.smoothing * (error_s - self._error_s)
+        ppm = self._error_s / self.time_constant_s * 1e6
+        self.ppm = min(max(ppm, -self.max_ppm), self.max_ppm)
+    
+    def process(self, pcm: np.ndarray) -> np.ndarray:
+        """pcm: (frames, channels) int16; positive ppm drops samples, negative adds them"""
+        count = len(pcm)
+        self._fraction -= count * self.ppm / 1e6
+        delta = int(self._fraction)
+        if delta == 0:
+            return pcm
+        self._fraction -= delta
+        
+        target = count + delta
+        positions = np.linspace(0, count - 1, target)
+        source = np.arange(count)
+        out = np.empty((target, pcm.shape[1]), dtype=pcm.dtype)
+        for channel in range(pcm.shape[1]):
+            out[:, channel] = np.interp(positions, source, pcm[:, channel])
+        if delta > 0:
+            self.samples_added += delta
+        else:
+            self.samples_removed -= delta
+        return out
+
+class AVSyncEngine:
+    """Audio-master A/V synchronization on the header timestamps.
+    
+    - ClockMapper turns device timestamps into host time from packet arrivals.
+    - The audio clock is the device timestamp currently leaving the speaker
+      (or virtual mic): the end of the last frame written minus everything
+      still buffered in front of it, advanced with host time in between.
+    - Video is presented when its timestamp comes due on that clock; without
+      audio the mapped arrival clock is used instead.
+    - DriftCorrector keeps the audio output buffer at its target so the audio
+      clock cannot slowly run ahead of or behind the device timeline.
+    """
+    def __init__(self, max_drift_ppm: float = 1000.0, audio_clock_timeout_ms: float = 500.0,
+                 anchor_smoothing: float = 0.05):
+        self.clock = ClockMapper()
+        self.drift = DriftCorrector(max_drift_ppm)
+        self.audio_clock_timeout_us = audio_clock_timeout_ms * 1000
+        self.anchor_smoothing = anchor_smoothing
+        self._lock = Lock()
+        self._audio_anchor = None
+        self._arrival_delay_us = 0.0
+        self.audio_clock_resets = 0
+        self.last_video_offset_us = None
+    
+    def reset(self):
+        with self._lock:
+            self.clock.reset()
+            self.drift.reset()
+            self._audio_anchor = None
+            self.last_video_offset_us = None
+    
+    def on_packet_arrival(self, device_us: int, host_us: Optional[float] = None):
+        """Called by the receiver for every AUDIO_FRAME and VIDEO_FRAME"""
+        with self._lock:
+            self.clock.add_sample(device_us, host_us if host_us is not None else host_now_us())
+    
+    def on_audio_output(self, device_end_us: float, buffered_us: float, host_us: Optional[float] = None):
+        """Called after audio up to device_end_us was written, with buffered_us still ahead of the listener"""
+        if host_us is None:
+            host_us = host_now_us()
+        measured = device_end_us - buffered_us
+        
+        with self._lock:
+            predicted = self._audio_clock(host_us)
+            if predicted is None or abs(measured - predicted) > 50000:
+                if predicted is not None:
+                    self.audio_clock_resets += 1
+                self._audio_anchor = (measured, host_us)
+            else:
+                self._audio_anchor = (predicted + self.anchor_smoothing * (measured - predicted), host_us)
+            
+            # How far behind arrival audio is played: used to place video without an audio clock
+            arrival_host = self.clock.to_host(measured)
+            if arrival_host is not None:
+                self._arrival_delay_us = host_us - arrival_host
+    
+    def _audio_clock(self, host_us: float) -> Optional[float]:
+        if self._audio_anchor is None:
+            return None
+        device_us, anchor_host = self._audio_anchor
+        elapsed = host_us - anchor_host
+        if elapsed > self.audio_clock_timeout_us:
+            return None
+        return device_us + elapsed / self.clock.slope
+    
+    def audio_clock_us(self, host_us: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            return self._audio_clock(host_us if host_us is not None else host_now_us())
+    
+    def master_clock_us(self, host_us: Optional[float] = None) -> Optional[float]:
+        """Device timestamp that should be presented now: audio clock, else the arrival mapping"""
+        if host_us is None:
+            host_us = host_now_us()
+        with self._lock:
+            clock = self._audio_clock(host_us)
+            if clock is None:
+                clock = self.clock.to_device(host_us - self._arrival_delay_us)
+            return clock
+    
+    def presentation_host_us(self, device_us: float, host_us: Optional[float] = None) -> float:
+        """Host time at which a frame with this device timestamp is presented"""
+        if host_us is None:
+            host_us = host_now_us()
+        clock = self.master_clock_us(host_us)
+        if clock is None:
+            return host_us
+        return host_us + (device_us - clock) * self.clock.slope
+    
+    def to_host_100ns(self, device_us: float) -> int:
+        """Presentation time in 100 ns units on the host monotonic clock, for the virtual camera"""
+        return int(self.presentation_host_us(device_us) * 10)
+    
+    def record_video_presented(self, device_us: float, host_us: Optional[float] = None):
+        clock = self.master_clock_us(host_us)
+        if clock is not None:
+            self.last_video_offset_us = device_us - clock
+    
+    def correct_audio(self, pcm: np.ndarray, buffered_frames: int, target_frames: int,
+                      sample_rate: int) -> np.ndarray:
+        """Apply the drift correction to one decoded frame of interleaved (frames, channels) PCM"""
+        self.drift.update(buffered_frames, target_frames, sample_rate)
+        return self.drift.process(pcm)
+    
+    def get_stats(self) -> dict:
+        with self._lock:
+            audio_clock = self._audio_clock(host_now_us())
+        return {
+            'clock_ready': self.clock.ready,
+            'clock_samples': self.clock.samples,
+            'drift_ppm': self.clock.drift_ppm,
+            'resample_ppm': self.drift.ppm,
+            'samples_added': self.drift.samples_added,
+            'samples_removed': self.drift.samples_removed,
+            'audio_clock_active': audio_clock is not None,
+            'audio_clock_resets': self.audio_clock_resets,
+            'arrival_delay_ms': self._arrival_delay_us / 1000,
+            'video_offset_ms': self.last_video_offset_us / 1000 if self.last_video_offset_us is not None else None
+        }
@@ -0,0 +1,108 @@
+import logging
+import numpy as np
+from threading import Lock
+from collections import OrderedDict
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+class PooledBuffer:
+    """A pooled ndarray with a reference count; returned to its pool when the count reaches zero"""
+    __slots__ = ('array', '_pool', '_key', '_refs')
+    
+    def __init__(self, array: np.ndarray, pool: 'FrameBufferPool', key: tuple):
+        self.array = array
+        self._pool = pool
+        self._key = key
+        self._refs = 1
+    
+    def retain(self) -> 'PooledBuffer':
+        with self._pool._lock:
+            if self._refs <= 0:
+                raise RuntimeError("Retaining a buffer that was already released")
+            self._refs += 1
+        return self
+    
+    def release(self):
+        with self._pool._lock:
+            if self._refs <= 0:
+                raise RuntimeError("Buffer released more times than leased")
+            self._refs -= 1
+            if self._refs == 0:
+                self._pool._recycle(self)
+
+class FrameBufferPool:
+    """Recycles fixed-shape frame arrays so steady-state streaming does no large allocations.
+    
+    lease() hands out a buffer with one reference; every retain() must be
+    matched by a release(). Up to max_free_per_shape idle buffers are kept
+    per (shape, dtype), and at most max_free_bytes in total: beyond that the
+    idle buffers of the least recently recycled shapes are freed, so sizes
+    that are no longer used (a resized preview) do not pile up.
+    """
+    def __init__(self, max_free_per_shape: int = 8, max_free_bytes: int = 128 * 1024 * 1024):
+        self.max_free_per_shape = max_free_per_shape
+        self.max_free_bytes = max_free_bytes
+        # Ordered by last recycle, oldest first
+        self._free = OrderedDict()
+        self._free_bytes = 0
+        self._lock = Lock()
+        
+        self.allocations = 0
+        self.reuses = 0
+        self.leased = 0
+        self.evictions = 0
+    
+    def lease(self, shape: Tuple[int, ...], dtype=np.uint8) -> PooledBuffer:
+        key = (tuple(shape), np.dtype(dtype).str)
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                buffer = free.pop()
+                self._free_bytes -= buffer.array.nbytes
+                buffer._refs = 1
+                self.reuses += 1
+                self.leased += 1
+                return buffer
+            self.allocations += 1
+            self.leased += 1
+        return PooledBuffer(np.empty(shape, dtype=dtype), self, key)
+    
+    def _recycle(self, buffer: PooledBuffer):
+        # Called with the lock held
+        self.leased -= 1
+        free = self._free.get(buffer._key)
+        if free is None:
+            free = self._free[buffer._key] = []
+        else:
+            self._free.move_to_end(buffer._key)
+        if len(free) >= self.max_free_per_shape:
+            return
+        free.append(buffer)
+        self._free_bytes += buffer.array.nbytes
+        
+        while self._free_bytes > self.max_free_bytes:
+            key, oldest = next(iter(self._free.items()))
+            if oldest:
+                self._free_bytes -= oldest.pop(0).array.nbytes
+                self.evictions += 1
+            if not oldest:
+                del self._free[key]
+    
+    def clear(self):
+        with self._lock:
+            self._free.clear()
+            self._free_bytes = 0
+    
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'allocations': self.allocations,
+                'reuses': self.reuses,
+                'leased': self.leased,
+                'free': sum(len(free) for free in self._free.values()),
+                'free_bytes': self._free_bytes,
+                'evictions': self.evictions
+            }
+
+default_pool = FrameBufferPool()
@@ -14,6 +14,9 @@ class ConnectionManager:
         self.on_connected: Optional[Callable] = None
         self.on_disconnected: Optional[Callable] = None
         
+        self.recv_calls = 0
+        self.bytes_received = 0
+        
     def connect_wifi(self, host: str, port: int = 8888) -> bool:
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -111,20 +114,30 @@ class ConnectionManager:
             self.disconnect()
             return False
     
-    def receive_data(self, size: int) -> Optional[bytes]:
+    def receive_into(self, view: memoryview) -> Optional[int]:
+        """Single recv_into call; returns the number of bytes read or None when the connection is gone"""
+        # PacketFramer reads through here straight into its own buffer, so nothing is copied
         if not self.is_connected or not self.socket:
             return None
         
         try:
-            data = b''
-            while len(data) < size:
-                chunk = self.socket.recv(size - len(data))
-                if not chunk:
-                    raise ConnectionError("Connection closed")
-                data += chunk
-            return data
+            n = self.socket.recv_into(view)
+            self.recv_calls += 1
+            if n == 0:
+                raise ConnectionError("Connection closed")
+            self.bytes_received += n
+            return n
         except Exception as e:
             logger.error(f"Failed to receive data: {e}")
             self.disconnect()
             return None
-
+    
+    def get_stats(self) -> dict:
+        return {
+            'recv_calls': self.recv_calls,
+            'bytes_received': self.bytes_received
+        }
+    
+    def reset_stats(self):
+        self.recv_calls = 0
+        self.bytes_received = 0
@@ -1,38 +1,137 @@
 import av
 import numpy as np
 import logging
-from typing import Optional, Callable
+from typing import Optional, Callable, List, Tuple, Iterator
+import os
 import pyaudio
+from . import h264
+from .frames import DecodedFrame, FrameConverter
+from .tracing import TRACE_DECODE_START, TRACE_DECODE_END
+from .audio_output import CallbackAudioOutput
+from .jitter_buffer import AAC_FRAME_SAMPLES
 
 logger = logging.getLogger(__name__)
 
+class DecodeMode:
+    AUTO = 'auto'
+    SINGLE = 'single'
+    SLICE = 'slice'
+    FRAME = 'frame'
+
 class VideoDecoder:
-    def __init__(self):
+    # Above this size AUTO switches from slice threading to frame threading
+    FRAME_THREADING_MIN_PIXELS = 1920 * 1080
+    
+    def __init__(self, mode: str = DecodeMode.AUTO, thread_count: int = 0):
+        """
+        mode: single (one thread), slice (low latency, only helps multi-slice streams),
+              frame (high throughput, adds thread_count - 1 frames of delay) or auto.
+        thread_count: worker threads for slice/frame modes, 0 = number of CPUs.
+        """
+        self.mode = mode
+        self.thread_count = thread_count
+        self.active_mode = DecodeMode.SINGLE
+        self.active_threads = 1
+        self.resolution = None
         self.codec = av.CodecContext.create('h264', 'r')
+        # Legacy callback: receives a BGR ndarray valid during the call (shares the conversion with bgr24 sinks)
         self.on_frame_decoded: Optional[Callable[[np.ndarray], None]] = None
+        self.sinks: List[Tuple[Callable, Optional[str]]] = []
+        self.converter = FrameConverter()
         self.frame_count = 0
+        self.packets_decoded = 0
+        self.max_delay_frames = 0
         self.codec_opened = False
-        logger.info("Video decoder initialized")
+        logger.info(f"Video decoder initialized, mode={mode}")
+    
+    @property
+    def tracer(self):
+        """Optional FrameTracer for decode start/end and conversion (shared with the converter)"""
+        return self.converter.tracer
+    
+    @tracer.setter
+    def tracer(self, tracer):
+        self.converter.tracer = tracer
+    
+    def _select_mode(self, config_data: bytes):
+        """Pick threading mode and thread count, using the SPS resolution for AUTO"""
+        try:
+            self.resolution = h264.parse_sps_resolution(config_data)
+        except Exception as e:
+            logger.warning(f"Could not read resolution from SPS: {e}")
+            self.resolution = None
+        
+        mode = self.mode
+        if mode == DecodeMode.AUTO:
+            pixels = self.resolution[0] * self.resolution[1] if self.resolution else 0
+            mode = DecodeMode.FRAME if pixels > self.FRAME_THREADING_MIN_PIXELS else DecodeMode.SLICE
+        
+        threads = self.thread_count or os.cpu_count() or 1
+        if mode == DecodeMode.SINGLE:
+            threads = 1
+        elif mode == DecodeMode.FRAME:
+            threads = min(threads, 8)
+        
+        self.active_mode = mode
+        self.active_threads = threads
+    
+    def _create_codec(self):
+        codec = av.CodecContext.create('h264', 'r')
+        if self.active_mode == DecodeMode.FRAME:
+            codec.thread_type = 'FRAME'
+        elif self.active_mode == DecodeMode.SLICE:
+            codec.thread_type = 'SLICE'
+        codec.thread_count = self.active_threads
+        return codec
+    
+    def add_sink(self, callback: Callable, pixel_format: Optional[str] = None):
+        """Register a frame consumer and the pixel format it needs.
+        
+        With pixel_format=None the callback gets the DecodedFrame itself and
+        can convert later (on its own thread, after retain()); otherwise it
+        gets a read-only ndarray in that format, valid during the call. Frames stay in the decoder's native YUV and
+        each format is converted once per frame no matter how many sinks want it.
+        """
+        self.sinks.append((callback, pixel_format))
+        logger.info(f"Video sink registered: format={pixel_format or 'native'}")
+    
+    def remove_sink(self, callback: Callable):
+        self.sinks = [(cb, fmt) for cb, fmt in self.sinks if cb != callback]
+    
+    @property
+    def expected_delay_frames(self) -> int:
+        """Frames of delay added by the threading mode (frame threading holds one frame per extra thread)"""
+        if self.active_mode == DecodeMode.FRAME:
+            return self.active_threads - 1
+        return 0
     
     def set_config(self, config_data: bytes):
         """Set codec configuration data (SPS/PPS) from Android encoder"""
         try:
-            # If codec is already open, close and recreate it
+            # If codec is already open, close it; threading can only be set before opening
             if self.codec_opened:
                 logger.info("Video codec already opened, recreating...")
+                self._drain()
                 try:
                     self.codec.close()
                 except:
                     pass
-                self.codec = av.CodecContext.create('h264', 'r')
                 self.codec_opened = False
             
+            self._select_mode(config_data)
+            self.codec = self._create_codec()
+            self.packets_decoded = 0
+            self.frame_count = 0
+            self.max_delay_frames = 0
+            
             # Set extradata (SPS/PPS) and open the codec
             self.codec.extradata = config_data
             self.codec.open()
             self.codec_opened = True
             
             logger.info(f"Video codec configured with SPS/PPS: {len(config_data)} bytes")
+            logger.info(f"Decode mode: {self.active_mode}, threads={self.active_threads}, "
+                        f"resolution={self.resolution}, added delay={self.expected_delay_frames} frames")
             logger.info(f"Codec parameters: {self.codec.width}x{self.codec.height}, format={self.codec.pix_fmt}")
         except Exception as e:
             logger.error(f"Failed to set video codec config: {e}", exc_info=True)
@@ -42,30 +141,77 @@ class VideoDecoder:
             logger.warning("Video codec not yet configured, skipping frame")
             return
         
+        tracer = self.converter.tracer
+        if tracer:
+            tracer.mark(TRACE_DECODE_START, timestamp)
         try:
             logger.debug(f"Decoding frame: size={len(data)}, keyframe={is_keyframe}")
             packet = av.Packet(data)
+            packet.pts = timestamp
             frames = self.codec.decode(packet)
+            self.packets_decoded += 1
             
             for frame in frames:
-                img = frame.to_ndarray(format='bgr24')
                 self.frame_count += 1
+                # With frame threading the output belongs to an earlier packet: use its pts
+                frame_timestamp = frame.pts if frame.pts is not None else timestamp
+                if tracer:
+                    tracer.mark(TRACE_DECODE_END, frame_timestamp)
+                decoded = DecodedFrame(frame, frame_timestamp, self.converter)
                 logger.debug(f"Frame decoded successfully: {frame.width}x{frame.height}, total frames={self.frame_count}")
-                if self.on_frame_decoded:
-                    self.on_frame_decoded(img)
-                else:
+                if not self.sinks and not self.on_frame_decoded:
                     logger.warning("on_frame_decoded callback is not set")
+                    decoded.release()
+                    continue
+                
+                # Sinks that keep the frame past the callback retain() it; pooled buffers recycle on the last release
+                try:
+                    for callback, pixel_format in self.sinks:
+                        callback(decoded if pixel_format is None else decoded.to_ndarray(pixel_format))
+                    if self.on_frame_decoded:
+                        self.on_frame_decoded(decoded.to_ndarray('bgr24'))
+                finally:
+                    decoded.release()
+            
+            delay = self.packets_decoded - self.frame_count
+            if delay > self.max_delay_frames:
+                self.max_delay_frames = delay
         except Exception as e:
             logger.error(f"Error decoding video frame: {e}", exc_info=True)
     
+    def get_stats(self) -> dict:
+        return {
+            'mode': self.active_mode,
+            'threads': self.active_threads,
+            'resolution': self.resolution,
+            'expected_delay_frames': self.expected_delay_frames,
+            'measured_delay_frames': self.packets_decoded - self.frame_count,
+            'max_delay_frames': self.max_delay_frames,
+            'packets_decoded': self.packets_decoded,
+            'frames_decoded': self.frame_count,
+            'conversions': dict(self.converter.conversions)
+        }
+    
+    def _drain(self):
+        """Discard frames still held by frame-threading workers"""
+        if self.codec_opened and self.active_mode == DecodeMode.FRAME:
+            try:
+                self.codec.decode(None)
+            except:
+                pass
+    
     def close(self):
+        self._drain()
         try:
             self.codec.close()
         except:
             pass
 
+# چیدمان کانال خروجی resampler؛ برای تعداد دیگر چیدمان دیکودر حفظ می‌شود
+_CHANNEL_LAYOUTS = {1: 'mono', 2: 'stereo'}
+
 class AudioDecoder:
-    def __init__(self, virtual_microphone=None):
+    def __init__(self, virtual_microphone=None, target_latency_ms: float = 60.0):
         self.codec = av.CodecContext.create('aac', 'r')
         
         # Audio parameters
@@ -73,13 +219,26 @@ class AudioDecoder:
         self.channels = 2
         self.codec_opened = False
         
+        # تبدیل خروجی دیکودر (fltp برای AAC) به s16 interleaved؛ یک بار در هر set_config ساخته می‌شود
+        self.resampler: Optional[av.AudioResampler] = None
+        self._create_resampler()
+        
         # Virtual Microphone
         self.virtual_microphone = virtual_microphone
         self.use_virtual_mic = False
         
-        # Fallback: PyAudio stream
+        # Fallback: PyAudio stream در حالت callback که از ring buffer تغذیه می‌شود
         self.audio = None
-        self.stream: Optional[pyaudio.Stream] = None
+        self.output: Optional[CallbackAudioOutput] = None
+        self.target_latency_ms = target_latency_ms
+        
+        # همگام‌سازی صدا و تصویر (اختیاری): ساعت صدا و اصلاح drift با resampling جزئی
+        self.av_sync = None
+        
+        # آخرین فریم PCM برای پنهان‌سازی فریم‌های گم‌شده
+        self._last_pcm: Optional[np.ndarray] = None
+        self._conceal_gain = 1.0
+        self.concealed_frames = 0
         
         if self.virtual_microphone:
             try:
@@ -99,14 +258,14 @@ class AudioDecoder:
         """راه‌اندازی PyAudio به عنوان fallback"""
         try:
             self.audio = pyaudio.PyAudio()
-            self.stream = self.audio.open(
-                format=pyaudio.paInt16,
-                channels=self.channels,
-                rate=self.sample_rate,
-                output=True,
-                frames_per_buffer=1024
+            output = CallbackAudioOutput(
+                self.audio, self.sample_rate, self.channels,
+                target_latency_ms=self.target_latency_ms
             )
-            logger.info(f"Audio decoder با PyAudio: {self.sample_rate}Hz, {self.channels} channels")
+            if output.open():
+                self.output = output
+                logger.info(f"Audio decoder با PyAudio: {self.sample_rate}Hz, {self.channels} channels, "
+                            f"target latency {self.target_latency_ms:.0f}ms")
         except Exception as e:
             logger.error(f"Failed to initialize audio output: {e}")
     
@@ -142,65 +301,111 @@ class AudioDecoder:
             # Update our parameters
             self.sample_rate = sample_rate
             self.channels = channels
+            self._create_resampler()
             
             # Recreate the audio stream if using PyAudio
-            if not self.use_virtual_mic and self.audio:
-                if self.stream:
-                    self.stream.stop_stream()
-                    self.stream.close()
-                
-                self.stream = self.audio.open(
-                    format=pyaudio.paInt16,
-                    channels=self.channels,
-                    rate=self.sample_rate,
-                    output=True,
-                    frames_per_buffer=1024
-                )
+            if self.use_virtual_mic:
+                self.virtual_microphone.configure(self.sample_rate, self.channels)
+            elif self.output:
+                self.output.reconfigure(self.sample_rate, self.channels)
             
             logger.info(f"Audio codec configured: {self.sample_rate}Hz, {self.channels} channels")
         except Exception as e:
             logger.error(f"Failed to set audio codec config: {e}", exc_info=True)
     
+    def _create_resampler(self):
+        """resampler ماندگار: context آن بین فریم‌ها حفظ می‌شود و فقط با config جدید دوباره ساخته می‌شود"""
+        self.resampler = av.AudioResampler(
+            format='s16',
+            layout=_CHANNEL_LAYOUTS.get(self.channels),
+            rate=self.sample_rate
+        )
+    
+    def convert(self, frame) -> Iterator[np.ndarray]:
+        """
+        تبدیل یک AudioFrame دیکود شده به PCM با شکل (samples, channels) از نوع int16
+        
+        خروجی s16 بسته‌بندی شده resampler بدون کپی اضافه به numpy نگاشت می‌شود و
+        ring buffer خروجی آن را یک بار کپی می‌کند.
+        """
+        try:
+            converted_frames = self.resampler.resample(frame)
+        except ValueError:
+            # فرمت ورودی با فریم اولی که resampler با آن ساخته شد فرق دارد
+            logger.info(f"Audio frame format changed to {frame.format.name}/{frame.layout.name}, "
+                        f"recreating resampler")
+            self._create_resampler()
+            converted_frames = self.resampler.resample(frame)
+        
+        for converted in converted_frames:
+            pcm = np.frombuffer(converted.planes[0], dtype=np.int16,
+                                count=converted.samples * self.channels)
+            yield pcm.reshape(-1, self.channels)
+    
     def decode(self, data: bytes, timestamp: int):
         if not self.codec_opened:
             logger.warning("Audio codec not yet configured, skipping frame")
             return
         
         # بررسی اینکه آیا output در دسترس است
-        if not self.use_virtual_mic and not self.stream:
+        if not self.use_virtual_mic and not self.output:
             return
         
         try:
             packet = av.Packet(data)
             frames = self.codec.decode(packet)
             
+            position_us = timestamp
             for frame in frames:
-                # Convert audio to numpy array
-                audio_array = frame.to_ndarray()
-                
-                # Ensure the shape is correct (channels, samples) -> (samples * channels,)
-                if len(audio_array.shape) > 1:
-                    audio_array = audio_array.reshape(-1)
-                
-                # Convert to int16 if not already
-                if audio_array.dtype != np.int16:
-                    if audio_array.dtype in [np.float32, np.float64]:
-                        audio_array = (audio_array * 32767).astype(np.int16)
-                    else:
-                        audio_array = audio_array.astype(np.int16)
-                
-                # ارسال به virtual microphone یا PyAudio
-                if self.use_virtual_mic:
-                    self.virtual_microphone.send_audio(audio_array)
-                    logger.debug(f"Sent audio to VirtuCore Mic: {len(audio_array)} samples")
-                elif self.stream:
-                    audio_bytes = audio_array.tobytes()
-                    self.stream.write(audio_bytes)
-                    logger.debug(f"Played audio frame: {len(audio_bytes)} bytes")
-                    
+                for audio_array in self.convert(frame):
+                    self._last_pcm = audio_array
+                    self._conceal_gain = 1.0
+                    self._write_pcm(audio_array, position_us)
+                    position_us += len(audio_array) * 1e6 / self.sample_rate
+            
         except Exception as e:
             logger.error(f"Error decoding audio frame: {e}", exc_info=True)
     
+    def _audio_output(self) -> Optional[CallbackAudioOutput]:
+        """خروجی callback در حال استفاده (میکروفون مجازی یا PyAudio)"""
+        if self.use_virtual_mic:
+            return self.virtual_microphone.output
+        return self.output
+    
+    def _write_pcm(self, audio_array: np.ndarray, timestamp: float):
+        output = self._audio_output()
+        duration_us = len(audio_array) * 1e6 / self.sample_rate
+        if self.av_sync and output:
+            # اصلاح drift: سطح ring buffer روی تاخیر هدف نگه داشته می‌شود
+            audio_array = self.av_sync.correct_audio(
+                audio_array, output.ring.available(), output.target_frames, self.sample_rate
+            )
+        
+        # ارسال به virtual microphone یا PyAudio
+        if self.use_virtual_mic:
+            self.virtual_microphone.send_audio(audio_array)
+            logger.debug(f"Sent audio to VirtuCore Mic: {len(audio_array)} samples")
+        elif self.output:
+            # فقط کپی در ring buffer؛ کارت صدا در callback خودش می‌خواند
+            self.output.write(audio_array)
+        
+        if self.av_sync and output:
+            self.av_sync.on_audio_output(timestamp + duration_us,
+                                         (output.buffered_ms() + output.output_latency_ms) * 1000)
+    
+    def conceal(self, timestamp: int):
+        """پنهان‌سازی فریم گم‌شده: تکرار آخرین فریم با کاهش دامنه (سکوت اگر فریمی نیست)"""
+        if not self.use_virtual_mic and not self.output:
+            return
+        
+        if self._last_pcm is None:
+            samples = np.zeros((AAC_FRAME_SAMPLES, self.channels), dtype=np.int16)
+        else:
+            self._conceal_gain *= 0.5
+            samples = (self._last_pcm * self._conceal_gain).astype(np.int16)
+        self.concealed_frames += 1
+        self._write_pcm(samples, timestamp)
+    
     def close(self):
         if self.virtual_microphone:
             try:
@@ -208,12 +413,8 @@ class AudioDecoder:
             except:
                 pass
         
-        if self.stream:
-            try:
-                self.stream.stop_stream()
-                self.stream.close()
-            except:
-                pass
+        if self.output:
+            self.output.close()
         
         if self.audio:
             try:
@@ -225,4 +426,12 @@ class AudioDecoder:
             self.codec.close()
         except:
             pass
+    
+    def get_stats(self) -> dict:
+        """آمار خروجی صدا: underrun, overrun و تاخیر بافر"""
+        if self.use_virtual_mic:
+            return self.virtual_microphone.get_stats()
+        if self.output:
+            return self.output.get_stats()
+        return {}
 
@@ -0,0 +1,91 @@
+import logging
+from .h264 import access_unit_info
+
+logger = logging.getLogger(__name__)
+
+class FrameDropPolicy:
+    """GOP-aware video frame dropping when decoding falls behind.
+    
+    Backlog is the distance between the newest video timestamp the receiver
+    has seen and the timestamp of the frame about to be decoded (both device
+    timestamps in microseconds). Above max_latency_ms, non-reference frames
+    are dropped; once a reference frame has to go, everything is dropped up
+    to the next IDR frame where decoding resumes cleanly.
+    """
+    def __init__(self, max_latency_ms: float = 200.0, enabled: bool = True):
+        self.max_latency_us = int(max_latency_ms * 1000)
+        self.enabled = enabled
+        self.reset()
+    
+    def reset(self):
+        self.latest_timestamp = None
+        self.last_timestamp = None
+        self.dropping = False
+        
+        self.frames_dropped = 0
+        self.drop_episodes = 0
+        self.latency_recovered_us = 0
+        self.max_backlog_us = 0
+    
+    def on_arrival(self, timestamp: int):
+        """Called on the receive thread for every incoming video frame"""
+        if self.latest_timestamp is None or timestamp > self.latest_timestamp:
+            self.latest_timestamp = timestamp
+    
+    def on_frame_lost(self):
+        """A frame was lost before decoding (e.g. queue overflow): wait for the next IDR"""
+        if not self.dropping:
+            self.dropping = True
+            self.drop_episodes += 1
+    
+    def should_decode(self, data, timestamp: int) -> bool:
+        """Called on the decode thread right before a frame is decoded"""
+        frame_duration = timestamp - self.last_timestamp if self.last_timestamp is not None else 0
+        self.last_timestamp = timestamp
+        
+        if not self.enabled:
+            return True
+        
+        backlog = self.latest_timestamp - timestamp if self.latest_timestamp is not None else 0
+        if backlog > self.max_backlog_us:
+            self.max_backlog_us = backlog
+        
+        if not self.dropping and backlog <= self.max_latency_us:
+            return True
+        
+        is_idr, is_reference = access_unit_info(data)
+        if self.dropping:
+            if is_idr:
+                self.dropping = False
+                logger.info(f"Resuming video decode at IDR frame, backlog={backlog / 1000:.0f}ms")
+                return True
+            self._drop(frame_duration)
+            return False
+        
+        if not is_reference:
+            self._drop(frame_duration)
+            return False
+        
+        if not is_idr:
+            logger.info(f"Video backlog {backlog / 1000:.0f}ms, dropping frames until next IDR")
+            self.dropping = True
+            self.drop_episodes += 1
+            self._drop(frame_duration)
+            return False
+        
+        return True
+    
+    def _drop(self, frame_duration: int):
+        self.frames_dropped += 1
+        if frame_duration > 0:
+            self.latency_recovered_us += frame_duration
+    
+    def get_stats(self) -> dict:
+        return {
+            'enabled': self.enabled,
+            'dropping': self.dropping,
+            'frames_dropped': self.frames_dropped,
+            'drop_episodes': self.drop_episodes,
+            'latency_recovered_ms': self.latency_recovered_us / 1000,
+            'max_backlog_ms': self.max_backlog_us / 1000
+        }
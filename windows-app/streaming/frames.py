@@ -0,0 +1,183 @@
+import logging
+import cv2
+import numpy as np
+from threading import Lock
+from typing import Optional, Dict, Tuple
+from av.video.reformatter import VideoReformatter
+from .buffer_pool import FrameBufferPool, PooledBuffer, default_pool
+from .tracing import TRACE_CONVERT
+
+logger = logging.getLogger(__name__)
+
+# Native formats converted with OpenCV straight into pooled buffers
+_CV2_CONVERSIONS = {
+    ('yuv420p', 'rgb24'): cv2.COLOR_YUV2RGB_I420,
+    ('yuv420p', 'bgr24'): cv2.COLOR_YUV2BGR_I420,
+    ('nv12', 'rgb24'): cv2.COLOR_YUV2RGB_NV12,
+    ('nv12', 'bgr24'): cv2.COLOR_YUV2BGR_NV12
+}
+
+class FrameConverter:
+    """Pixel format conversions shared by every frame of a decoder.
+    
+    yuv420p/nv12 to rgb24/bgr24 goes through OpenCV into buffers leased
+    from the pool, so nothing large is allocated per frame once the pool is
+    warm. Other conversions keep one swscale reformatter per target so its
+    context is reused from frame to frame.
+    """
+    def __init__(self, pool: FrameBufferPool = None):
+        self.pool = pool or default_pool
+        self._reformatters: Dict[Tuple[str, int, int], VideoReformatter] = {}
+        self._locks: Dict[Tuple[str, int, int], Lock] = {}
+        self._lock = Lock()
+        self.conversions: Dict[str, int] = {}
+        # Optional FrameTracer, stamped when a frame is first converted
+        self.tracer = None
+    
+    def convert(self, frame, pixel_format: str, width: int, height: int) -> PooledBuffer:
+        with self._lock:
+            self.conversions[pixel_format] = self.conversions.get(pixel_format, 0) + 1
+        
+        code = _CV2_CONVERSIONS.get((frame.format.name, pixel_format))
+        if code is not None and frame.width % 2 == 0 and frame.height % 2 == 0:
+            return self._convert_cv2(frame, code, width, height)
+        return self._convert_sws(frame, pixel_format, width, height)
+    
+    def _convert_cv2(self, frame, code: int, width: int, height: int) -> PooledBuffer:
+        w, h = frame.width, frame.height
+        
+        # Downscaling (the preview) shrinks the YUV planes first, so the color
+        # conversion runs at the output size instead of the full decode size
+        shrink = width <= w and height <= h and width % 2 == 0 and height % 2 == 0
+        packed_w, packed_h = (width, height) if shrink else (w, h)
+        
+        # Pack the padded decoder planes into one contiguous I420/NV12 buffer
+        packed = self.pool.lease((packed_h * 3 // 2, packed_w))
+        try:
+            flat = packed.array.reshape(-1)
+            offset = 0
+            nv12 = frame.format.name == 'nv12'
+            for index, plane in enumerate(frame.planes):
+                luma = index == 0
+                row_bytes = w if luma or nv12 else w // 2
+                rows = plane.height
+                source = np.frombuffer(plane, dtype=np.uint8).reshape(rows, plane.line_size)[:, :row_bytes]
+                out_rows = packed_h if luma else packed_h // 2
+                out_bytes = packed_w if luma or nv12 else packed_w // 2
+                target = flat[offset:offset + out_rows * out_bytes].reshape(out_rows, out_bytes)
+                if (out_rows, out_bytes) == (rows, row_bytes):
+                    target[:] = source
+                elif nv12 and not luma:
+                    # Interleaved UV: resize as a two-channel image
+                    cv2.resize(source.reshape(rows, row_bytes // 2, 2), (out_bytes // 2, out_rows),
+                               dst=target.reshape(out_rows, out_bytes // 2, 2), interpolation=cv2.INTER_AREA)
+                else:
+                    cv2.resize(source, (out_bytes, out_rows), dst=target, interpolation=cv2.INTER_AREA)
+                offset += out_rows * out_bytes
+            
+            converted = self.pool.lease((packed_h, packed_w, 3))
+            cv2.cvtColor(packed.array, code, dst=converted.array)
+        finally:
+            packed.release()
+        
+        if (width, height) == (packed_w, packed_h):
+            return converted
+        
+        try:
+            resized = self.pool.lease((height, width, 3))
+            cv2.resize(converted.array, (width, height), dst=resized.array, interpolation=cv2.INTER_AREA)
+            return resized
+        finally:
+            converted.release()
+    
+    def _convert_sws(self, frame, pixel_format: str, width: int, height: int) -> PooledBuffer:
+        key = (pixel_format, width, height)
+        with self._lock:
+            reformatter = self._reformatters.get(key)
+            if reformatter is None:
+                reformatter = self._reformatters[key] = VideoReformatter()
+                self._locks[key] = Lock()
+            lock = self._locks[key]
+        
+        with lock:
+            converted = reformatter.reformat(frame, width=width, height=height, format=pixel_format)
+        array = converted.to_ndarray()
+        buffer = self.pool.lease(array.shape, array.dtype)
+        buffer.array[...] = array
+        return buffer
+
+class DecodedFrame:
+    """A decoded picture kept in the decoder's native YUV format.
+    
+    Consumers ask for the pixel format (and optionally size) they need via
+    to_ndarray(); each distinct request is converted at most once and the
+    result is shared, so returned arrays are read-only.
+    
+    Converted arrays live in pooled buffers. The decoder holds one
+    reference while its sinks run; a consumer that keeps the frame (or an
+    array from it) beyond the callback must retain() it and release() it
+    when done.
+    """
+    __slots__ = ('frame', 'timestamp', 'width', 'height', 'native_format',
+                 '_converter', '_cache', '_lock', '_refs')
+    
+    def __init__(self, frame, timestamp: int, converter: FrameConverter):
+        self.frame = frame
+        self.timestamp = timestamp
+        self.width = frame.width
+        self.height = frame.height
+        self.native_format = frame.format.name
+        self._converter = converter
+        # (format, width, height) -> (pooled buffer, read-only view)
+        self._cache: Dict[Tuple[str, int, int], Tuple[PooledBuffer, np.ndarray]] = {}
+        self._lock = Lock()
+        self._refs = 1
+    
+    def retain(self) -> 'DecodedFrame':
+        with self._lock:
+            if self._refs <= 0:
+                raise RuntimeError("Retaining a frame that was already released")
+            self._refs += 1
+        return self
+    
+    def release(self):
+        with self._lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            buffers = [buffer for buffer, _ in self._cache.values()]
+            self._cache.clear()
+            self.frame = None
+        for buffer in buffers:
+            buffer.release()
+    
+    def to_ndarray(self, pixel_format: str = 'bgr24', width: Optional[int] = None,
+                   height: Optional[int] = None) -> np.ndarray:
+        key = (pixel_format, width or self.width, height or self.height)
+        entry = self._cache.get(key)
+        if entry is not None:
+            return entry[1]
+        
+        with self._lock:
+            if self._refs <= 0:
+                raise RuntimeError("Frame used after release")
+            entry = self._cache.get(key)
+            if entry is None:
+                buffer = self._converter.convert(self.frame, *key)
+                array = buffer.array.view()
+                array.flags.writeable = False
+                entry = self._cache[key] = (buffer, array)
+                tracer = self._converter.tracer
+                if tracer:
+                    tracer.mark(TRACE_CONVERT, self.timestamp)
+        return entry[1]
+    
+    def planes(self) -> Tuple[np.ndarray, ...]:
+        """Zero-copy views of the native planes, cropped to the visible size"""
+        views = []
+        for index, plane in enumerate(self.frame.planes):
+            # NV12 interleaves U and V in its second plane: two bytes per chroma sample
+            row_bytes = plane.width * (2 if self.native_format == 'nv12' and index == 1 else 1)
+            data = np.frombuffer(plane, dtype=np.uint8).reshape(plane.height, plane.line_size)
+            views.append(data[:, :row_bytes])
+        return tuple(views)
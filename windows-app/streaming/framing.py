@@ -0,0 +1,131 @@
+import struct
+import logging
+from typing import Optional, List, Tuple
+from protocol import PacketHeader, MAGIC_NUMBER, HEADER_STRUCT, PACKET_TYPES
+
+logger = logging.getLogger(__name__)
+
+_MAGIC_BYTES = struct.pack('>I', MAGIC_NUMBER)
+
+class PacketFramer:
+    """Reads large chunks from the connection and splits them into packets.
+    
+    Data is received with recv_into into a single reusable buffer. Every read
+    yields all complete packets it contains; a partial packet at the tail is
+    moved to the front of the buffer before the next read. Payloads are
+    memoryviews into the buffer and stay valid only until the next read.
+    """
+    DEFAULT_BUFFER_SIZE = 1024 * 1024
+    MIN_READ_SIZE = 64 * 1024
+    MAX_PAYLOAD_SIZE = 64 * 1024 * 1024
+    
+    def __init__(self, connection_manager, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        self.connection_manager = connection_manager
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        
+        self.reads = 0
+        self.packets = 0
+        self.resyncs = 0
+        self.bytes_discarded = 0
+        self.bytes_compacted = 0
+    
+    def reset(self):
+        """Drop buffered data, e.g. after reconnecting"""
+        self._start = 0
+        self._end = 0
+    
+    def read_packets(self) -> Optional[List[Tuple[PacketHeader, memoryview]]]:
+        """Block for one read and return every complete packet in the buffer.
+        
+        Returns an empty list when the read only completed part of a packet
+        and None when the connection is closed.
+        """
+        self._prepare_space(self._bytes_needed())
+        n = self.connection_manager.receive_into(self._view[self._end:])
+        if n is None:
+            return None
+        
+        self._end += n
+        self.reads += 1
+        return self._parse()
+    
+    def _bytes_needed(self) -> int:
+        available = self._end - self._start
+        if available < PacketHeader.HEADER_SIZE:
+            return PacketHeader.HEADER_SIZE
+        payload_size = HEADER_STRUCT.unpack_from(self._buffer, self._start)[2]
+        return PacketHeader.HEADER_SIZE + min(payload_size, self.MAX_PAYLOAD_SIZE)
+    
+    def _prepare_space(self, needed: int):
+        available = self._end - self._start
+        if available == 0:
+            self._start = self._end = 0
+        
+        if needed > len(self._buffer):
+            # Packet larger than the buffer: grow and keep the partial data
+            new_buffer = bytearray(max(needed, len(self._buffer) * 2))
+            new_buffer[:available] = self._view[self._start:self._end]
+            self.bytes_compacted += available
+            self._buffer = new_buffer
+            self._view = memoryview(new_buffer)
+            self._start, self._end = 0, available
+            return
+        
+        free = len(self._buffer) - self._end
+        if free < max(needed - available, self.MIN_READ_SIZE) and self._start > 0:
+            self._view[:available] = self._view[self._start:self._end]
+            self.bytes_compacted += available
+            self._start, self._end = 0, available
+    
+    def _parse(self) -> List[Tuple[PacketHeader, memoryview]]:
+        packets = []
+        buffer = self._buffer
+        view = self._view
+        start = self._start
+        end = self._end
+        header_size = PacketHeader.HEADER_SIZE
+        
+        while end - start >= header_size:
+            magic, packet_type, payload_size, timestamp, seq_num = HEADER_STRUCT.unpack_from(buffer, start)
+            packet_type = PACKET_TYPES.get(packet_type)
+            if magic != MAGIC_NUMBER or packet_type is None or payload_size > self.MAX_PAYLOAD_SIZE:
+                start = self._resync(start, end)
+                continue
+            
+            packet_end = start + header_size + payload_size
+            if packet_end > end:
+                break
+            
+            header = PacketHeader(magic, packet_type, payload_size, timestamp, seq_num)
+            packets.append((header, view[start + header_size:packet_end]))
+            start = packet_end
+        
+        self._start = start
+        self.packets += len(packets)
+        return packets
+    
+    def _resync(self, start: int, end: int) -> int:
+        """Skip forward to the next magic number after a corrupt header"""
+        found = self._buffer.find(_MAGIC_BYTES, start + 1, end)
+        if found < 0:
+            # Keep a possible partial magic number at the tail
+            found = max(start + 1, end - len(_MAGIC_BYTES) + 1)
+        
+        self.resyncs += 1
+        self.bytes_discarded += found - start
+        logger.warning(f"Invalid packet header, resyncing: skipped {found - start} bytes")
+        return found
+    
+    def get_stats(self) -> dict:
+        return {
+            'reads': self.reads,
+            'packets': self.packets,
+            'packets_per_read': self.packets / self.reads if self.reads else 0.0,
+            'resyncs': self.resyncs,
+            'bytes_discarded': self.bytes_discarded,
+            'bytes_compacted': self.bytes_compacted,
+            'buffer_size': len(self._buffer)
+        }
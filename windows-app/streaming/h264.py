@@ -0,0 +1,218 @@
+from typing import Iterator, Tuple, List, NamedTuple
+
+NAL_SLICE = 1
+NAL_IDR = 5
+NAL_SEI = 6
+NAL_SPS = 7
+NAL_PPS = 8
+NAL_AUD = 9
+
+NAL_TYPE_NAMES = {
+    NAL_SLICE: 'non-IDR',
+    NAL_IDR: 'IDR',
+    NAL_SEI: 'SEI',
+    NAL_SPS: 'SPS',
+    NAL_PPS: 'PPS',
+    NAL_AUD: 'AUD'
+}
+
+START_CODE = b'\x00\x00\x01'
+
+# The first slice header almost always sits in this prefix (after SPS/PPS/SEI/AUD)
+CLASSIFY_PREFIX_SIZE = 4096
+
+class NalUnit(NamedTuple):
+    offset: int
+    size: int
+    nal_type: int
+    ref_idc: int
+
+class AccessUnitInfo(NamedTuple):
+    is_idr: bool
+    is_reference: bool
+    has_sps: bool
+    has_pps: bool
+    has_sei: bool
+    has_aud: bool
+
+def _as_searchable(data):
+    # memoryview has no find(); bytes/bytearray are scanned in place
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    return data
+
+def iter_nal_headers(data) -> Iterator[Tuple[int, int]]:
+    """Yield (offset, header byte) for every NAL unit of an Annex-B payload.
+    
+    Start codes are located with bytes.find, so 3- and 4-byte start codes
+    are both handled without a per-byte loop.
+    """
+    data = _as_searchable(data)
+    find = data.find
+    end = len(data)
+    pos = find(START_CODE)
+    while 0 <= pos and pos + 3 < end:
+        offset = pos + 3
+        yield offset, data[offset]
+        pos = find(START_CODE, offset)
+
+def index_nal_units(data) -> List[NalUnit]:
+    """Index every NAL unit: offset of its header byte, size without start code, type and nal_ref_idc"""
+    data = _as_searchable(data)
+    find = data.find
+    end = len(data)
+    units = []
+    
+    pos = find(START_CODE)
+    while 0 <= pos and pos + 3 < end:
+        offset = pos + 3
+        pos = find(START_CODE, offset)
+        unit_end = pos if pos >= 0 else end
+        # Zero bytes before the next start code (4-byte start code, trailing_zero_8bits) are not part of the unit
+        while unit_end > offset and data[unit_end - 1] == 0:
+            unit_end -= 1
+        header = data[offset]
+        units.append(NalUnit(offset, unit_end - offset, header & 0x1F, (header >> 5) & 0x03))
+    return units
+
+def split_nal_units(data) -> List[memoryview]:
+    """NAL units (without start codes) as zero-copy views into data"""
+    # Offsets index the caller's buffer; the scan may use a copy of a memoryview, the views do not
+    view = memoryview(data)
+    return [view[unit.offset:unit.offset + unit.size] for unit in index_nal_units(data)]
+
+def classify_access_unit(data) -> AccessUnitInfo:
+    """Classify an access unit by the NAL units up to and including its first slice.
+    
+    All slices of a picture share the same type class and nal_ref_idc, so
+    scanning stops at the first slice; for memoryviews only a small prefix
+    is copied unless the first slice lies beyond it.
+    """
+    if isinstance(data, memoryview) and len(data) > CLASSIFY_PREFIX_SIZE:
+        info = _classify(data[:CLASSIFY_PREFIX_SIZE].tobytes())
+        if info is not None:
+            return info
+    
+    info = _classify(_as_searchable(data))
+    if info is None:
+        return AccessUnitInfo(False, False, False, False, False, False)
+    return info
+
+def _classify(data):
+    has_sps = has_pps = has_sei = has_aud = False
+    for _, header in iter_nal_headers(data):
+        nal_type = header & 0x1F
+        if nal_type == NAL_IDR:
+            return AccessUnitInfo(True, True, has_sps, has_pps, has_sei, has_aud)
+        if NAL_SLICE <= nal_type < NAL_IDR:
+            return AccessUnitInfo(False, bool(header & 0x60), has_sps, has_pps, has_sei, has_aud)
+        if nal_type == NAL_SPS:
+            has_sps = True
+        elif nal_type == NAL_PPS:
+            has_pps = True
+        elif nal_type == NAL_SEI:
+            has_sei = True
+        elif nal_type == NAL_AUD:
+            has_aud = True
+    return None
+
+def access_unit_info(data) -> Tuple[bool, bool]:
+    """Return (is_idr, is_reference) for an access unit.
+    
+    is_reference is False only when the slices have nal_ref_idc == 0,
+    which means no other frame predicts from it and it can be dropped safely.
+    """
+    info = classify_access_unit(data)
+    return info.is_idr, info.is_reference
+
+def is_keyframe(data) -> bool:
+    return classify_access_unit(data).is_idr
+
+def _remove_emulation_prevention(data: bytes) -> bytes:
+    return data.replace(b'\x00\x00\x03', b'\x00\x00')
+
+class _BitReader:
+    def __init__(self, data: bytes):
+        self.value = int.from_bytes(data, 'big')
+        self.remaining = len(data) * 8
+    
+    def bits(self, count: int) -> int:
+        if count > self.remaining:
+            raise ValueError("SPS truncated")
+        self.remaining -= count
+        return (self.value >> self.remaining) & ((1 << count) - 1)
+    
+    def ue(self) -> int:
+        zeros = 0
+        while self.bits(1) == 0:
+            zeros += 1
+        return (1 << zeros) - 1 + self.bits(zeros)
+    
+    def se(self) -> int:
+        value = self.ue()
+        return (value + 1) // 2 if value & 1 else -(value // 2)
+
+def _skip_scaling_list(reader: _BitReader, size: int):
+    last = next_scale = 8
+    for _ in range(size):
+        if next_scale != 0:
+            next_scale = (last + reader.se()) % 256
+        last = next_scale if next_scale != 0 else last
+
+def parse_sps_resolution(data) -> Tuple[int, int]:
+    """Return the cropped (width, height) from the first SPS in an Annex-B buffer"""
+    data = _as_searchable(data)
+    for unit in index_nal_units(data):
+        if unit.nal_type == NAL_SPS:
+            sps = _remove_emulation_prevention(bytes(data[unit.offset + 1:unit.offset + unit.size]))
+            break
+    else:
+        raise ValueError("No SPS found")
+    
+    reader = _BitReader(sps)
+    profile_idc = reader.bits(8)
+    reader.bits(16)  # constraint flags, level_idc
+    reader.ue()  # seq_parameter_set_id
+    
+    chroma_format_idc = 1
+    if profile_idc in (100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135):
+        chroma_format_idc = reader.ue()
+        if chroma_format_idc == 3:
+            reader.bits(1)  # separate_colour_plane_flag
+        reader.ue()  # bit_depth_luma_minus8
+        reader.ue()  # bit_depth_chroma_minus8
+        reader.bits(1)  # qpprime_y_zero_transform_bypass_flag
+        if reader.bits(1):  # seq_scaling_matrix_present_flag
+            for i in range(8 if chroma_format_idc != 3 else 12):
+                if reader.bits(1):
+                    _skip_scaling_list(reader, 16 if i < 6 else 64)
+    
+    reader.ue()  # log2_max_frame_num_minus4
+    pic_order_cnt_type = reader.ue()
+    if pic_order_cnt_type == 0:
+        reader.ue()
+    elif pic_order_cnt_type == 1:
+        reader.bits(1)
+        reader.se()
+        reader.se()
+        for _ in range(reader.ue()):
+            reader.se()
+    
+    reader.ue()  # max_num_ref_frames
+    reader.bits(1)  # gaps_in_frame_num_value_allowed_flag
+    width_mbs = reader.ue() + 1
+    height_map_units = reader.ue() + 1
+    frame_mbs_only = reader.bits(1)
+    if not frame_mbs_only:
+        reader.bits(1)  # mb_adaptive_frame_field_flag
+    reader.bits(1)  # direct_8x8_inference_flag
+    
+    width = width_mbs * 16
+    height = height_map_units * 16 * (2 - frame_mbs_only)
+    if reader.bits(1):  # frame_cropping_flag
+        left, right, top, bottom = reader.ue(), reader.ue(), reader.ue(), reader.ue()
+        crop_x = 2 if chroma_format_idc in (1, 2) else 1
+        crop_y = (2 if chroma_format_idc == 1 else 1) * (2 - frame_mbs_only)
+        width -= (left + right) * crop_x
+        height -= (top + bottom) * crop_y
+    return width, height
@@ -0,0 +1,238 @@
+import time
+import heapq
+import logging
+import struct
+import numpy as np
+from collections import deque
+from typing import Optional, Callable
+from threading import Thread, Condition
+
+logger = logging.getLogger(__name__)
+
+AAC_FRAME_SAMPLES = 1024
+
+class AudioJitterBuffer:
+    """Adaptive playout buffer for AUDIO_FRAME packets.
+    
+    Packets are ordered by header timestamp (the Android sender leaves the
+    sequence number at 0). Each arrival records its transit time, host arrival
+    minus device timestamp; the fastest transit in the window is the network
+    floor and the chosen percentile of the deviation above it is the jitter.
+    Playout delay follows that jitter between min_delay_ms and max_delay_ms.
+    
+    A frame is due at timestamp + floor + delay. If it has not arrived by
+    then, up to max_conceal_frames are concealed before the buffer resyncs to
+    the next queued packet. Delay changes are applied one frame at a time:
+    growing inserts a concealment frame, shrinking skips one queued frame, so
+    the sound card sees a continuous stream either way. Shrinking needs a
+    larger margin than growing so the delay does not oscillate.
+    """
+    def __init__(self, min_delay_ms: float = 20.0, max_delay_ms: float = 300.0,
+                 percentile: float = 99.0, window: int = 256, max_conceal_frames: int = 3,
+                 clock: Callable[[], float] = time.monotonic):
+        self.min_delay_us = min_delay_ms * 1000
+        self.max_delay_us = max_delay_ms * 1000
+        self.percentile = percentile
+        self.max_conceal_frames = max_conceal_frames
+        self.clock = clock
+        
+        self.on_packet: Optional[Callable[[bytes, int], None]] = None
+        self.on_config: Optional[Callable[[bytes], None]] = None
+        self.on_conceal: Optional[Callable[[int], None]] = None
+        
+        self.frame_duration_us = AAC_FRAME_SAMPLES * 1e6 / 48000
+        self._transits = deque(maxlen=window)
+        self._cond = Condition()
+        self._thread: Optional[Thread] = None
+        self._running = False
+        self._reset_state()
+    
+    def _reset_state(self):
+        self._heap = []
+        self._pending_config = None
+        self._next_ts = None
+        self._floor_us = None
+        self._delay_us = self.min_delay_us
+        self._target_us = self.min_delay_us
+        self._jitter_us = 0.0
+        self._conceal_run = 0
+        self._since_estimate = 0
+        self._transits.clear()
+        
+        self.packets_received = 0
+        self.packets_played = 0
+        self.late_packets = 0
+        self.duplicates = 0
+        self.concealments = 0
+        self.frames_skipped = 0
+        self.frames_stretched = 0
+        self.resyncs = 0
+    
+    def _now_us(self) -> float:
+        return self.clock() * 1e6
+    
+    def start(self):
+        if self._running:
+            return
+        with self._cond:
+            self._reset_state()
+        self._running = True
+        self._thread = Thread(target=self._playout_loop, name='audio-jitter', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+    
+    def push_config(self, config: bytes):
+        """AUDIO_CONFIG: applied on the playout thread before any later frame; queued audio is flushed"""
+        with self._cond:
+            if len(config) >= 8:
+                sample_rate = struct.unpack('>I', config[:4])[0]
+                if sample_rate:
+                    self.frame_duration_us = AAC_FRAME_SAMPLES * 1e6 / sample_rate
+            self._heap.clear()
+            self._next_ts = None
+            self._pending_config = config
+            self._cond.notify()
+    
+    def push(self, data: bytes, timestamp: int, arrival_us: Optional[float] = None):
+        """Queue one AUDIO_FRAME; never blocks on playout"""
+        if arrival_us is None:
+            arrival_us = self._now_us()
+        
+        with self._cond:
+            self.packets_received += 1
+            self._record_arrival(arrival_us - timestamp)
+            
+            if self._next_ts is not None and timestamp < self._next_ts - self.frame_duration_us / 2:
+                # Its slot has already been played or concealed
+                self.late_packets += 1
+                return
+            if any(queued_ts == timestamp for queued_ts, _ in self._heap):
+                self.duplicates += 1
+                return
+            
+            heapq.heappush(self._heap, (timestamp, data))
+            self._cond.notify()
+    
+    def _record_arrival(self, transit_us: float):
+        self._transits.append(transit_us)
+        if self._floor_us is None or transit_us < self._floor_us:
+            self._floor_us = transit_us
+        
+        # Re-estimating every few packets keeps the percentile off the per-packet path
+        self._since_estimate += 1
+        if self._since_estimate >= 8 or len(self._transits) < 8:
+            self._since_estimate = 0
+            transits = np.fromiter(self._transits, dtype=np.float64, count=len(self._transits))
+            self._floor_us = float(transits.min())
+            self._jitter_us = float(np.percentile(transits - self._floor_us, self.percentile))
+            self._target_us = min(max(self._jitter_us + self.frame_duration_us / 2, self.min_delay_us),
+                                  self.max_delay_us)
+    
+    def _due_us(self, timestamp: float) -> float:
+        return timestamp + self._floor_us + self._delay_us
+    
+    def pump(self, now_us: Optional[float] = None) -> Optional[float]:
+        """Run every playout action due at now_us; returns microseconds until the next one (None = idle)"""
+        if now_us is None:
+            now_us = self._now_us()
+        
+        while True:
+            with self._cond:
+                action, wait_us = self._next_action(now_us)
+            if action is None:
+                return wait_us
+            callback, args = action
+            if callback:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    logger.error(f"Audio playout callback failed: {e}", exc_info=True)
+    
+    def _next_action(self, now_us: float):
+        """Decide the next step with the lock held; the callback itself runs unlocked"""
+        if self._pending_config is not None:
+            config, self._pending_config = self._pending_config, None
+            return (self.on_config, (config,)), None
+        
+        if self._next_ts is None:
+            if not self._heap:
+                return None, None
+            self._next_ts = self._heap[0][0]
+            self._delay_us = self._target_us
+        
+        due = self._due_us(self._next_ts)
+        if now_us < due:
+            return None, due - now_us
+        
+        half_frame = self.frame_duration_us / 2
+        while self._heap and self._heap[0][0] < self._next_ts - half_frame:
+            heapq.heappop(self._heap)
+            self.late_packets += 1
+        
+        if self._heap and self._heap[0][0] <= self._next_ts + half_frame:
+            # Delay grew by a frame: play one concealment frame first, this packet keeps its slot
+            if self._target_us > self._delay_us + self.frame_duration_us / 2:
+                self._delay_us += self.frame_duration_us
+                self.frames_stretched += 1
+                return (self.on_conceal, (int(self._next_ts),)), 0.0
+            
+            timestamp, data = heapq.heappop(self._heap)
+            self._next_ts = timestamp + self.frame_duration_us
+            self._conceal_run = 0
+            self.packets_played += 1
+            
+            # Delay shrank by a frame and the next one is already here: skip it
+            if (self._target_us < self._delay_us - 1.5 * self.frame_duration_us and self._heap
+                    and self._heap[0][0] <= self._next_ts + half_frame):
+                heapq.heappop(self._heap)
+                self._next_ts += self.frame_duration_us
+                self._delay_us -= self.frame_duration_us
+                self.frames_skipped += 1
+            return (self.on_packet, (data, timestamp)), 0.0
+        
+        if self._conceal_run < self.max_conceal_frames:
+            timestamp = int(self._next_ts)
+            self._next_ts += self.frame_duration_us
+            self._conceal_run += 1
+            self.concealments += 1
+            return (self.on_conceal, (timestamp,)), 0.0
+        
+        # Gap longer than concealment covers (sender paused or a burst was lost): restart at the next packet
+        self.resyncs += 1
+        self._conceal_run = 0
+        self._next_ts = None
+        return (None, ()), 0.0
+    
+    def _playout_loop(self):
+        while self._running:
+            wait_us = self.pump()
+            with self._cond:
+                if not self._running:
+                    break
+                # A push() that landed after pump() went idle has already notified: pump again instead
+                if self._pending_config is None and not (wait_us is None and self._heap):
+                    self._cond.wait(None if wait_us is None else wait_us / 1e6)
+    
+    def get_stats(self) -> dict:
+        with self._cond:
+            return {
+                'delay_ms': self._delay_us / 1000,
+                'target_delay_ms': self._target_us / 1000,
+                'jitter_ms': self._jitter_us / 1000,
+                'queued': len(self._heap),
+                'packets_received': self.packets_received,
+                'packets_played': self.packets_played,
+                'late_packets': self.late_packets,
+                'duplicates': self.duplicates,
+                'concealments': self.concealments,
+                'frames_skipped': self.frames_skipped,
+                'frames_stretched': self.frames_stretched,
+                'resyncs': self.resyncs
+            }
@@ -0,0 +1,142 @@
+import time
+import logging
+from collections import deque
+from typing import Optional, Callable
+from threading import Thread, Condition
+
+logger = logging.getLogger(__name__)
+
+class OverflowPolicy:
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+
+class PipelineStage:
+    """Worker thread fed by a bounded queue of (callable, args) work items.
+    
+    Items submitted with droppable=False (codec configs) are never dropped by
+    the overflow policy and are always accepted.
+    """
+    def __init__(self, name: str, max_depth: int = 32, overflow: str = OverflowPolicy.BLOCK):
+        if overflow not in (OverflowPolicy.BLOCK, OverflowPolicy.DROP_OLDEST, OverflowPolicy.DROP_NEWEST):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        
+        self.name = name
+        self.max_depth = max_depth
+        self.overflow = overflow
+        self.is_running = False
+        self.worker_thread: Optional[Thread] = None
+        self.on_drop: Optional[Callable[[tuple], None]] = None
+        
+        self._queue = deque()
+        self._cond = Condition()
+        
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.peak_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_busy = 0.0
+        self.blocked_time = 0.0
+    
+    def start(self):
+        if self.is_running:
+            return
+        
+        self.is_running = True
+        self.worker_thread = Thread(target=self._run, name=f"{self.name}-worker", daemon=True)
+        self.worker_thread.start()
+        logger.info(f"Pipeline stage '{self.name}' started")
+    
+    def stop(self, timeout: float = 2.0):
+        with self._cond:
+            self.is_running = False
+            self._queue.clear()
+            self._cond.notify_all()
+        if self.worker_thread:
+            self.worker_thread.join(timeout=timeout)
+            self.worker_thread = None
+        logger.info(f"Pipeline stage '{self.name}' stopped")
+    
+    def submit(self, func: Callable, *args, droppable: bool = True) -> bool:
+        """Queue func(*args); returns False if the item was dropped"""
+        with self._cond:
+            if droppable and len(self._queue) >= self.max_depth:
+                if self.overflow == OverflowPolicy.DROP_NEWEST:
+                    self._drop((func, args, time.perf_counter(), droppable))
+                    return False
+                
+                if self.overflow == OverflowPolicy.DROP_OLDEST:
+                    self._drop_oldest()
+                else:
+                    blocked_at = time.perf_counter()
+                    while self.is_running and len(self._queue) >= self.max_depth:
+                        self._cond.wait(0.1)
+                    self.blocked_time += time.perf_counter() - blocked_at
+                    if not self.is_running:
+                        return False
+            
+            self._queue.append((func, args, time.perf_counter(), droppable))
+            self.submitted += 1
+            if len(self._queue) > self.peak_depth:
+                self.peak_depth = len(self._queue)
+            self._cond.notify_all()
+            return True
+    
+    def _drop_oldest(self):
+        for i, item in enumerate(self._queue):
+            if item[3]:
+                del self._queue[i]
+                self._drop(item)
+                return
+    
+    def _drop(self, item: tuple):
+        self.dropped += 1
+        if self.on_drop:
+            try:
+                self.on_drop(item)
+            except Exception as e:
+                logger.error(f"Error in '{self.name}' drop callback: {e}")
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while self.is_running and not self._queue:
+                    self._cond.wait()
+                if not self.is_running:
+                    break
+                func, args, queued_at, _ = self._queue.popleft()
+                self._cond.notify_all()
+            
+            started = time.perf_counter()
+            wait = started - queued_at
+            self.total_wait += wait
+            if wait > self.max_wait:
+                self.max_wait = wait
+            
+            try:
+                func(*args)
+            except Exception as e:
+                logger.error(f"Error in pipeline stage '{self.name}': {e}", exc_info=True)
+            
+            self.total_busy += time.perf_counter() - started
+            self.processed += 1
+    
+    def depth(self) -> int:
+        return len(self._queue)
+    
+    def get_stats(self) -> dict:
+        processed = self.processed
+        return {
+            'depth': len(self._queue),
+            'max_depth': self.max_depth,
+            'peak_depth': self.peak_depth,
+            'submitted': self.submitted,
+            'processed': processed,
+            'dropped': self.dropped,
+            'avg_wait_ms': self.total_wait / processed * 1000 if processed else 0.0,
+            'max_wait_ms': self.max_wait * 1000,
+            'avg_busy_ms': self.total_busy / processed * 1000 if processed else 0.0,
+            'blocked_ms': self.blocked_time * 1000
+        }
@@ -1,27 +1,88 @@
+import time
 import logging
-from typing import Optional, Callable
+from typing import Optional, Callable, Tuple
 from threading import Thread
-from protocol import Packet, PacketType, PacketHeader
+from protocol import PacketType, PacketHeader, CaptureWriter
+from .framing import PacketFramer
+from .pipeline import PipelineStage, OverflowPolicy
+from .drop_policy import FrameDropPolicy
+from .jitter_buffer import AudioJitterBuffer
+from .tracing import TRACE_RECEIVE, TRACE_PARSE
+from . import h264
 
 logger = logging.getLogger(__name__)
 
 class StreamReceiver:
-    def __init__(self, connection_manager):
+    def __init__(self, connection_manager, pipelined: bool = True,
+                 video_queue_depth: int = 30, video_overflow: str = OverflowPolicy.DROP_OLDEST,
+                 audio_queue_depth: int = 50, audio_overflow: str = OverflowPolicy.DROP_OLDEST,
+                 max_video_latency_ms: float = 200.0, audio_jitter_buffer: bool = True,
+                 audio_min_delay_ms: float = 20.0, audio_max_delay_ms: float = 300.0):
         self.connection_manager = connection_manager
         self.is_receiving = False
         self.receive_thread: Optional[Thread] = None
+        self.framer = PacketFramer(connection_manager)
         
         self.on_video_frame: Optional[Callable[[bytes, int, bool], None]] = None
         self.on_video_config: Optional[Callable[[bytes], None]] = None
         self.on_audio_frame: Optional[Callable[[bytes, int], None]] = None
         self.on_audio_config: Optional[Callable[[bytes], None]] = None
+        self.on_audio_conceal: Optional[Callable[[int], None]] = None
+        
+        # Optional AVSyncEngine: every media packet's arrival feeds its device-to-host clock mapping
+        self.av_sync = None
+        # Optional FrameTracer: video frames are stamped at socket receive and packet parse
+        self.tracer = None
+        self._read_ns = 0
+        
+        # Packet sinks (recorder, replay buffer) see every packet as received, before decoding.
+        # The payload is a view into the framer's buffer: a sink that keeps it must copy it.
+        self._packet_sinks: Tuple[Callable[[PacketHeader, memoryview], None], ...] = ()
+        # Latest configs, so a sink attached mid-stream can start without waiting for new ones
+        self.last_video_config: Optional[bytes] = None
+        self.last_audio_config: Optional[bytes] = None
+        # Capture mode: the raw packet stream is also written to a file for offline replay
+        self.capture: Optional[CaptureWriter] = None
         self.on_control_response: Optional[Callable[[str], None]] = None
         
+        self.packets_received = 0
+        self.payload_bytes_copied = 0
+        
+        # Video decode and audio output run on their own workers so neither blocks the other
+        self.video_stage: Optional[PipelineStage] = None
+        self.audio_stage: Optional[PipelineStage] = None
+        if pipelined:
+            self.video_stage = PipelineStage('video', video_queue_depth, video_overflow)
+        
+        # The jitter buffer's playout thread replaces the audio stage: it reorders by timestamp
+        # and releases frames to the decoder on schedule
+        self.audio_jitter: Optional[AudioJitterBuffer] = None
+        if audio_jitter_buffer:
+            self.audio_jitter = AudioJitterBuffer(audio_min_delay_ms, audio_max_delay_ms)
+            self.audio_jitter.on_packet = self._play_audio_frame
+            self.audio_jitter.on_config = self._apply_audio_config
+            self.audio_jitter.on_conceal = self._conceal_audio_frame
+        elif pipelined:
+            self.audio_stage = PipelineStage('audio', audio_queue_depth, audio_overflow)
+        
+        # Only a queued pipeline can build a backlog worth dropping. A frame the full video queue
+        # drops is reported here so decoding waits for the next IDR; BLOCK stalls the socket instead
+        self.drop_policy = FrameDropPolicy(max_video_latency_ms, enabled=pipelined)
+        if self.video_stage:
+            self.video_stage.on_drop = lambda item: self.drop_policy.on_frame_lost()
+    
     def start(self):
         if self.is_receiving:
             return
         
         self.is_receiving = True
+        self.framer.reset()
+        self.drop_policy.reset()
+        if self.av_sync:
+            self.av_sync.reset()
+        for stage in (self.video_stage, self.audio_stage, self.audio_jitter):
+            if stage:
+                stage.start()
         self.receive_thread = Thread(target=self._receive_loop, daemon=True)
         self.receive_thread.start()
         logger.info("Stream receiver started")
@@ -30,27 +91,47 @@ class StreamReceiver:
         self.is_receiving = False
         if self.receive_thread:
             self.receive_thread.join(timeout=2.0)
+        for stage in (self.video_stage, self.audio_stage, self.audio_jitter):
+            if stage:
+                stage.stop()
+        self.stop_capture()
         logger.info("Stream receiver stopped")
     
+    def add_packet_sink(self, sink: Callable[[PacketHeader, memoryview], None]):
+        # Copy-on-write: the receive thread iterates the tuple without a lock
+        self._packet_sinks = self._packet_sinks + (sink,)
+    
+    def remove_packet_sink(self, sink: Callable[[PacketHeader, memoryview], None]):
+        self._packet_sinks = tuple(s for s in self._packet_sinks if s != sink)
+    
+    def start_capture(self, path: str):
+        """Write every packet from now on to a capture file (protocol.emulator replays it)"""
+        self.stop_capture()
+        self.capture = CaptureWriter(path)
+        self.add_packet_sink(self.capture.write_packet)
+        logger.info(f"Capturing packets to {path}")
+    
+    def stop_capture(self):
+        if self.capture:
+            self.remove_packet_sink(self.capture.write_packet)
+            self.capture.close()
+            self.capture = None
+    
     def _receive_loop(self):
         logger.info("Receive loop started")
         while self.is_receiving:
             try:
-                header_data = self.connection_manager.receive_data(PacketHeader.HEADER_SIZE)
-                if not header_data:
-                    logger.warning("No header data received, breaking loop")
+                # One read may complete many packets; payloads are views into the framer's buffer
+                packets = self.framer.read_packets()
+                self._read_ns = time.perf_counter_ns()
+                if packets is None:
+                    logger.warning("Connection closed, breaking loop")
                     break
                 
-                header = PacketHeader.from_bytes(header_data)
-                logger.debug(f"Received packet: type={header.packet_type}, size={header.payload_size}")
-                
-                payload_data = self.connection_manager.receive_data(header.payload_size)
-                if not payload_data:
-                    logger.warning("No payload data received, breaking loop")
-                    break
-                
-                self._handle_packet(header, payload_data)
-                
+                for header, payload_data in packets:
+                    self.packets_received += 1
+                    self._handle_packet(header, payload_data)
+            
             except Exception as e:
                 logger.error(f"Error in receive loop: {e}", exc_info=True)
                 break
@@ -58,43 +139,122 @@ class StreamReceiver:
         self.is_receiving = False
         logger.info("Receive loop stopped")
     
-    def _handle_packet(self, header: PacketHeader, payload: bytes):
+    def get_stats(self) -> dict:
+        stats = self.connection_manager.get_stats()
+        framer_stats = self.framer.get_stats()
+        # The connection copies nothing: it reads straight into the framer's buffer
+        stats['bytes_copied'] = framer_stats['bytes_compacted'] + self.payload_bytes_copied
+        stats['buffer_size'] = framer_stats['buffer_size']
+        stats['reads'] = framer_stats['reads']
+        stats['packets_per_read'] = framer_stats['packets_per_read']
+        stats['resyncs'] = framer_stats['resyncs']
+        stats['bytes_discarded'] = framer_stats['bytes_discarded']
+        packets = self.packets_received
+        stats['packets_received'] = packets
+        stats['syscalls_per_packet'] = stats['recv_calls'] / packets if packets else 0.0
+        stats['bytes_copied_per_packet'] = stats['bytes_copied'] / packets if packets else 0.0
+        stats['video_drop'] = self.drop_policy.get_stats()
+        if self.video_stage:
+            stats['video_queue'] = self.video_stage.get_stats()
+        if self.audio_stage:
+            stats['audio_queue'] = self.audio_stage.get_stats()
+        if self.audio_jitter:
+            stats['audio_jitter'] = self.audio_jitter.get_stats()
+        if self.av_sync:
+            stats['av_sync'] = self.av_sync.get_stats()
+        if self.capture:
+            stats['capture'] = self.capture.get_stats()
+        return stats
+    
+    def _dispatch(self, stage: Optional[PipelineStage], func: Callable, payload, *args,
+                  droppable: bool = True):
+        if stage is None:
+            func(payload, *args)
+            return
+        
+        # The framer reuses its buffer on the next read, so queued payloads need their own copy
+        if isinstance(payload, memoryview):
+            self.payload_bytes_copied += len(payload)
+            payload = bytes(payload)
+        stage.submit(func, payload, *args, droppable=droppable)
+    
+    def _decode_video_frame(self, payload, timestamp: int, is_keyframe: bool):
+        if not self.drop_policy.should_decode(payload, timestamp):
+            return
+        self.on_video_frame(payload, timestamp, is_keyframe)
+    
+    def _play_audio_frame(self, payload: bytes, timestamp: int):
+        if self.on_audio_frame:
+            self.on_audio_frame(payload, timestamp)
+    
+    def _apply_audio_config(self, config: bytes):
+        if self.on_audio_config:
+            self.on_audio_config(config)
+        else:
+            logger.warning("on_audio_config callback is not set")
+    
+    def _conceal_audio_frame(self, timestamp: int):
+        if self.on_audio_conceal:
+            self.on_audio_conceal(timestamp)
+    
+    def _handle_packet(self, header: PacketHeader, payload: memoryview):
         try:
+            for sink in self._packet_sinks:
+                try:
+                    sink(header, payload)
+                except Exception as e:
+                    logger.error(f"Packet sink failed: {e}", exc_info=True)
+            
             if header.packet_type == PacketType.VIDEO_CONFIG:
                 logger.info(f"Handling video config: size={len(payload)}")
+                self.last_video_config = bytes(payload)
                 if self.on_video_config:
-                    self.on_video_config(payload)
+                    self._dispatch(self.video_stage, self.on_video_config, bytes(payload), droppable=False)
                 else:
                     logger.warning("on_video_config callback is not set")
             
             elif header.packet_type == PacketType.VIDEO_FRAME:
                 logger.debug(f"Handling video frame: size={len(payload)}")
+                if self.tracer:
+                    self.tracer.mark(TRACE_RECEIVE, header.timestamp, self._read_ns)
+                    self.tracer.mark(TRACE_PARSE, header.timestamp)
+                if self.av_sync:
+                    self.av_sync.on_packet_arrival(header.timestamp)
                 if self.on_video_frame:
-                    is_keyframe = len(payload) > 4 and payload[4] == 0x67
-                    self.on_video_frame(payload, header.timestamp, is_keyframe)
+                    is_keyframe = h264.is_keyframe(payload)
+                    self.drop_policy.on_arrival(header.timestamp)
+                    self._dispatch(self.video_stage, self._decode_video_frame, payload, header.timestamp, is_keyframe)
                 else:
                     logger.warning("on_video_frame callback is not set")
             
             elif header.packet_type == PacketType.AUDIO_FRAME:
                 logger.debug(f"Handling audio frame: size={len(payload)}")
-                if self.on_audio_frame:
-                    self.on_audio_frame(payload, header.timestamp)
+                if self.av_sync:
+                    self.av_sync.on_packet_arrival(header.timestamp)
+                if self.audio_jitter:
+                    self.payload_bytes_copied += len(payload)
+                    self.audio_jitter.push(bytes(payload), header.timestamp)
+                elif self.on_audio_frame:
+                    self._dispatch(self.audio_stage, self.on_audio_frame, payload, header.timestamp)
             
             elif header.packet_type == PacketType.AUDIO_CONFIG:
                 logger.info(f"Handling audio config: size={len(payload)}")
-                if self.on_audio_config:
-                    self.on_audio_config(payload)
+                self.last_audio_config = bytes(payload)
+                if self.audio_jitter:
+                    self.audio_jitter.push_config(bytes(payload))
+                elif self.on_audio_config:
+                    self._dispatch(self.audio_stage, self.on_audio_config, bytes(payload), droppable=False)
                 else:
                     logger.warning("on_audio_config callback is not set")
             
             elif header.packet_type == PacketType.CONTROL_RESPONSE:
                 if self.on_control_response:
-                    response = payload.decode('utf-8')
+                    response = bytes(payload).decode('utf-8')
                     self.on_control_response(response)
             
             elif header.packet_type == PacketType.KEEPALIVE:
                 logger.debug("Received keepalive packet")
-            
+        
         except Exception as e:
             logger.error(f"Error handling packet: {e}", exc_info=True)
 
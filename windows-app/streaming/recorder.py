@@ -0,0 +1,292 @@
+import io
+import os
+import time
+import struct
+import logging
+from fractions import Fraction
+from collections import deque
+from threading import Thread, Condition
+from typing import Optional
+
+import av
+
+from protocol import PacketType, PacketHeader
+from . import h264
+
+logger = logging.getLogger(__name__)
+
+# Header timestamps are presentationTimeUs from the Android encoders
+DEVICE_TIME_BASE = Fraction(1, 1_000_000)
+VIDEO_TIME_BASE = Fraction(1, 90000)
+
+_CHANNEL_LAYOUTS = {1: 'mono', 2: 'stereo'}
+
+# A header-only ADTS frame (AAC-LC); demuxed only to get a template for the recorded AAC track
+_ADTS_TEMPLATE = bytes([0xFF, 0xF1, 0x4C, 0x80, 0x00, 0xFF, 0xFC])
+
+class StreamRecorder:
+    """Packet sink that remuxes the incoming stream into MP4/MKV without transcoding.
+    
+    H.264 access units and AAC frames are written exactly as received:
+    VIDEO_CONFIG (SPS/PPS) and the AAC AudioSpecificConfig become the
+    streams' extradata and header timestamps become PTS, so recording costs
+    one payload copy and the container write. The receive thread only
+    copies packets into a bounded queue; a writer thread does all file I/O.
+    
+    The file starts at the first keyframe after a video config. A config
+    change mid-recording (new resolution or audio format) closes the file and
+    continues in a new part, since MP4 cannot change codec parameters in one
+    track. On queue overflow, video waits for the next keyframe so the file
+    never holds frames that reference dropped ones.
+    """
+    def __init__(self, path: str, max_queue_packets: int = 1000,
+                 max_queue_bytes: int = 64 * 1024 * 1024, record_audio: bool = True):
+        self.path = path
+        self.max_queue_packets = max_queue_packets
+        self.max_queue_bytes = max_queue_bytes
+        self.record_audio = record_audio
+        
+        self._queue = deque()
+        self._queued_bytes = 0
+        self._cond = Condition()
+        self._thread: Optional[Thread] = None
+        self._running = False
+        self._drop_video_until_keyframe = False
+        
+        # Writer thread state
+        self._container = None
+        self._video_stream = None
+        self._audio_stream = None
+        self._video_config: Optional[bytes] = None
+        self._audio_config: Optional[bytes] = None
+        self._base_ts: Optional[int] = None
+        self._last_dts = {}
+        self.part = 0
+        self.files = []
+        
+        self.packets_written = 0
+        self.bytes_written = 0
+        self.video_frames = 0
+        self.audio_frames = 0
+        self.packets_dropped = 0
+        self.packets_skipped = 0
+        self.max_queued_bytes = 0
+        self.started_at = None
+    
+    def start(self, video_config: Optional[bytes] = None, audio_config: Optional[bytes] = None):
+        """Start the writer; pass the configs already received when recording starts mid-stream"""
+        if self._running:
+            return
+        self._running = True
+        self.started_at = time.monotonic()
+        if video_config:
+            self._enqueue(PacketType.VIDEO_CONFIG, bytes(video_config), 0)
+        if audio_config:
+            self._enqueue(PacketType.AUDIO_CONFIG, bytes(audio_config), 0)
+        self._thread = Thread(target=self._write_loop, name='recorder', daemon=True)
+        self._thread.start()
+        logger.info(f"Recording to {self.path}")
+    
+    def stop(self, timeout: float = 10.0):
+        """Write everything still queued and finalize the file (on the writer thread)"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                logger.warning("Recording writer still busy; it finalizes the file when its queue is written")
+                return
+            self._thread = None
+        logger.info(f"Recording stopped: {self.video_frames} video / {self.audio_frames} audio frames, "
+                    f"{self.bytes_written / 1e6:.1f} MB in {len(self.files)} file(s)")
+    
+    def write_packets(self, packets):
+        """Remux already buffered (packet_type, data, timestamp) tuples and finalize; for replay dumps"""
+        for packet_type, data, timestamp in packets:
+            self._write(packet_type, data, timestamp)
+        self._close_container()
+    
+    @property
+    def is_recording(self) -> bool:
+        return self._running
+    
+    def on_packet(self, header: PacketHeader, payload):
+        """StreamReceiver packet sink; runs on the receive thread and never blocks"""
+        packet_type = header.packet_type
+        if packet_type not in (PacketType.VIDEO_CONFIG, PacketType.VIDEO_FRAME,
+                               PacketType.AUDIO_CONFIG, PacketType.AUDIO_FRAME):
+            return
+        if not self.record_audio and packet_type in (PacketType.AUDIO_CONFIG, PacketType.AUDIO_FRAME):
+            return
+        if not self._running:
+            return
+        
+        if packet_type == PacketType.VIDEO_FRAME and self._drop_video_until_keyframe:
+            if not h264.is_keyframe(payload):
+                self.packets_dropped += 1
+                return
+            self._drop_video_until_keyframe = False
+        
+        # The framer reuses its buffer, so the queue keeps its own copy
+        self._enqueue(packet_type, bytes(payload), header.timestamp)
+    
+    def _enqueue(self, packet_type: PacketType, data: bytes, timestamp: int):
+        with self._cond:
+            configs = (PacketType.VIDEO_CONFIG, PacketType.AUDIO_CONFIG)
+            if packet_type not in configs and (len(self._queue) >= self.max_queue_packets or
+                                               self._queued_bytes + len(data) > self.max_queue_bytes):
+                # Disk cannot keep up: drop rather than stall the receiver
+                self.packets_dropped += 1
+                if packet_type == PacketType.VIDEO_FRAME:
+                    self._drop_video_until_keyframe = True
+                return
+            self._queue.append((packet_type, data, timestamp))
+            self._queued_bytes += len(data)
+            self.max_queued_bytes = max(self.max_queued_bytes, self._queued_bytes)
+            self._cond.notify()
+    
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:
+                    break
+                packet_type, data, timestamp = self._queue.popleft()
+                self._queued_bytes -= len(data)
+            
+            try:
+                self._write(packet_type, data, timestamp)
+            except Exception as e:
+                logger.error(f"Recording write failed: {e}", exc_info=True)
+        
+        # Only this thread touches the container, so a slow stop() never closes it mid-write
+        self._close_container()
+    
+    def _write(self, packet_type: PacketType, data: bytes, timestamp: int):
+        if packet_type == PacketType.VIDEO_CONFIG:
+            if data != self._video_config:
+                self._close_container()
+                self._video_config = data
+        
+        elif packet_type == PacketType.AUDIO_CONFIG:
+            if data != self._audio_config:
+                if self._container and self._audio_stream is not None:
+                    self._close_container()
+                self._audio_config = data
+        
+        elif packet_type == PacketType.VIDEO_FRAME:
+            is_keyframe = h264.is_keyframe(data)
+            if self._container is None:
+                if self._video_config is None or not is_keyframe:
+                    self.packets_skipped += 1
+                    return
+                self._open_container(timestamp)
+            self._mux(self._video_stream, data, timestamp, is_keyframe)
+            self.video_frames += 1
+        
+        elif packet_type == PacketType.AUDIO_FRAME:
+            if self._container is None or self._audio_stream is None or timestamp < self._base_ts:
+                self.packets_skipped += 1
+                return
+            self._mux(self._audio_stream, data, timestamp, True)
+            self.audio_frames += 1
+    
+    def _part_path(self) -> str:
+        if self.part == 0:
+            return self.path
+        stem, ext = os.path.splitext(self.path)
+        return f"{stem}_part{self.part + 1}{ext}"
+    
+    def _open_container(self, base_ts: int):
+        path = self._part_path()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        container = av.open(path, 'w')
+        width, height = h264.parse_sps_resolution(self._video_config)
+        video = _add_remux_stream(container, self._video_config, 'h264')
+        context = video.codec_context
+        context.width = width
+        context.height = height
+        context.time_base = VIDEO_TIME_BASE
+        # MP4 writes our SPS/PPS as avcC, Matroska as CodecPrivate
+        context.extradata = self._video_config
+        video.time_base = VIDEO_TIME_BASE
+        
+        audio = None
+        if self._audio_config and len(self._audio_config) >= 8:
+            sample_rate, channels = struct.unpack('>II', self._audio_config[:8])
+            audio = _add_remux_stream(container, _ADTS_TEMPLATE, 'aac')
+            context = audio.codec_context
+            context.sample_rate = sample_rate
+            context.layout = _CHANNEL_LAYOUTS.get(channels, 'stereo')
+            context.extradata = self._audio_config[8:] or None
+            audio.time_base = Fraction(1, sample_rate)
+        
+        self._container = container
+        self._video_stream = video
+        self._audio_stream = audio
+        self._base_ts = base_ts
+        self._last_dts = {}
+        self.files.append(path)
+        logger.info(f"Recording file opened: {path} ({width}x{height}, "
+                    f"audio={'yes' if audio else 'no'})")
+    
+    def _mux(self, stream, data: bytes, timestamp: int, is_keyframe: bool):
+        packet = av.Packet(data)
+        packet.stream = stream
+        packet.time_base = DEVICE_TIME_BASE
+        pts = timestamp - self._base_ts
+        # The Android encoders emit no B-frames, so DTS = PTS; the muxers need it strictly increasing
+        last = self._last_dts.get(stream.index)
+        dts = pts if last is None or pts > last else last + 1
+        self._last_dts[stream.index] = dts
+        packet.pts = max(pts, dts)
+        packet.dts = dts
+        packet.is_keyframe = is_keyframe
+        self._container.mux(packet)
+        self.packets_written += 1
+        self.bytes_written += len(data)
+    
+    def _close_container(self):
+        if self._container is None:
+            return
+        try:
+            self._container.close()
+        except Exception as e:
+            logger.error(f"Failed to finalize recording: {e}")
+        self._container = None
+        self._video_stream = None
+        self._audio_stream = None
+        self.part += 1
+    
+    def get_stats(self) -> dict:
+        with self._cond:
+            queued = len(self._queue)
+            queued_bytes = self._queued_bytes
+        return {
+            'recording': self._running,
+            'files': list(self.files),
+            'video_frames': self.video_frames,
+            'audio_frames': self.audio_frames,
+            'bytes_written': self.bytes_written,
+            'queued': queued,
+            'queued_bytes': queued_bytes,
+            'max_queued_bytes': self.max_queued_bytes,
+            'dropped': self.packets_dropped,
+            'skipped': self.packets_skipped
+        }
+
+def _add_remux_stream(container, probe: bytes, format_name: str):
+    """Add an output stream for already encoded packets, templated on an in-memory elementary stream.
+    
+    PyAV opens an encoder for every stream from add_stream() when the
+    header is written, which also replaces the extradata with the
+    encoder's own. A stream added from a template is never opened, so its
+    codec context only carries the parameters set on it.
+    """
+    with av.open(io.BytesIO(probe), format=format_name) as source:
+        return container.add_stream_from_template(source.streams[0])
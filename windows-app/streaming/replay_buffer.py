@@ -0,0 +1,195 @@
+import logging
+from collections import deque
+from threading import Thread, Lock
+from typing import Optional, Callable, List
+
+from protocol import PacketType, PacketHeader
+from . import h264
+from .recorder import StreamRecorder
+
+logger = logging.getLogger(__name__)
+
+class _Gop:
+    """One keyframe and everything received until the next one, with the configs it decodes with"""
+    __slots__ = ('start_ts', 'video_config', 'audio_config', 'packets', 'size')
+    
+    def __init__(self, start_ts: int, video_config: bytes, audio_config: Optional[bytes]):
+        self.start_ts = start_ts
+        self.video_config = video_config
+        self.audio_config = audio_config
+        self.packets = []
+        self.size = 0
+
+class ReplayBuffer:
+    """Instant replay: the last max_seconds of encoded packets, kept in memory.
+    
+    A packet sink like StreamRecorder, but packets go into a ring of GOPs
+    instead of a file. Every GOP starts at a keyframe and the oldest whole
+    GOP is dropped once the ring exceeds max_seconds or max_bytes, so the
+    buffer always begins at a keyframe. At a few Mbit/s that is tens of MB,
+    where the same duration of decoded frames would be gigabytes.
+    
+    save() takes a snapshot of the GOP list (references only) and remuxes it
+    on a worker thread, so the receive thread never waits on the disk.
+    """
+    def __init__(self, max_seconds: float = 30.0, max_bytes: int = 64 * 1024 * 1024,
+                 record_audio: bool = True):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.record_audio = record_audio
+        
+        # Called on the save worker with (files, error or None)
+        self.on_saved: Optional[Callable[[List[str], Optional[Exception]], None]] = None
+        
+        self._lock = Lock()
+        self._gops = deque()
+        self._bytes = 0
+        self._last_ts = 0
+        self._video_config: Optional[bytes] = None
+        self._audio_config: Optional[bytes] = None
+        self._saving: Optional[Thread] = None
+        
+        self.gops_trimmed = 0
+        self.packets_skipped = 0
+        self.saves = 0
+    
+    def set_configs(self, video_config: Optional[bytes] = None, audio_config: Optional[bytes] = None):
+        """Configs already received when the buffer is attached mid-stream"""
+        with self._lock:
+            if video_config:
+                self._video_config = bytes(video_config)
+            if audio_config:
+                self._audio_config = bytes(audio_config)
+    
+    def clear(self):
+        """Drop everything from the previous session; its timestamps and configs do not carry over"""
+        with self._lock:
+            self._gops.clear()
+            self._bytes = 0
+            self._last_ts = 0
+            self._video_config = None
+            self._audio_config = None
+    
+    def on_packet(self, header: PacketHeader, payload):
+        """StreamReceiver packet sink; runs on the receive thread and never blocks on I/O"""
+        packet_type = header.packet_type
+        if not self.record_audio and packet_type in (PacketType.AUDIO_CONFIG, PacketType.AUDIO_FRAME):
+            return
+        
+        if packet_type == PacketType.VIDEO_CONFIG:
+            with self._lock:
+                self._video_config = bytes(payload)
+            return
+        if packet_type == PacketType.AUDIO_CONFIG:
+            data = bytes(payload)
+            with self._lock:
+                self._audio_config = data
+                if self._gops:
+                    # Takes effect mid-GOP; the dump replays it in place
+                    self._append(packet_type, data, header.timestamp)
+            return
+        if packet_type not in (PacketType.VIDEO_FRAME, PacketType.AUDIO_FRAME):
+            return
+        
+        # The framer reuses its buffer, so the ring keeps its own copy
+        data = bytes(payload)
+        timestamp = header.timestamp
+        with self._lock:
+            if packet_type == PacketType.VIDEO_FRAME and h264.is_keyframe(data) and self._video_config:
+                self._gops.append(_Gop(timestamp, self._video_config, self._audio_config))
+            elif not self._gops:
+                # Nothing decodable before the first keyframe
+                self.packets_skipped += 1
+                return
+            self._append(packet_type, data, timestamp)
+            self._last_ts = max(self._last_ts, timestamp)
+            self._trim()
+    
+    def _append(self, packet_type: PacketType, data: bytes, timestamp: int):
+        gop = self._gops[-1]
+        gop.packets.append((packet_type, data, timestamp))
+        gop.size += len(data)
+        self._bytes += len(data)
+    
+    def _trim(self):
+        # The newest GOP always stays, even if it alone exceeds a limit
+        max_us = self.max_seconds * 1e6
+        while len(self._gops) > 1 and (self._last_ts - self._gops[1].start_ts >= max_us or
+                                       self._bytes > self.max_bytes):
+            self._bytes -= self._gops.popleft().size
+            self.gops_trimmed += 1
+    
+    def duration_s(self) -> float:
+        with self._lock:
+            if not self._gops:
+                return 0.0
+            return (self._last_ts - self._gops[0].start_ts) / 1e6
+    
+    def snapshot(self, seconds: Optional[float] = None) -> list:
+        """Packets of the last `seconds` (default: everything), from the keyframe at or before that point"""
+        with self._lock:
+            gops = list(self._gops)
+            last_ts = self._last_ts
+        if seconds is not None:
+            start_ts = last_ts - seconds * 1e6
+            first = 0
+            for index, gop in enumerate(gops):
+                if gop.start_ts <= start_ts:
+                    first = index
+            gops = gops[first:]
+        if not gops:
+            return []
+        
+        packets = [(PacketType.VIDEO_CONFIG, gops[0].video_config, 0)]
+        if gops[0].audio_config:
+            packets.append((PacketType.AUDIO_CONFIG, gops[0].audio_config, 0))
+        for gop in gops:
+            # A new video config between GOPs makes the recorder start a new part
+            packets.append((PacketType.VIDEO_CONFIG, gop.video_config, 0))
+            packets.extend(gop.packets)
+        return packets
+    
+    def save(self, path: str, seconds: Optional[float] = None) -> bool:
+        """Dump the last `seconds` to path (MP4/MKV) on a worker; False if empty or a save is running"""
+        if self._saving and self._saving.is_alive():
+            logger.warning("Replay save already in progress")
+            return False
+        packets = self.snapshot(seconds)
+        if not packets:
+            return False
+        self._saving = Thread(target=self._save, args=(path, packets), name='replay-save', daemon=True)
+        self._saving.start()
+        return True
+    
+    def _save(self, path: str, packets: list):
+        recorder = StreamRecorder(path)
+        error = None
+        try:
+            recorder.write_packets(packets)
+            self.saves += 1
+            logger.info(f"Replay saved: {recorder.video_frames} video / {recorder.audio_frames} audio frames "
+                        f"to {', '.join(recorder.files)}")
+        except Exception as e:
+            error = e
+            logger.error(f"Replay save failed: {e}", exc_info=True)
+        if self.on_saved:
+            self.on_saved(recorder.files, error)
+    
+    def wait_saved(self, timeout: Optional[float] = None):
+        if self._saving:
+            self._saving.join(timeout)
+    
+    def get_stats(self) -> dict:
+        with self._lock:
+            gops = len(self._gops)
+            size = self._bytes
+            duration = (self._last_ts - self._gops[0].start_ts) / 1e6 if self._gops else 0.0
+        return {
+            'duration_s': duration,
+            'bytes': size,
+            'gops': gops,
+            'gops_trimmed': self.gops_trimmed,
+            'skipped': self.packets_skipped,
+            'saves': self.saves,
+            'saving': bool(self._saving and self._saving.is_alive())
+        }
@@ -0,0 +1,235 @@
+import json
+import time
+import logging
+from threading import Lock
+from typing import Optional, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Points in a video frame's life, in pipeline order
+TRACE_RECEIVE = 'receive'          # the socket read that completed the packet returned
+TRACE_PARSE = 'parse'              # the framed packet reached StreamReceiver
+TRACE_DECODE_START = 'decode_start'
+TRACE_DECODE_END = 'decode_end'
+TRACE_CONVERT = 'convert'          # first pixel format conversion of the decoded frame done
+TRACE_PRESENT = 'present'          # preview drawn on the GUI thread
+TRACE_VCAM_SENT = 'vcam_sent'      # VirtuCoreCamera accepted the frame
+
+TRACE_STAGES = (TRACE_RECEIVE, TRACE_PARSE, TRACE_DECODE_START, TRACE_DECODE_END,
+                TRACE_CONVERT, TRACE_PRESENT, TRACE_VCAM_SENT)
+
+# Each stage is measured from the one before it; preview and virtual camera branch off conversion
+_PREVIOUS = {
+    TRACE_PARSE: TRACE_RECEIVE,
+    TRACE_DECODE_START: TRACE_PARSE,
+    TRACE_DECODE_END: TRACE_DECODE_START,
+    TRACE_CONVERT: TRACE_DECODE_END,
+    TRACE_PRESENT: TRACE_CONVERT,
+    TRACE_VCAM_SENT: TRACE_CONVERT
+}
+_STAGE_INDEX = {stage: index for index, stage in enumerate(TRACE_STAGES)}
+
+class LatencyHistogram:
+    """Log-linear (HDR-style) histogram of microsecond latencies.
+    
+    Values below 2^sub_bits are counted exactly. Above that every power of
+    two is split into 2^(sub_bits - 1) linear buckets, so a bucket is at
+    most 1 / 2^(sub_bits - 1) of its values wide (1.56% with the default 7
+    bits). Percentiles report the bucket midpoint, which is within half
+    that (0.78%) of any value in the bucket over the whole range. Recording
+    is an index computation and one list increment; the counts array is
+    fixed at creation.
+    """
+    def __init__(self, max_value_us: int = 3600 * 1_000_000, sub_bits: int = 7):
+        self.sub_bits = sub_bits
+        self.sub_count = 1 << sub_bits
+        self.half_count = self.sub_count >> 1
+        self.max_value_us = max_value_us
+        self.counts = [0] * (self._index(max_value_us) + 1)
+        self.reset()
+    
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+    
+    def _index(self, value: int) -> int:
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits
+        return self.sub_count + (shift - 1) * self.half_count + (value >> shift) - self.half_count
+    
+    def _bucket_range(self, index: int):
+        """[low, high) of the values counted in a bucket"""
+        if index < self.sub_count:
+            return index, index + 1
+        shift = (index - self.sub_count) // self.half_count + 1
+        low = ((index - self.sub_count) % self.half_count + self.half_count) << shift
+        return low, low + (1 << shift)
+    
+    def record(self, value_us: int):
+        if value_us < 0:
+            value_us = 0
+        elif value_us > self.max_value_us:
+            value_us = self.max_value_us
+        self.counts[self._index(value_us)] += 1
+        self.count += 1
+        self.total += value_us
+        if self.min is None or value_us < self.min:
+            self.min = value_us
+        if value_us > self.max:
+            self.max = value_us
+    
+    def merge(self, other: 'LatencyHistogram'):
+        for i, count in enumerate(other.counts):
+            if count:
+                self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+    
+    def percentile(self, percentile: float) -> int:
+        """Value at the percentile, as the midpoint of its bucket (clamped to the recorded range)"""
+        if not self.count:
+            return 0
+        rank = max(1, int(percentile / 100 * self.count + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                low, high = self._bucket_range(index)
+                return min(max((low + high - 1) // 2, self.min), self.max)
+        return self.max
+    
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+    
+    def to_dict(self, buckets: bool = False) -> dict:
+        """Summary in milliseconds; buckets adds the non-empty [low_us, high_us, count] triples"""
+        result = {
+            'count': self.count,
+            'min_ms': (self.min or 0) / 1000,
+            'mean_ms': round(self.mean() / 1000, 3),
+            'p50_ms': self.percentile(50) / 1000,
+            'p90_ms': self.percentile(90) / 1000,
+            'p99_ms': self.percentile(99) / 1000,
+            'p999_ms': self.percentile(99.9) / 1000,
+            'max_ms': self.max / 1000
+        }
+        if buckets:
+            result['buckets'] = [[*self._bucket_range(i), count] for i, count in enumerate(self.counts) if count]
+        return result
+
+class FrameTracer:
+    """Per-stage latency of video frames, cheap enough to stay on.
+    
+    Pipeline components call mark(stage, timestamp) with the frame's device
+    timestamp as it passes each point in TRACE_STAGES. The first mark of a
+    stage is the one kept. Each mark records the time since the previous
+    stage into that stage's histogram. It also records the time since the
+    socket receive into a matching end-to-end histogram. A mark is a
+    perf_counter_ns() call, a dict lookup and two histogram increments
+    under a lock, a few microseconds at ~7 marks per frame.
+    
+    Only the last max_frames frames are tracked; a frame that never reaches
+    a stage (dropped, not previewed) simply does not count there.
+    dump() returns or writes everything as JSON whenever it is asked for.
+    """
+    def __init__(self, max_frames: int = 256, enabled: bool = True):
+        self.max_frames = max_frames
+        self.enabled = enabled
+        self._lock = Lock()
+        self._frames: Dict[int, List[Optional[int]]] = {}
+        self.stage_histograms = {stage: LatencyHistogram() for stage in TRACE_STAGES[1:]}
+        self.total_histograms = {stage: LatencyHistogram() for stage in TRACE_STAGES[1:]}
+        self.frames_traced = 0
+        self.frames_evicted = 0
+        self.started_at = time.time()
+    
+    def clear_frames(self):
+        """Forget frames in flight, keeping the histograms; for a new session whose timestamps restart"""
+        with self._lock:
+            self._frames.clear()
+    
+    def reset(self):
+        with self._lock:
+            self._frames.clear()
+            for histogram in (*self.stage_histograms.values(), *self.total_histograms.values()):
+                histogram.reset()
+            self.frames_traced = 0
+            self.frames_evicted = 0
+            self.started_at = time.time()
+    
+    def mark(self, stage: str, timestamp: int, now_ns: Optional[int] = None):
+        """Stamp a frame (by device timestamp) at a stage; now_ns defaults to perf_counter_ns()"""
+        if not self.enabled:
+            return
+        if now_ns is None:
+            now_ns = time.perf_counter_ns()
+        index = _STAGE_INDEX[stage]
+        
+        with self._lock:
+            stamps = self._frames.get(timestamp)
+            if stamps is None:
+                if index != 0:
+                    # Received before tracing started or already evicted
+                    return
+                stamps = self._frames[timestamp] = [None] * len(TRACE_STAGES)
+                self.frames_traced += 1
+                if len(self._frames) > self.max_frames:
+                    del self._frames[next(iter(self._frames))]
+                    self.frames_evicted += 1
+            if stamps[index] is not None:
+                return
+            stamps[index] = now_ns
+            if index == 0:
+                return
+            
+            # Closest earlier stage that was stamped before this one (conversion may come from
+            # the other consumer after the virtual camera already sent native planes)
+            previous = _PREVIOUS[stage]
+            while previous is not None:
+                stamp = stamps[_STAGE_INDEX[previous]]
+                if stamp is not None and stamp <= now_ns:
+                    self.stage_histograms[stage].record((now_ns - stamp) // 1000)
+                    break
+                previous = _PREVIOUS.get(previous)
+            self.total_histograms[stage].record((now_ns - stamps[0]) // 1000)
+    
+    def get_stats(self) -> dict:
+        """p50/p99 per stage in milliseconds"""
+        with self._lock:
+            return {
+                'frames_traced': self.frames_traced,
+                'stages': {stage: {'p50_ms': histogram.percentile(50) / 1000,
+                                   'p99_ms': histogram.percentile(99) / 1000,
+                                   'count': histogram.count}
+                           for stage, histogram in self.stage_histograms.items()}
+            }
+    
+    def snapshot(self, buckets: bool = True) -> dict:
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'dumped_at': time.time(),
+                'frames_traced': self.frames_traced,
+                'frames_evicted': self.frames_evicted,
+                # Time since the previous stage (parse: since receive, present/vcam_sent: since convert)
+                'stages': {stage: histogram.to_dict(buckets) for stage, histogram in self.stage_histograms.items()},
+                # Time since the socket receive
+                'end_to_end': {stage: histogram.to_dict(buckets) for stage, histogram in self.total_histograms.items()}
+            }
+    
+    def dump(self, path: Optional[str] = None) -> dict:
+        """Current histograms as a dict, also written to path as JSON when given"""
+        snapshot = self.snapshot()
+        if path:
+            with open(path, 'w') as f:
+                json.dump(snapshot, f, indent=2)
+            logger.info(f"Latency trace written to {path}")
+        return snapshot
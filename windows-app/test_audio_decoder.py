@@ -0,0 +1,112 @@
+"""
+تست تبدیل خروجی دیکودر AAC به PCM int16 interleaved در برابر PCM مرجع
+"""
+import struct
+import av
+import numpy as np
+from streaming.decoder import AudioDecoder
+
+class CollectingMicrophone:
+    """جایگزین VirtuCoreMicrophone که PCM ارسالی را جمع می‌کند"""
+    def __init__(self):
+        self.output = None
+        self.chunks = []
+    
+    def open(self):
+        return True
+    
+    def configure(self, sample_rate, channels):
+        self.format = (sample_rate, channels)
+    
+    def send_audio(self, audio_data):
+        self.chunks.append(np.array(audio_data))
+        return True
+    
+    def close(self):
+        pass
+
+def reference_s16(planar: np.ndarray) -> np.ndarray:
+    """PCM مرجع: (channels, samples) float → (samples, channels) int16 مانند swresample"""
+    return np.clip(np.rint(planar * 32768), -32768, 32767).astype(np.int16).T
+
+def make_frame(planar: np.ndarray, fmt: str, sample_rate: int = 48000):
+    layout = 'stereo' if len(planar) == 2 else 'mono'
+    frame = av.AudioFrame.from_ndarray(planar, format=fmt, layout=layout)
+    frame.sample_rate = sample_rate
+    return frame
+
+def tone(frequencies, samples: int, sample_rate: int = 48000) -> np.ndarray:
+    t = np.arange(samples) / sample_rate
+    return np.stack([0.5 * np.sin(2 * np.pi * f * t) for f in frequencies]).astype(np.float32)
+
+def encode_aac(planar: np.ndarray, sample_rate: int = 48000):
+    """کد کردن PCM به بسته‌های AAC مانند encoder اندروید؛ config با قالب پروتکل"""
+    encoder = av.CodecContext.create('aac', 'w')
+    encoder.sample_rate = sample_rate
+    encoder.layout = 'stereo' if len(planar) == 2 else 'mono'
+    encoder.format = 'fltp'
+    encoder.open()
+    
+    packets = []
+    for start in range(0, planar.shape[1] - 1023, 1024):
+        frame = make_frame(np.ascontiguousarray(planar[:, start:start + 1024]), 'fltp', sample_rate)
+        frame.pts = start
+        packets += [bytes(packet) for packet in encoder.encode(frame)]
+    packets += [bytes(packet) for packet in encoder.encode(None)]
+    config = struct.pack('>II', sample_rate, len(planar)) + bytes(encoder.extradata)
+    return config, packets
+
+def test_convert_matches_reference():
+    """تست تبدیل fltp و s16p (استریو و مونو) به s16 interleaved، شامل مقادیر خارج از بازه"""
+    decoder = AudioDecoder(virtual_microphone=CollectingMicrophone())
+    planar = tone((440, 660), 1024)
+    planar[:, :4] = [[1.5, -1.5, 0.99999, 1.5 / 32768]] * 2
+    
+    converted = np.concatenate(list(decoder.convert(make_frame(planar, 'fltp'))))
+    assert converted.shape == (1024, 2) and converted.dtype == np.int16
+    assert np.array_equal(converted, reference_s16(planar))
+    
+    s16 = reference_s16(planar)
+    converted = np.concatenate(list(decoder.convert(make_frame(np.ascontiguousarray(s16.T), 's16p'))))
+    assert np.array_equal(converted, s16)
+    
+    decoder.set_config(struct.pack('>II', 48000, 1))
+    mono = tone((440,), 1024)
+    converted = np.concatenate(list(decoder.convert(make_frame(mono, 'fltp'))))
+    assert converted.shape == (1024, 1)
+    assert np.array_equal(converted, reference_s16(mono))
+    print("✓ convert matches reference PCM")
+
+def test_decode_interleaves_channels():
+    """تست مسیر کامل: هر کانال خروجی باید تن همان کانال ورودی را داشته باشد"""
+    microphone = CollectingMicrophone()
+    decoder = AudioDecoder(virtual_microphone=microphone)
+    planar = tone((440, 1000), 48000)
+    config, packets = encode_aac(planar)
+    
+    decoder.set_config(config)
+    for index, packet in enumerate(packets):
+        decoder.decode(packet, index * 21333)
+    pcm = np.concatenate(microphone.chunks)
+    assert pcm.ndim == 2 and pcm.shape[1] == 2 and pcm.dtype == np.int16
+    assert len(pcm) >= 46 * 1024
+    
+    spectrum = np.abs(np.fft.rfft(pcm[4096:36864].astype(np.float64), axis=0))
+    frequencies = np.fft.rfftfreq(32768, 1 / 48000)
+    peaks = frequencies[spectrum.argmax(axis=0)]
+    assert abs(peaks[0] - 440) < 3 and abs(peaks[1] - 1000) < 3
+    
+    # دامنه حفظ می‌شود (0.5 تمام مقیاس، با افت جزئی کدک)
+    rms = np.sqrt(np.mean(pcm[4096:].astype(np.float64) ** 2, axis=0)) / 32768
+    assert np.all(np.abs(rms - 0.5 / np.sqrt(2)) < 0.02)
+    print("✓ decode interleaves channels")
+
+def main():
+    print("\n" + "="*60)
+    print("تست دیکودر صدا")
+    print("="*60)
+    test_convert_matches_reference()
+    test_decode_interleaves_channels()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+تست ring buffer صدا و خروجی callback (بدون کارت صدا، callback مستقیماً صدا زده می‌شود)
+"""
+import numpy as np
+from streaming.audio_output import AudioRingBuffer, CallbackAudioOutput
+
+def interleaved(start: int, frames: int, channels: int = 2) -> np.ndarray:
+    return np.arange(start * channels, (start + frames) * channels, dtype=np.int16)
+
+def test_ring_wraparound_and_overrun():
+    """تست ترتیب نمونه‌ها در عبور از انتهای ring و شمارش overrun"""
+    ring = AudioRingBuffer(100, 2)
+    out = np.empty((30, 2), dtype=np.int16)
+    position = 0
+    for _ in range(10):
+        assert ring.write(interleaved(position, 30)) == 30
+        assert ring.read_into(out) == 30
+        assert np.array_equal(out.reshape(-1), interleaved(position, 30))
+        position += 30
+    
+    # فقط 100 فریم جا می‌شود؛ بقیه دور ریخته و شمرده می‌شود
+    assert ring.write(interleaved(0, 130)) == 100
+    assert (ring.overruns, ring.overrun_frames) == (1, 30)
+    assert ring.available() == 100
+    print("✓ ring wraparound and overrun")
+
+def test_callback_priming_and_underrun():
+    """تست شروع پخش پس از رسیدن به تاخیر هدف و rebuffer پس از underrun"""
+    output = CallbackAudioOutput(None, sample_rate=48000, channels=2, target_latency_ms=10, frames_per_buffer=240)
+    
+    # کمتر از 10ms (480 فریم): سکوت، بدون underrun
+    output.write(interleaved(0, 400))
+    data, _ = output._callback(None, 240, None, 0)
+    assert data == bytes(240 * 4) and output.get_stats()['underruns'] == 0
+    
+    output.write(interleaved(400, 200))
+    data, _ = output._callback(None, 240, None, 0)
+    assert np.array_equal(np.frombuffer(data, dtype=np.int16), interleaved(0, 240))
+    output._callback(None, 240, None, 0)
+    
+    # 120 فریم باقی‌مانده: underrun، سپس دوباره سکوت تا رسیدن به هدف
+    data, _ = output._callback(None, 240, None, 0)
+    samples = np.frombuffer(data, dtype=np.int16)
+    assert np.array_equal(samples[:240], interleaved(480, 120)) and not samples[240:].any()
+    stats = output.get_stats()
+    assert (stats['underruns'], stats['underrun_frames'], stats['playing']) == (1, 120, False)
+    print("✓ callback priming and underrun")
+
+def main():
+    print("\n" + "="*60)
+    print("تست خروجی صدا با ring buffer")
+    print("="*60)
+    test_ring_wraparound_and_overrun()
+    test_callback_priming_and_underrun()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+تست همگام‌سازی صدا و تصویر با زمان شبیه‌سازی شده
+"""
+import numpy as np
+from streaming.av_sync import ClockMapper, DriftCorrector, AVSyncEngine
+from virtual_camera.interface import VirtualCameraInterface
+
+FRAME_US = 1024 * 1e6 / 48000
+
+class FakeFrame:
+    """جایگزین DecodedFrame با شمارش retain/release"""
+    def __init__(self, timestamp: int):
+        self.timestamp = timestamp
+        self.refs = 0
+    
+    def retain(self):
+        self.refs += 1
+        return self
+    
+    def release(self):
+        self.refs -= 1
+
+class FixedClock:
+    """AVSyncEngine با ساعت master دستی"""
+    def __init__(self):
+        self.clock = None
+        self.presented = []
+    
+    def master_clock_us(self):
+        return self.clock
+    
+    def to_host_100ns(self, device_us):
+        return int(device_us * 10)
+    
+    def record_video_presented(self, device_us):
+        self.presented.append(device_us)
+
+def test_clock_drift_estimate():
+    """تست تخمین drift ساعت گوشی از زمان رسیدن بسته‌ها با تاخیر شبکه تصادفی"""
+    rng = np.random.default_rng(1)
+    mapper = ClockMapper()
+    drift = 80e-6
+    for i in range(60 * 47):
+        device = int(i * FRAME_US)
+        host = 5e9 + device * (1 + drift) + 3000 + rng.exponential(4000)
+        mapper.add_sample(device, host)
+    
+    assert abs(mapper.drift_ppm - 80) < 5
+    device = 60e6
+    error = mapper.to_host(device) - (5e9 + device * (1 + drift) + 3000)
+    assert abs(error) < 1000
+    assert abs(mapper.to_device(mapper.to_host(device)) - device) < 1
+    print(f"✓ clock drift: {mapper.drift_ppm:.1f} ppm")
+
+def test_drift_corrector_holds_buffer():
+    """تست نگه داشتن سطح بافر خروجی وقتی کارت صدا کندتر از گوشی است"""
+    corrector = DriftCorrector()
+    rate = 48000
+    target = 2880
+    consumer_rate = rate * (1 - 300e-6)
+    buffered = float(target)
+    total_in = 0
+    for _ in range(int(120 * rate / 1024)):
+        pcm = np.zeros((1024, 2), dtype=np.int16)
+        corrector.update(int(buffered), target, rate)
+        out = corrector.process(pcm)
+        assert out.shape[1] == 2 and abs(len(out) - 1024) <= 1
+        total_in += len(out)
+        buffered += len(out) - consumer_rate * 1024 / rate
+    
+    # بدون اصلاح بافر 1728 فریم (36ms) بزرگ‌تر می‌شد
+    assert abs(buffered - target) < rate * 0.010
+    assert corrector.samples_removed > 1000 and corrector.samples_added == 0
+    print(f"✓ drift corrector: {corrector.samples_removed} samples removed, "
+          f"buffer error {(buffered - target) / rate * 1000:.1f} ms")
+
+def test_audio_clock():
+    """تست ساعت صدا: انتهای آخرین فریم نوشته شده منهای بافر، با گذر زمان پیش می‌رود"""
+    engine = AVSyncEngine()
+    host = 1e9
+    engine.on_audio_output(1_000_000, 60_000, host)
+    assert abs(engine.audio_clock_us(host + 10_000) - 950_000) < 1
+    
+    # اندازه‌گیری نزدیک فقط کمی اثر دارد، پرش بزرگ ساعت را دوباره تنظیم می‌کند
+    engine.on_audio_output(1_000_000 + FRAME_US, 42_000 + FRAME_US, host + 20_000)
+    assert abs(engine.audio_clock_us(host + 20_000) - 960_000) < 200
+    engine.on_audio_output(5_000_000, 60_000, host + 30_000)
+    assert engine.audio_clock_us(host + 30_000) == 4_940_000
+    assert engine.audio_clock_resets == 1
+    
+    # بدون خروجی صدا ساعت منقضی می‌شود
+    assert engine.audio_clock_us(host + 30_000 + 600_000) is None
+    print("✓ audio clock")
+
+def test_video_scheduled_on_audio_clock():
+    """تست انتخاب فریم دوربین مجازی بر اساس موعد نمایش روی ساعت صدا"""
+    interface = VirtualCameraInterface(fps=50)
+    interface.av_sync = sync = FixedClock()
+    interface.is_running = True
+    frames = [FakeFrame(i * 20_000) for i in range(10)]
+    for frame in frames:
+        interface.send_frame(frame)
+    assert all(frame.refs == 1 for frame in frames)
+    
+    # ساعت هنوز به اولین فریم نرسیده
+    sync.clock = -15_000
+    assert interface._take_due(20_000) == (None, None)
+    
+    # فریم‌های 0 تا 3 موعدشان رسیده: فقط جدیدترین تحویل و بقیه drop می‌شوند
+    sync.clock = 65_000
+    frame, timestamp = interface._take_due(20_000)
+    assert frame is frames[3] and timestamp == 600_000
+    assert interface.frames_dropped == 3 and all(f.refs == 0 for f in frames[:3])
+    assert len(interface._pending) == 6
+    
+    # بدون نگاشت ساعت آخرین فریم برنده است
+    sync.clock = None
+    frame, timestamp = interface._take_due(20_000)
+    assert frame is frames[-1] and timestamp is None
+    assert interface.frames_dropped == 8 and not interface._pending
+    print("✓ video scheduled on audio clock")
+
+def test_video_with_lagging_audio_clock():
+    """تست عقب بودن ساعت صدا از ورود فریم‌ها: صف زمانی فریم‌ها را تا موعدشان نگه می‌دارد"""
+    period = 1e6 / 60
+    # 400ms در بازه صف است؛ 1.5 ثانیه از آن بیشتر است و قدیمی‌ترین فریم بدون زمان نمایش تحویل می‌شود
+    for lag_us in (400_000, 1_500_000):
+        interface = VirtualCameraInterface(fps=60)
+        interface.av_sync = sync = FixedClock()
+        interface.is_running = True
+        delivered = []
+        for i in range(600):
+            # هر tick یک فریم جدید می‌رسد و ساعت صدا lag_us از آن عقب است
+            timestamp = int(i * period)
+            interface.send_frame(FakeFrame(timestamp))
+            sync.clock = timestamp - lag_us
+            frame, _ = interface._next_frame(period)
+            if frame is not None:
+                delivered.append(frame.timestamp)
+                frame.release()
+        
+        # پس از پر شدن فاصله lag همه فریم‌ها به ترتیب تحویل می‌شوند
+        assert len(delivered) >= 600 - lag_us / period - 2, lag_us
+        assert delivered == sorted(delivered)
+        assert interface.frames_dropped == 0
+    print("✓ video with lagging audio clock")
+
+def main():
+    print("\n" + "="*60)
+    print("تست همگام‌سازی صدا و تصویر")
+    print("="*60)
+    test_clock_drift_estimate()
+    test_drift_corrector_holds_buffer()
+    test_audio_clock()
+    test_video_scheduled_on_audio_clock()
+    test_video_with_lagging_audio_clock()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+تست فایل capture پروتکل و شبیه‌ساز دستگاه (پخش دوباره روی TCP)
+"""
+import os
+import time
+import tempfile
+import threading
+import numpy as np
+from protocol import Packet, PacketType, PacketHeader, MAGIC_NUMBER, CaptureWriter, CaptureReader
+from protocol.emulator import DeviceEmulator
+from streaming.connection import ConnectionManager
+from streaming.receiver import StreamReceiver
+
+def make_packets(count: int = 300, interval_us: int = 1000):
+    """بسته‌های ویدیو و صدا با اندازه‌های متفاوت؛ هر سه بسته با هم می‌رسند"""
+    rng = np.random.default_rng(1)
+    packets = [(Packet(PacketType.VIDEO_CONFIG, b'\x00\x00\x00\x01\x67config'), 0)]
+    for i in range(count):
+        packet_type = PacketType.VIDEO_FRAME if i % 3 == 0 else PacketType.AUDIO_FRAME
+        payload = rng.integers(0, 256, int(rng.integers(1, 5000)), dtype=np.uint8).tobytes()
+        packets.append((Packet(packet_type, payload, 1_000_000 + i * interval_us), (i // 3 + 1) * 3 * interval_us))
+    return packets
+
+def write_capture(path: str, packets, close: bool = True) -> CaptureWriter:
+    writer = CaptureWriter(path)
+    for packet, arrival in packets:
+        writer.write_packet(packet.header, memoryview(packet.payload), arrival_us=5_000_000 + arrival)
+    if close:
+        writer.close()
+    else:
+        writer._file.flush()
+    return writer
+
+def test_capture_roundtrip():
+    """تست ذخیره بایت به بایت جریان، ایندکس و زمان رسیدن"""
+    packets = make_packets()
+    wire = b''.join(packet.to_bytes() for packet, _ in packets)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'session.awscap')
+        write_capture(path, packets)
+        
+        with CaptureReader(path) as capture:
+            assert len(capture) == len(packets)
+            assert bytes(capture.data) == wire
+            assert capture.index['arrival_us'][1] - capture.index['arrival_us'][0] == 3000
+            header, payload = capture.packet(5)
+            assert header.packet_type == packets[5][0].header.packet_type
+            assert bytes(payload) == packets[5][0].payload
+            headers = capture.headers()
+            assert np.array_equal(headers['offset'], capture.index['offset'])
+            assert (headers['magic'] == MAGIC_NUMBER).all()
+            del header, payload
+        
+        # capture بسته نشده: ایندکس از روی هدرها ساخته می‌شود و بسته ناقص آخر کنار می‌رود
+        path = os.path.join(directory, 'crashed.awscap')
+        writer = write_capture(path, packets, close=False)
+        with open(path, 'ab') as f:
+            f.write(packets[1][0].to_bytes()[:30])
+        with CaptureReader(path) as capture:
+            assert len(capture) == len(packets)
+            assert bytes(capture.data) == wire
+            assert capture.index['arrival_us'][1] == 1_000_000
+        writer.close()
+    print("✓ capture roundtrip")
+
+def receive_all(port: int, expected: int, timeout: float = 10.0, capture_path: str = None):
+    """اتصال StreamReceiver به شبیه‌ساز و جمع‌آوری بسته‌ها از طریق packet sink"""
+    connection = ConnectionManager()
+    receiver = StreamReceiver(connection, pipelined=False, audio_jitter_buffer=False)
+    receiver.on_video_config = lambda config: None
+    receiver.on_video_frame = lambda data, timestamp, is_keyframe: None
+    receiver.on_audio_frame = lambda data, timestamp: None
+    if capture_path:
+        receiver.start_capture(capture_path)
+    received = []
+    done = threading.Event()
+    
+    def sink(header: PacketHeader, payload):
+        received.append((header.packet_type, header.timestamp, bytes(payload), time.perf_counter()))
+        if len(received) == expected:
+            done.set()
+    
+    receiver.add_packet_sink(sink)
+    assert connection.connect_wifi('127.0.0.1', port)
+    started = time.perf_counter()
+    receiver.start()
+    assert done.wait(timeout)
+    receiver.stop()
+    connection.disconnect()
+    return received, started
+
+def test_emulator_replay():
+    """تست پخش دوباره با سرعت حداکثر و با زمان‌بندی اصلی"""
+    packets = make_packets(300, interval_us=1000)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'session.awscap')
+        write_capture(path, packets)
+        
+        emulator = DeviceEmulator(path, '127.0.0.1', 0, realtime=False)
+        port = emulator.start()
+        recaptured = os.path.join(directory, 'recaptured.awscap')
+        received, _ = receive_all(port, len(packets), capture_path=recaptured)
+        assert [(t, ts, data) for t, ts, data, _ in received] == \
+               [(p.header.packet_type, p.header.timestamp, p.payload) for p, _ in packets]
+        emulator.stop()
+        assert emulator.get_stats()['packets_sent'] == len(packets)
+        # حالت capture گیرنده همان جریان را دوباره ذخیره می‌کند
+        with CaptureReader(path) as original, CaptureReader(recaptured) as capture:
+            assert len(capture) == len(packets)
+            assert bytes(capture.data) == bytes(original.data)
+        
+        # زمان‌بندی اصلی: 0.3 ثانیه بین اولین و آخرین بسته
+        emulator = DeviceEmulator(path, '127.0.0.1', 0, realtime=True)
+        port = emulator.start()
+        received, started = receive_all(port, len(packets))
+        emulator.stop()
+        span = received[-1][3] - received[0][3]
+        assert 0.25 <= span < 1.0
+        stats = emulator.get_stats()
+        assert stats['packets_sent'] == len(packets) and stats['sends'] <= len(packets) // 3 + 1
+        
+        # سرعت 3 برابر
+        emulator = DeviceEmulator(path, '127.0.0.1', 0, realtime=True, speed=3.0)
+        port = emulator.start()
+        received, _ = receive_all(port, len(packets))
+        emulator.stop()
+        assert received[-1][3] - received[0][3] < span / 2
+    print("✓ emulator replay")
+
+def test_emulator_unordered_arrivals():
+    """تست زمان رسیدن نامرتب (ایندکس بازسازی شده از timestamp دستگاه): هیچ بسته‌ای زودتر از موعد نمی‌رود"""
+    # بسته سوم 200ms جلوتر از بسته‌های بعد از خودش timestamp دارد
+    arrivals = [0, 50_000, 200_000] + [10_000] * 27
+    packets = [(packet, arrival) for (packet, _), arrival in zip(make_packets(30)[1:], arrivals)]
+    due = np.maximum.accumulate([arrival for _, arrival in packets]) - packets[0][1]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'unordered.awscap')
+        write_capture(path, packets)
+        emulator = DeviceEmulator(path, '127.0.0.1', 0, realtime=True)
+        port = emulator.start()
+        received, _ = receive_all(port, len(packets))
+        emulator.stop()
+    
+    assert [data for _, _, data, _ in received] == [packet.payload for packet, _ in packets]
+    first = received[0][3]
+    for (_, _, _, arrived), due_us in zip(received, due):
+        assert arrived - first >= due_us / 1e6 - 0.005
+    print("✓ emulator unordered arrivals")
+
+def test_emulator_empty_capture():
+    """تست capture بدون بسته: خطای روشن هنگام ساخت شبیه‌ساز، نه IndexError هنگام پخش"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'empty.awscap')
+        write_capture(path, [])
+        with CaptureReader(path) as capture:
+            assert len(capture) == 0 and len(capture.headers()) == 0
+        try:
+            DeviceEmulator(path, '127.0.0.1', 0)
+            assert False, "empty capture accepted"
+        except ValueError as e:
+            assert 'no packets' in str(e)
+    print("✓ emulator empty capture")
+
+def main():
+    print("\n" + "="*60)
+    print("تست capture و شبیه‌ساز دستگاه")
+    print("="*60)
+    test_capture_roundtrip()
+    test_emulator_replay()
+    test_emulator_unordered_arrivals()
+    test_emulator_empty_capture()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+تست آمار اتصال: تعداد recv، بایت‌های دریافتی و کپی شده از طریق get_stats و reset_stats
+"""
+import socket
+from protocol import Packet, PacketType
+from streaming.connection import ConnectionManager
+from streaming.receiver import StreamReceiver
+
+def connected_pair():
+    """ConnectionManager روی یک سر socketpair؛ سر دیگر نقش گوشی را دارد"""
+    phone, host = socket.socketpair()
+    connection = ConnectionManager()
+    connection.socket = host
+    connection.is_connected = True
+    return connection, phone
+
+def test_recv_stats():
+    """تست شمارش هر recv_into و بایت‌ها، صفر شدن با reset_stats و None پس از بسته شدن اتصال"""
+    connection, phone = connected_pair()
+    buffer = bytearray(1024)
+    view = memoryview(buffer)
+    
+    phone.sendall(b'x' * 100)
+    assert connection.receive_into(view) == 100
+    phone.sendall(b'y' * 50)
+    assert connection.receive_into(view[100:]) == 50
+    assert buffer[:150] == b'x' * 100 + b'y' * 50
+    assert connection.get_stats() == {'recv_calls': 2, 'bytes_received': 150}
+    
+    connection.reset_stats()
+    assert connection.get_stats() == {'recv_calls': 0, 'bytes_received': 0}
+    
+    phone.close()
+    assert connection.receive_into(view) is None
+    assert not connection.is_connected and connection.get_stats()['recv_calls'] == 1
+    print("✓ recv stats")
+
+def test_receiver_copy_stats():
+    """تست bytes_copied در آمار receiver: فقط کپی payload برای صف و فشرده‌سازی framer"""
+    connection, phone = connected_pair()
+    receiver = StreamReceiver(connection, audio_jitter_buffer=False)
+    receiver.on_video_frame = lambda data, timestamp, is_keyframe: None
+    payloads = [bytes([i]) * (1000 + i) for i in range(3)]
+    phone.sendall(b''.join(Packet(PacketType.VIDEO_FRAME, payload, i).to_bytes()
+                           for i, payload in enumerate(payloads)))
+    
+    packets = receiver.framer.read_packets()
+    assert len(packets) == 3
+    for header, payload in packets:
+        receiver._handle_packet(header, payload)
+    
+    stats = receiver.get_stats()
+    assert stats['recv_calls'] == 1 and stats['bytes_received'] == sum(len(p) + 21 for p in payloads)
+    # صف ویدیو از هر payload یک کپی نگه می‌دارد؛ خود اتصال چیزی کپی نمی‌کند
+    assert stats['bytes_copied'] == sum(len(p) for p in payloads)
+    assert [item[1][0] for item in receiver.video_stage._queue] == payloads
+    
+    connection.reset_stats()
+    assert receiver.get_stats()['recv_calls'] == 0
+    phone.close()
+    connection.socket.close()
+    print("✓ receiver copy stats")
+
+def main():
+    print("\n" + "="*60)
+    print("تست آمار اتصال")
+    print("="*60)
+    test_recv_stats()
+    test_receiver_copy_stats()
+
+if __name__ == "__main__":
+    main()
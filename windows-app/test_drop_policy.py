@@ -0,0 +1,97 @@
+"""
+تست FrameDropPolicy: حذف فریم‌های غیرمرجع، حذف تا IDR بعدی و آمار تاخیر جبران شده
+"""
+from streaming.drop_policy import FrameDropPolicy
+
+FRAME_US = 10_000
+
+# access unitهای Annex-B ساختگی: فقط هدر NAL برای دسته‌بندی لازم است
+IDR = b'\x00\x00\x00\x01\x67sps\x00\x00\x00\x01\x68pps\x00\x00\x01\x65idr'
+P = b'\x00\x00\x00\x01\x41p-slice'
+B = b'\x00\x00\x00\x01\x01b-slice'
+
+def decode(policy: FrameDropPolicy, frames):
+    """frames: لیست (access unit، timestamp)؛ خروجی: timestampهای دیکود شده"""
+    return [timestamp for data, timestamp in frames if policy.should_decode(data, timestamp)]
+
+def test_non_reference_dropped_first():
+    """تست حذف فقط فریم‌های غیرمرجع تا وقتی عقب‌ماندگی زیر حد برگردد"""
+    policy = FrameDropPolicy(max_latency_ms=100)
+    policy.on_arrival(150_000)
+    policy.on_arrival(120_000)
+    assert policy.latest_timestamp == 150_000
+    
+    frames = [(IDR, 0), (B, 10_000), (B, 20_000), (B, 60_000), (P, 70_000)]
+    assert decode(policy, frames) == [0, 60_000, 70_000]
+    stats = policy.get_stats()
+    assert not stats['dropping'] and stats['drop_episodes'] == 0
+    assert stats['frames_dropped'] == 2 and stats['latency_recovered_ms'] == 20.0
+    assert stats['max_backlog_ms'] == 150.0
+    print("✓ non-reference dropped first")
+
+def test_drop_until_idr():
+    """تست حذف همه فریم‌ها پس از حذف یک فریم مرجع و ادامه دیکود از IDR بعدی"""
+    policy = FrameDropPolicy(max_latency_ms=100)
+    policy.on_arrival(300_000)
+    frames = [(IDR, 0), (P, 10_000), (B, 20_000), (P, 30_000), (IDR, 40_000)]
+    assert decode(policy, frames) == [0, 40_000]
+    assert not policy.dropping
+    
+    # بعد از IDR و با عقب‌ماندگی کم، فریم‌های مرجع دوباره دیکود می‌شوند
+    policy.on_arrival(330_000)
+    assert decode(policy, [(P, 320_000), (B, 330_000)]) == [320_000, 330_000]
+    
+    stats = policy.get_stats()
+    assert stats['frames_dropped'] == 3 and stats['drop_episodes'] == 1
+    # هر فریم حذف شده به اندازه فاصله‌اش تا فریم قبلی از تاخیر کم می‌کند
+    assert policy.latency_recovered_us == 3 * FRAME_US
+    print("✓ drop until IDR")
+
+def test_frame_lost():
+    """تست on_frame_lost (سرریز صف): حذف تا IDR حتی بدون عقب‌ماندگی"""
+    policy = FrameDropPolicy(max_latency_ms=100)
+    policy.on_arrival(0)
+    assert decode(policy, [(IDR, 0)]) == [0]
+    
+    policy.on_frame_lost()
+    policy.on_frame_lost()
+    assert policy.dropping and policy.drop_episodes == 1
+    policy.on_arrival(40_000)
+    frames = [(P, 20_000), (B, 30_000), (IDR, 40_000), (P, 50_000)]
+    assert decode(policy, frames) == [40_000, 50_000]
+    
+    stats = policy.get_stats()
+    assert stats['frames_dropped'] == 2 and not stats['dropping']
+    # فاصله از فریم آخر دیکود شده (20ms) و فریم بعدی (10ms)
+    assert stats['latency_recovered_ms'] == 30.0
+    
+    policy.reset()
+    stats = policy.get_stats()
+    assert stats['frames_dropped'] == 0 and stats['drop_episodes'] == 0
+    assert stats['latency_recovered_ms'] == 0 and policy.latest_timestamp is None
+    print("✓ frame lost")
+
+def test_disabled():
+    """تست غیرفعال بودن: هیچ فریمی حذف نمی‌شود، ورودی memoryview هم پذیرفته می‌شود"""
+    policy = FrameDropPolicy(max_latency_ms=100, enabled=False)
+    policy.on_arrival(1_000_000)
+    frames = [(IDR, 0), (memoryview(P), 10_000), (B, 20_000)]
+    assert decode(policy, frames) == [0, 10_000, 20_000]
+    assert policy.get_stats()['frames_dropped'] == 0
+    
+    policy.enabled = True
+    assert decode(policy, [(memoryview(B), 30_000), (memoryview(P), 40_000)]) == []
+    assert policy.dropping and policy.latency_recovered_us == 2 * FRAME_US
+    print("✓ disabled")
+
+def main():
+    print("\n" + "="*60)
+    print("تست FrameDropPolicy")
+    print("="*60)
+    test_non_reference_dropped_first()
+    test_drop_until_idr()
+    test_frame_lost()
+    test_disabled()
+
+if __name__ == "__main__":
+    main()
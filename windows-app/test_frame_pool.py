@@ -0,0 +1,124 @@
+"""
+تست pool بافرهای فریم: بدون تخصیص حافظه بزرگ در حالت پایدار استریم
+"""
+import gc
+import tracemalloc
+from fractions import Fraction
+import av
+import numpy as np
+from streaming.buffer_pool import FrameBufferPool
+from streaming.decoder import VideoDecoder
+from streaming.frames import FrameConverter
+from streaming.h264 import index_nal_units, NAL_IDR
+
+WIDTH = 1280
+HEIGHT = 720
+FRAME_BYTES = WIDTH * HEIGHT * 3
+
+def encode_test_stream(frame_count: int):
+    """ساخت استریم H.264 مصنوعی با PyAV؛ خروجی: (config, access units)"""
+    codec = av.CodecContext.create('libx264', 'w')
+    codec.width = WIDTH
+    codec.height = HEIGHT
+    codec.pix_fmt = 'yuv420p'
+    codec.time_base = Fraction(1, 30)
+    codec.options = {'tune': 'zerolatency', 'bf': '0'}
+    codec.open()
+    
+    packets = []
+    for i in range(frame_count):
+        image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        image[:, (i * 8) % WIDTH] = 255
+        frame = av.VideoFrame.from_ndarray(image, format='rgb24').reformat(format='yuv420p')
+        frame.pts = i
+        packets.extend(bytes(p) for p in codec.encode(frame))
+    packets.extend(bytes(p) for p in codec.encode(None))
+    
+    first = packets[0]
+    idr = next(unit for unit in index_nal_units(first) if unit.nal_type == NAL_IDR)
+    return first[:idr.offset - 3], packets
+
+def test_lease_release():
+    """تست شمارش ارجاع: بافر فقط پس از آخرین release به pool برمی‌گردد"""
+    pool = FrameBufferPool()
+    buffer = pool.lease((4, 4, 3))
+    buffer.retain()
+    buffer.release()
+    assert pool.get_stats()['free'] == 0
+    buffer.release()
+    assert pool.get_stats()['free'] == 1
+    
+    again = pool.lease((4, 4, 3))
+    assert again is buffer
+    assert pool.get_stats()['allocations'] == 1
+    print("✓ lease/release")
+
+def test_idle_bytes_capped():
+    """تست سقف حافظه بافرهای بیکار: اندازه‌های قدیمی (تغییر اندازه پیش‌نمایش) آزاد می‌شوند"""
+    pool = FrameBufferPool(max_free_bytes=10 * FRAME_BYTES)
+    for width in range(WIDTH - 200, WIDTH):
+        buffers = [pool.lease((HEIGHT, width, 3)) for _ in range(3)]
+        for buffer in buffers:
+            buffer.release()
+    stats = pool.get_stats()
+    assert stats['free_bytes'] <= 10 * FRAME_BYTES and stats['evictions'] > 0
+    
+    # آخرین اندازه هنوز بدون تخصیص دوباره استفاده می‌شود
+    allocations = stats['allocations']
+    pool.lease((HEIGHT, WIDTH - 1, 3)).release()
+    assert pool.get_stats()['allocations'] == allocations
+    print("✓ idle bytes capped")
+
+def test_steady_state_allocations():
+    """تست tracemalloc: decode و تبدیل رنگ در حالت پایدار حافظه بزرگ تخصیص نمی‌دهد"""
+    config, packets = encode_test_stream(60)
+    pool = FrameBufferPool()
+    decoder = VideoDecoder(mode='single')
+    decoder.converter = FrameConverter(pool)
+    
+    retained = []
+    def native_sink(frame):
+        # مصرف‌کننده async: فریم را نگه می‌دارد و بعداً آزاد می‌کند
+        frame.to_ndarray('rgb24')
+        retained.append(frame.retain())
+        if len(retained) > 2:
+            retained.pop(0).release()
+    
+    checksum = []
+    decoder.add_sink(native_sink)
+    decoder.add_sink(lambda image: checksum.append(int(image[0, 0, 0])), 'rgb24')
+    decoder.set_config(config)
+    
+    for i, data in enumerate(packets[:20]):
+        decoder.decode(data, i, False)
+    
+    gc.collect()
+    allocations_before = pool.get_stats()['allocations']
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    for i, data in enumerate(packets[20:], start=20):
+        decoder.decode(data, i, False)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    for frame in retained:
+        frame.release()
+    decoder.close()
+    
+    stats = pool.get_stats()
+    print(f"  pool: {stats}, traced peak growth: {(peak - baseline) / 1024:.0f} KB")
+    assert stats['allocations'] == allocations_before
+    assert peak - baseline < FRAME_BYTES // 4
+    assert len(checksum) == len(packets)
+    print("✓ steady-state allocations")
+
+def main():
+    print("\n" + "="*60)
+    print("تست Frame Buffer Pool")
+    print("="*60)
+    test_lease_release()
+    test_idle_bytes_capped()
+    test_steady_state_allocations()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+تست ring حافظه مشترک فریم و خواننده جایگزین (قابل اجرا روی Linux)
+"""
+import os
+import struct
+import numpy as np
+from multiprocessing import shared_memory
+from virtual_camera.frame_ring import SharedFrameRing, SharedFrameRingReader, RING_HEADER_SIZE
+from virtual_camera.virtucore_camera import VirtuCoreCamera, FORMAT_RGB24, FORMAT_NV12
+
+def ring_name(suffix: str) -> str:
+    return f"vcam_test_{os.getpid()}_{suffix}"
+
+def test_roundtrip_and_skip():
+    """تست نوشتن و خواندن آخرین فریم، و شمارش فریم‌های رد شده"""
+    ring = SharedFrameRing(ring_name('rt'), slot_count=3, slot_capacity=4096)
+    reader = SharedFrameRingReader(ring.name)
+    try:
+        assert reader.read_latest() is None
+        
+        frames = [np.full(1000 + i, i, dtype=np.uint8) for i in range(5)]
+        ring.write_frame(frames[0], 10, 10, FORMAT_RGB24, 100)
+        seq, (width, height, fmt, timestamp), data = reader.read_latest()
+        assert (seq, width, height, fmt, timestamp) == (1, 10, 10, FORMAT_RGB24, 100)
+        assert np.array_equal(data, frames[0])
+        assert reader.read_latest() is None
+        
+        # نویسنده منتظر خواننده نمی‌ماند: خواننده فقط آخرین فریم را می‌بیند
+        for i in range(1, 5):
+            ring.write_frame(frames[i], 10, 10, FORMAT_RGB24, 100 + i)
+        seq, _, data = reader.read_latest()
+        assert seq == 5 and np.array_equal(data, frames[4])
+        assert reader.get_stats()['frames_skipped'] == 3
+        print("✓ roundtrip and skip")
+    finally:
+        reader.close()
+        ring.close()
+
+def test_slot_being_written_is_ignored():
+    """تست seqlock: slot با seq فرد (در حال نوشتن) خوانده نمی‌شود"""
+    ring = SharedFrameRing(ring_name('seq'), slot_count=2, slot_capacity=64)
+    reader = SharedFrameRingReader(ring.name)
+    try:
+        ring.write_frame(b'\x01' * 64, 8, 8, FORMAT_RGB24, 1)
+        # شبیه‌سازی نویسنده‌ای که وسط بازنویسی همین slot است
+        struct.pack_into('<Q', ring.buf, RING_HEADER_SIZE, 1)
+        assert reader.read_latest() is None
+        assert reader.get_stats()['torn_reads'] == 3
+        print("✓ slot being written is ignored")
+    finally:
+        reader.close()
+        ring.close()
+
+def test_camera_writes_in_place():
+    """تست VirtuCoreCamera با ring: صفحه‌های NV12 مستقیماً در slot نوشته می‌شوند"""
+    ring = SharedFrameRing(ring_name('cam'), slot_count=3, slot_capacity=64 * 48 * 3)
+    reader = SharedFrameRingReader(ring.name)
+    camera = VirtuCoreCamera(frame_ring=ring)
+    try:
+        assert camera.open()
+        assert camera.negotiate_format(64, 48) == FORMAT_NV12
+        
+        rng = np.random.default_rng(1)
+        y = rng.integers(0, 255, (48, 64), dtype=np.uint8)
+        uv = rng.integers(0, 255, (24, 64), dtype=np.uint8)
+        assert camera.send_planes((y, uv), 'nv12', timestamp=42)
+        
+        seq, (width, height, fmt, timestamp), data = reader.read_latest()
+        assert (width, height, fmt, timestamp) == (64, 48, FORMAT_NV12, 42)
+        assert np.array_equal(data, np.concatenate([y.reshape(-1), uv.reshape(-1)]))
+        assert camera.get_stats()['bytes_copied_per_frame'] == 64 * 48 * 3 // 2
+        print("✓ camera writes in place")
+    finally:
+        camera.close()
+        reader.close()
+        ring.close()
+
+def test_attach_keeps_header():
+    """تست اتصال با create=False: header و فریم‌های موجود دست نمی‌خورند و شماره ترتیب ادامه پیدا می‌کند"""
+    ring = SharedFrameRing(ring_name('attach'), slot_count=3, slot_capacity=256)
+    reader = SharedFrameRingReader(ring.name)
+    attached = None
+    try:
+        ring.write_frame(b'\x01' * 100, 10, 10, FORMAT_RGB24, 1)
+        ring.write_frame(b'\x02' * 100, 10, 10, FORMAT_RGB24, 2)
+        
+        # چیدمان از header خوانده می‌شود، نه از پارامترهای پیش‌فرض
+        attached = SharedFrameRing(ring.name, create=False)
+        assert (attached.slot_count, attached.slot_capacity) == (3, 256)
+        assert attached.seq == 2 and reader.latest_seq() == 2
+        seq, (_, _, _, timestamp), data = reader.read_latest()
+        assert seq == 2 and timestamp == 2 and bytes(data) == b'\x02' * 100
+        
+        assert attached.write_frame(b'\x03' * 100, 10, 10, FORMAT_RGB24, 3) == 3
+        seq, _, data = reader.read_latest()
+        assert seq == 3 and bytes(data) == b'\x03' * 100
+        print("✓ attach keeps header")
+    finally:
+        if attached is not None:
+            attached.close()
+        reader.close()
+        ring.close()
+
+def test_existing_segment():
+    """تست segment هم‌نام: ring باقی‌مانده جایگزین می‌شود، segment دیگر حذف نمی‌شود و خطا می‌دهد"""
+    stale = SharedFrameRing(ring_name('stale'), slot_count=2, slot_capacity=64)
+    stale.write_frame(b'\x01' * 64, 8, 8, FORMAT_RGB24, 1)
+    ring = SharedFrameRing(stale.name, slot_count=3, slot_capacity=128)
+    try:
+        reader = SharedFrameRingReader(ring.name)
+        assert reader.latest_seq() == 0 and (reader.slot_count, reader.slot_capacity) == (3, 128)
+        reader.close()
+    finally:
+        # segment قبلی حذف شده؛ close آن نباید خطا بدهد
+        stale.close()
+        ring.close()
+    
+    foreign = shared_memory.SharedMemory(name=ring_name('foreign'), create=True, size=4096)
+    try:
+        foreign.buf[:4] = b'data'
+        for create in (True, False):
+            try:
+                SharedFrameRing(foreign.name, slot_count=2, slot_capacity=64, create=create)
+                assert False, "foreign segment accepted"
+            except (FileExistsError, ValueError) as e:
+                assert "not a frame ring" in str(e)
+                assert isinstance(e, FileExistsError if create else ValueError)
+        assert bytes(foreign.buf[:4]) == b'data'
+        print("✓ existing segment")
+    finally:
+        foreign.close()
+        foreign.unlink()
+
+def main():
+    print("\n" + "="*60)
+    print("تست ring حافظه مشترک فریم")
+    print("="*60)
+    test_roundtrip_and_skip()
+    test_slot_being_written_is_ignored()
+    test_camera_writes_in_place()
+    test_attach_keeps_header()
+    test_existing_segment()
+
+if __name__ == "__main__":
+    main()
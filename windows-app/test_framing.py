@@ -0,0 +1,120 @@
+"""
+تست PacketFramer با اتصال ساختگی: بسته‌های تکه‌تکه، همگام‌سازی مجدد، فشرده‌سازی و بزرگ شدن بافر
+"""
+import struct
+from protocol import Packet, PacketType, HEADER_STRUCT, MAGIC_NUMBER
+from streaming.framing import PacketFramer
+
+class FakeConnection:
+    """هر receive_into یک تکه از chunks را برمی‌گرداند؛ در پایان None (اتصال بسته شده)"""
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+    
+    def receive_into(self, view) -> int:
+        if not self.chunks:
+            return None
+        chunk = self.chunks.pop(0)
+        n = min(len(chunk), len(view))
+        view[:n] = chunk[:n]
+        if n < len(chunk):
+            self.chunks.insert(0, chunk[n:])
+        return n
+
+def packet(payload: bytes, timestamp: int = 0, packet_type: PacketType = PacketType.VIDEO_FRAME) -> bytes:
+    return Packet(packet_type, payload, timestamp, timestamp).to_bytes()
+
+def read_all(framer: PacketFramer):
+    """خواندن تا بسته شدن اتصال؛ خروجی: payload و timestamp هر بسته و تعداد بسته‌های هر خواندن"""
+    packets = []
+    per_read = []
+    while True:
+        result = framer.read_packets()
+        if result is None:
+            return packets, per_read
+        per_read.append(len(result))
+        packets.extend((bytes(payload), header.timestamp) for header, payload in result)
+
+def test_split_reads():
+    """تست هدر و payload که در چند خواندن جدا می‌رسند"""
+    data = packet(b'a' * 100, 1) + packet(b'b' * 50, 2)
+    # هدر بسته اول بعد از 10 بایت، payload آن در وسط و بسته دوم کامل
+    chunks = [data[:10], data[10:60], data[60:121], data[121:]]
+    framer = PacketFramer(FakeConnection(chunks))
+    packets, per_read = read_all(framer)
+    assert packets == [(b'a' * 100, 1), (b'b' * 50, 2)]
+    assert per_read == [0, 0, 1, 1]
+    assert framer.get_stats()['resyncs'] == 0
+    
+    # یک خواندن که چند بسته و نیمه بسته بعدی را دارد
+    data = b''.join(packet(bytes([i]) * 30, i) for i in range(5))
+    framer = PacketFramer(FakeConnection([data[:140], data[140:]]))
+    packets, per_read = read_all(framer)
+    assert [t for _, t in packets] == list(range(5)) and per_read == [2, 3]
+    print("✓ split reads")
+
+def test_resync_and_invalid_headers():
+    """تست رد کردن داده خراب قبل از magic، نوع نامعتبر و payload بزرگتر از MAX_PAYLOAD_SIZE"""
+    garbage = b'\x00\x01junk' + struct.pack('>I', MAGIC_NUMBER)[:3] + b'xyz'
+    bad_type = HEADER_STRUCT.pack(MAGIC_NUMBER, 0x77, 4, 0, 0) + b'....'
+    too_large = HEADER_STRUCT.pack(MAGIC_NUMBER, PacketType.VIDEO_FRAME,
+                                   PacketFramer.MAX_PAYLOAD_SIZE + 1, 0, 0)
+    
+    for prefix in (garbage, bad_type, too_large):
+        data = prefix + packet(b'frame', 7) + packet(b'next', 8)
+        framer = PacketFramer(FakeConnection([data]))
+        packets, _ = read_all(framer)
+        stats = framer.get_stats()
+        assert packets == [(b'frame', 7), (b'next', 8)], prefix
+        assert stats['resyncs'] >= 1 and stats['bytes_discarded'] == len(prefix), prefix
+    
+    # magic ناقص در انتهای خواندن نگه داشته می‌شود تا خواندن بعدی کاملش کند
+    data = garbage * 3 + packet(b'frame', 7)
+    split = len(garbage) * 3 + 2
+    framer = PacketFramer(FakeConnection([data[:split], data[split:]]))
+    packets, _ = read_all(framer)
+    assert packets == [(b'frame', 7)] and framer.bytes_discarded == len(garbage) * 3
+    print("✓ resync and invalid headers")
+
+def test_compaction():
+    """تست انتقال نیمه بسته انتهایی به ابتدای بافر وقتی جای خالی کمتر از MIN_READ_SIZE است"""
+    buffer_size = 128 * 1024
+    data = b''.join(packet(bytes([i % 256]) * 1000, i) for i in range(120))
+    first = 100 * 1024
+    framer = PacketFramer(FakeConnection([data[:first], data[first:]]), buffer_size=buffer_size)
+    
+    assert len(framer.read_packets()) == first // 1021
+    partial = first % 1021
+    assert framer.bytes_compacted == 0
+    
+    packets = framer.read_packets()
+    assert framer.bytes_compacted == partial
+    assert [header.timestamp for header, _ in packets] == list(range(first // 1021, 120))
+    assert bytes(packets[0][1]) == bytes([first // 1021]) * 1000
+    assert framer.get_stats()['buffer_size'] == buffer_size
+    print("✓ compaction")
+
+def test_buffer_growth():
+    """تست بزرگ شدن بافر برای payload بزرگتر از 1MB بدون از دست رفتن داده نیمه خوانده شده"""
+    payload = bytes(range(256)) * (6 * 1024)
+    assert len(payload) > PacketFramer.DEFAULT_BUFFER_SIZE
+    data = packet(b'small', 1) + packet(payload, 2) + packet(b'after', 3)
+    chunks = [data[i:i + 256 * 1024] for i in range(0, len(data), 256 * 1024)]
+    framer = PacketFramer(FakeConnection(chunks))
+    packets, _ = read_all(framer)
+    
+    assert packets == [(b'small', 1), (payload, 2), (b'after', 3)]
+    stats = framer.get_stats()
+    assert stats['buffer_size'] >= len(payload) + 21 and stats['resyncs'] == 0
+    print("✓ buffer growth")
+
+def main():
+    print("\n" + "="*60)
+    print("تست PacketFramer")
+    print("="*60)
+    test_split_reads()
+    test_resync_and_invalid_headers()
+    test_compaction()
+    test_buffer_growth()
+
+if __name__ == "__main__":
+    main()
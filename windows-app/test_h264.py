@@ -0,0 +1,89 @@
+"""
+تست تجزیه H.264: start code سه و چهار بایتی، دسته‌بندی access unit، viewهای بدون کپی و رزولوشن SPS
+"""
+from streaming.h264 import (iter_nal_headers, index_nal_units, split_nal_units, classify_access_unit,
+                            access_unit_info, is_keyframe, parse_sps_resolution, CLASSIFY_PREFIX_SIZE,
+                            NAL_SPS, NAL_PPS, NAL_IDR, NAL_AUD, NAL_SEI, NAL_SLICE)
+from test_recorder import encode_video
+
+SC4 = b'\x00\x00\x00\x01'
+SC3 = b'\x00\x00\x01'
+
+def test_start_codes():
+    """تست start code چهار و سه بایتی: offset هدر، نوع و اندازه بدون صفرهای start code بعدی"""
+    data = SC4 + b'\x67sps' + SC3 + b'\x68pp' + SC4 + b'\x65idr-slice'
+    headers = list(iter_nal_headers(data))
+    assert [offset for offset, _ in headers] == [4, 11, 18]
+    assert [header & 0x1F for _, header in headers] == [NAL_SPS, NAL_PPS, NAL_IDR]
+    
+    units = index_nal_units(data)
+    assert [(unit.offset, unit.size) for unit in units] == [(4, 4), (11, 3), (18, 10)]
+    assert [unit.ref_idc for unit in units] == [3, 3, 3]
+    assert [bytes(unit) for unit in split_nal_units(data)] == [b'\x67sps', b'\x68pp', b'\x65idr-slice']
+    
+    # start code در انتها بدون هدر NAL نادیده گرفته می‌شود
+    assert len(index_nal_units(data + SC3)) == 3 and index_nal_units(b'no start code') == []
+    print("✓ start codes")
+
+def test_classify_access_unit():
+    """تست AUD قبل از slice، IDR بدون SPS درون باند و slice غیرمرجع"""
+    info = classify_access_unit(SC4 + b'\x09\xf0' + SC4 + b'\x06sei' + SC3 + b'\x41p-slice')
+    assert not info.is_idr and info.is_reference
+    assert info.has_aud and info.has_sei and not info.has_sps
+    
+    info = classify_access_unit(SC4 + b'\x65idr-slice')
+    assert info.is_idr and info.is_reference and not info.has_sps and not info.has_pps
+    assert is_keyframe(SC4 + b'\x65idr')
+    
+    assert access_unit_info(SC3 + b'\x01b-slice') == (False, False)
+    # بدون slice (فقط config یا خالی) چیزی گزارش نمی‌شود
+    assert not any(classify_access_unit(SC4 + b'\x67sps' + SC4 + b'\x68pps'))
+    assert not is_keyframe(b'')
+    
+    # slice اول بعد از CLASSIFY_PREFIX_SIZE: دسته‌بندی از روی کل داده
+    sei = SC4 + bytes([NAL_SEI]) + b'\xff' * CLASSIFY_PREFIX_SIZE
+    data = bytearray(sei + SC3 + b'\x65idr' + SC3 + b'\x41p')
+    info = classify_access_unit(memoryview(data))
+    assert info.is_idr and info.has_sei
+    assert classify_access_unit(memoryview(data)[len(sei):]).is_idr
+    print("✓ classify access unit")
+
+def test_split_views():
+    """تست اینکه split_nal_units برای memoryview، view روی بافر اصلی برمی‌گرداند نه کپی"""
+    buffer = bytearray(b'header' + SC4 + b'\x09\xf0' + SC3 + b'\x41p-slice')
+    view = memoryview(buffer)[6:]
+    units = split_nal_units(view)
+    assert [unit.tobytes() for unit in units] == [b'\x09\xf0', b'\x41p-slice']
+    assert all(isinstance(unit, memoryview) for unit in units)
+    
+    # تغییر بافر اصلی در view دیده می‌شود
+    buffer[-1] = ord('X')
+    assert units[1].tobytes() == b'\x41p-slicX'
+    assert [NAL_AUD, NAL_SLICE] == [unit.nal_type for unit in index_nal_units(view)]
+    print("✓ split views")
+
+def test_sps_resolution():
+    """تست رزولوشن SPS با cropping (ارتفاع 1080 از 1088 و اندازه‌های غیر مضرب 16)"""
+    for width, height in ((320, 240), (1920, 1080), (322, 242)):
+        config, _ = encode_video(1, width, height)
+        assert parse_sps_resolution(config) == (width, height)
+        assert parse_sps_resolution(memoryview(bytearray(config))) == (width, height)
+    
+    try:
+        parse_sps_resolution(SC4 + b'\x68pps')
+        assert False, "missing SPS accepted"
+    except ValueError:
+        pass
+    print("✓ sps resolution")
+
+def main():
+    print("\n" + "="*60)
+    print("تست تجزیه H.264")
+    print("="*60)
+    test_start_codes()
+    test_classify_access_unit()
+    test_split_views()
+    test_sps_resolution()
+
+if __name__ == "__main__":
+    main()
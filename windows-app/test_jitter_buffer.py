@@ -0,0 +1,112 @@
+"""
+تست jitter buffer صدا با زمان شبیه‌سازی شده و thread پخش
+"""
+import time
+import numpy as np
+from streaming.jitter_buffer import AudioJitterBuffer
+
+FRAME_US = 1024 * 1e6 / 48000
+
+def run(arrivals, step_us: float = 1000, **options):
+    """arrivals: لیست (زمان رسیدن، timestamp)؛ رویدادها با گام step_us اجرا می‌شوند"""
+    buffer = AudioJitterBuffer(**options)
+    played = []
+    buffer.on_packet = lambda data, timestamp: played.append(('play', timestamp))
+    buffer.on_conceal = lambda timestamp: played.append(('conceal', timestamp))
+    
+    arrivals = sorted(arrivals)
+    now = arrivals[0][0]
+    index = 0
+    while index < len(arrivals) or buffer.get_stats()['queued']:
+        while index < len(arrivals) and arrivals[index][0] <= now:
+            arrival, timestamp = arrivals[index]
+            buffer.push(b'aac', timestamp, arrival)
+            index += 1
+        buffer.pump(now)
+        now += step_us
+    return buffer, played
+
+def timestamps(count: int):
+    return [int(i * FRAME_US) for i in range(count)]
+
+def test_reorder_and_conceal():
+    """تست مرتب‌سازی بر اساس timestamp و پنهان‌سازی فریم گم‌شده"""
+    ts = timestamps(20)
+    arrivals = [(1e6 + t + 5000, t) for t in ts if t != ts[10]]
+    # فریم 5 با 30ms تاخیر و بعد از فریم 6 می‌رسد
+    arrivals[5] = (arrivals[5][0] + 30000, ts[5])
+    assert arrivals[5][0] > arrivals[6][0]
+    
+    buffer, played = run(arrivals, min_delay_ms=40)
+    assert [t for kind, t in played if kind == 'play'] == [t for t in ts if t != ts[10]]
+    assert ('conceal', ts[10]) in played
+    stats = buffer.get_stats()
+    assert stats['concealments'] == 1 and stats['late_packets'] == 0
+    print("✓ reorder and conceal")
+
+def test_late_packet_dropped():
+    """تست فریمی که بعد از زمان پخشش می‌رسد"""
+    ts = timestamps(20)
+    arrivals = [(1e6 + t + 5000, t) for t in ts]
+    arrivals[8] = (arrivals[8][0] + 200000, ts[8])
+    
+    buffer, played = run(arrivals, max_delay_ms=40)
+    stats = buffer.get_stats()
+    assert stats['late_packets'] == 1
+    assert ('conceal', ts[8]) in played and ('play', ts[8]) not in played
+    print("✓ late packet dropped")
+
+def test_delay_follows_jitter():
+    """تست تطبیق تاخیر: با jitter کم نزدیک حداقل، با jitter زیاد بیشتر و بدون فریم دیررس"""
+    rng = np.random.default_rng(3)
+    ts = timestamps(1500)
+    
+    calm, _ = run([(1e6 + t + 5000 + rng.uniform(0, 2000), t) for t in ts])
+    assert calm.get_stats()['delay_ms'] == 20.0
+    
+    noisy_arrivals = [(1e6 + t + 5000 + rng.uniform(0, 50000), t) for t in ts]
+    noisy, _ = run(noisy_arrivals)
+    stats = noisy.get_stats()
+    assert 50 <= stats['target_delay_ms'] <= 80
+    assert stats['delay_ms'] >= 50
+    # فریم‌های دیررس فقط پیش از اولین تخمین jitter
+    assert stats['late_packets'] <= 10
+    assert stats['frames_stretched'] >= 1
+    print("✓ delay follows jitter")
+
+def test_push_while_idle():
+    """تست thread پخش: بسته‌ای که بین pump بیکار و wait می‌رسد منتظر بسته بعدی نمی‌ماند"""
+    class RacingBuffer(AudioJitterBuffer):
+        pushed = False
+        def pump(self, now_us=None):
+            wait_us = super().pump(now_us)
+            if wait_us is None and not self.pushed:
+                # همان لحظه‌ای که thread دریافت بسته را اضافه می‌کند
+                self.pushed = True
+                self.push(b'aac', 0)
+            return wait_us
+    
+    buffer = RacingBuffer(min_delay_ms=20)
+    played = []
+    buffer.on_packet = lambda data, timestamp: played.append(timestamp)
+    buffer.start()
+    try:
+        deadline = time.monotonic() + 2.0
+        while not played and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        buffer.stop()
+    assert played == [0]
+    print("✓ push while idle")
+
+def main():
+    print("\n" + "="*60)
+    print("تست jitter buffer صدا")
+    print("="*60)
+    test_reorder_and_conceal()
+    test_late_packet_dropped()
+    test_delay_follows_jitter()
+    test_push_while_idle()
+
+if __name__ == "__main__":
+    main()
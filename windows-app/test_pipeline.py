@@ -0,0 +1,119 @@
+"""
+تست PipelineStage: سیاست‌های سرریز صف، آیتم‌های غیرقابل حذف و آمار انتظار/کار/مسدود شدن
+"""
+import time
+from threading import Event, Thread
+from streaming.pipeline import PipelineStage, OverflowPolicy
+from streaming.receiver import StreamReceiver
+
+def wait_until(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+def test_drop_policies():
+    """تست DROP_OLDEST و DROP_NEWEST روی صف پر (بدون thread کاری) و گزارش on_drop"""
+    for policy, kept in ((OverflowPolicy.DROP_OLDEST, [2, 3, 4]),
+                         (OverflowPolicy.DROP_NEWEST, [0, 1, 2])):
+        stage = PipelineStage('test', max_depth=3, overflow=policy)
+        dropped = []
+        stage.on_drop = lambda item: dropped.append(item[1][0])
+        results = [stage.submit(print, i) for i in range(5)]
+        
+        assert [item[1][0] for item in stage._queue] == kept, policy
+        assert sorted(dropped) == sorted(set(range(5)) - set(kept))
+        stats = stage.get_stats()
+        assert stats['dropped'] == 2 and stats['peak_depth'] == 3
+        if policy == OverflowPolicy.DROP_NEWEST:
+            assert results == [True, True, True, False, False] and stats['submitted'] == 3
+        else:
+            assert all(results) and stats['submitted'] == 5
+    
+    try:
+        PipelineStage('test', overflow='unknown')
+        assert False, "unknown policy accepted"
+    except ValueError:
+        pass
+    print("✓ drop policies")
+
+def test_non_droppable_accepted():
+    """تست پذیرش همیشگی آیتم‌های droppable=False (config) و حذف نشدنشان توسط DROP_OLDEST"""
+    for policy in (OverflowPolicy.BLOCK, OverflowPolicy.DROP_OLDEST, OverflowPolicy.DROP_NEWEST):
+        stage = PipelineStage('test', max_depth=2, overflow=policy)
+        assert stage.submit(print, 'config', droppable=False)
+        assert stage.submit(print, 0)
+        # صف پر است اما config باز هم پذیرفته می‌شود، حتی بدون thread کاری در حالت BLOCK
+        assert stage.submit(print, 'config', droppable=False)
+        assert stage.depth() == 3 and stage.dropped == 0
+        
+        if policy == OverflowPolicy.DROP_OLDEST:
+            # فقط فریم قدیمی حذف می‌شود، configها می‌مانند
+            assert stage.submit(print, 1)
+            assert [item[1][0] for item in stage._queue] == ['config', 'config', 1]
+    print("✓ non-droppable accepted")
+
+def test_block_and_metrics():
+    """تست BLOCK: submit تا خالی شدن جا منتظر می‌ماند و زمان انتظار، کار و مسدود شدن ثبت می‌شود"""
+    stage = PipelineStage('test', max_depth=1, overflow=OverflowPolicy.BLOCK)
+    release = Event()
+    processed = []
+    
+    def work(i):
+        release.wait()
+        time.sleep(0.01)
+        processed.append(i)
+    
+    stage.start()
+    try:
+        stage.submit(work, 0)
+        wait_until(lambda: stage.depth() == 0)
+        stage.submit(work, 1)
+        
+        # صف پر است: submit سوم تا آزاد شدن کار اول مسدود می‌ماند
+        submitter = Thread(target=lambda: stage.submit(work, 2))
+        submitter.start()
+        time.sleep(0.05)
+        assert submitter.is_alive() and stage.depth() == 1
+        release.set()
+        submitter.join(timeout=2.0)
+        assert not submitter.is_alive()
+        wait_until(lambda: len(processed) == 3)
+    finally:
+        stage.stop()
+    
+    stats = stage.get_stats()
+    assert processed == [0, 1, 2] and stats['dropped'] == 0
+    assert stats['submitted'] == 3 and stats['processed'] == 3
+    assert stats['blocked_ms'] >= 40
+    # کار اول 50ms منتظر release بوده؛ کار دوم همان قدر در صف مانده
+    assert stats['avg_busy_ms'] >= 10 and stats['max_wait_ms'] >= 40
+    
+    # بعد از توقف، submit مسدود به جای انتظار بی‌پایان False برمی‌گرداند
+    assert stage.submit(work, 3) and not stage.submit(work, 4)
+    print("✓ block and metrics")
+
+def test_receiver_video_overflow_default():
+    """تست سیاست پیش‌فرض صف ویدیو در StreamReceiver: حذف فریم و گزارش آن به FrameDropPolicy"""
+    receiver = StreamReceiver(connection_manager=None, video_queue_depth=2)
+    assert receiver.video_stage.overflow == OverflowPolicy.DROP_OLDEST
+    for i in range(3):
+        receiver._dispatch(receiver.video_stage, receiver._decode_video_frame, b'frame', i, False)
+    assert receiver.video_stage.dropped == 1
+    assert receiver.drop_policy.dropping and receiver.drop_policy.drop_episodes == 1
+    
+    blocking = StreamReceiver(connection_manager=None, video_overflow=OverflowPolicy.BLOCK)
+    assert blocking.video_stage.overflow == OverflowPolicy.BLOCK
+    print("✓ receiver video overflow default")
+
+def main():
+    print("\n" + "="*60)
+    print("تست PipelineStage")
+    print("="*60)
+    test_drop_policies()
+    test_non_droppable_accepted()
+    test_block_and_metrics()
+    test_receiver_video_overflow_default()
+
+if __name__ == "__main__":
+    main()
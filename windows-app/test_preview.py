@@ -0,0 +1,143 @@
+"""
+تست presenter پیش‌نمایش: mailbox تک‌خانه‌ای، ادغام با نرخ نمایش و بافرهای قابل استفاده مجدد
+"""
+import time
+import threading
+import av
+import cv2
+import numpy as np
+from streaming.buffer_pool import FrameBufferPool
+from streaming.frames import FrameConverter, DecodedFrame
+from ui.preview import PreviewPresenter
+
+def make_frame(width: int, height: int, value: int) -> np.ndarray:
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+def test_latest_frame_wins():
+    """تست اینکه GUI کند فقط یک به‌روزرسانی در صف دارد و همیشه جدیدترین فریم را می‌بیند"""
+    presenter = PreviewPresenter(refresh_hz=100)
+    presenter.set_target_size(320, 320)
+    ready = threading.Event()
+    notifications = []
+    
+    def on_ready():
+        notifications.append(time.monotonic())
+        ready.set()
+    presenter.on_frame_ready = on_ready
+    presenter.start()
+    try:
+        # GUI هیچ فریمی را نمایش نمی‌دهد: فقط یک اعلان، با وجود 50 فریم
+        start = time.monotonic()
+        for value in range(50):
+            presenter.submit(make_frame(640, 480, value))
+            time.sleep(0.001)
+        elapsed = time.monotonic() - start
+        assert ready.wait(1.0)
+        time.sleep(0.1)
+        assert len(notifications) == 1
+        
+        shown = []
+        assert presenter.present(lambda frame: shown.append(frame.copy()))
+        # نسبت تصویر حفظ می‌شود: 640x480 در 320x320 → 320x240
+        assert shown[0].shape == (240, 320, 3)
+        assert shown[0][0, 0, 0] == 49
+        
+        stats = presenter.get_stats()
+        assert stats['submitted'] == 50
+        assert stats['scaled'] + stats['coalesced'] == 50
+        # نرخ 100Hz: در مدت ارسال حداکثر یک فریم در هر 10ms مقیاس شده است
+        assert stats['scaled'] <= elapsed * 100 + 2
+    finally:
+        presenter.stop()
+    print(f"✓ latest frame wins ({stats['scaled']} of 50 scaled)")
+
+def test_buffers_reused():
+    """تست استفاده مجدد از دو بافر تا زمانی که اندازه هدف تغییر نکند"""
+    presenter = PreviewPresenter(refresh_hz=1000)
+    presenter.set_target_size(200, 100)
+    ready = threading.Semaphore(0)
+    presenter.on_frame_ready = ready.release
+    presenter.start()
+    buffers = set()
+    try:
+        for value in range(10):
+            presenter.submit(make_frame(400, 200, value))
+            assert ready.acquire(timeout=1.0)
+            presenter.present(lambda frame: buffers.add(id(frame)))
+        assert len(buffers) == 2
+        
+        presenter.set_target_size(100, 100)
+        presenter.submit(make_frame(400, 200, 0))
+        assert ready.acquire(timeout=1.0)
+        shown = []
+        presenter.present(lambda frame: shown.append(frame.shape))
+        assert shown == [(50, 100, 3)]
+    finally:
+        presenter.stop()
+    print("✓ buffers reused")
+
+def decoded_frame(width: int, height: int, pixel_format: str = 'yuv420p') -> DecodedFrame:
+    y, x = np.mgrid[0:height, 0:width]
+    image = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], -1).astype(np.uint8)
+    frame = av.VideoFrame.from_ndarray(image, format='rgb24').reformat(format=pixel_format)
+    return DecodedFrame(frame, 0, FrameConverter(FrameBufferPool()))
+
+def test_reduced_size_conversion():
+    """تست تبدیل مستقیم در اندازه کوچک: نزدیک به تبدیل کامل + کوچک‌سازی"""
+    for pixel_format in ('yuv420p', 'nv12'):
+        frame = decoded_frame(1280, 720, pixel_format)
+        full = frame.to_ndarray('rgb24')
+        reference = cv2.resize(full, (320, 180), interpolation=cv2.INTER_AREA)
+        small = frame.to_ndarray('rgb24', 320, 180)
+        assert small.shape == (180, 320, 3)
+        difference = np.abs(small.astype(int) - reference)
+        # فقط اختلاف گرد کردن دو مرحله
+        assert difference.max() <= 3 and difference.mean() < 1
+        frame.release()
+    print("✓ reduced-size conversion")
+
+def test_preview_budget():
+    """تست حذف فریم با نرخ پیش‌نمایش، سقف اندازه و توقف کامل در حالت غیرفعال"""
+    presenter = PreviewPresenter(refresh_hz=1000, max_fps=20, max_size=(320, 240))
+    presenter.set_target_size(1000, 1000)
+    ready = threading.Semaphore(0)
+    presenter.on_frame_ready = ready.release
+    presenter.start()
+    try:
+        frame = decoded_frame(1280, 720)
+        start = time.monotonic()
+        while time.monotonic() - start < 0.3:
+            presenter.submit(frame)
+            time.sleep(0.002)
+        assert ready.acquire(timeout=1.0)
+        stats = presenter.get_stats()
+        # 20fps در 0.3 ثانیه: حدود 6 فریم، بقیه بدون هیچ کاری حذف شده‌اند
+        assert 4 <= stats['submitted'] <= 8
+        assert stats['decimated'] > 50
+        
+        # فقط تبدیل اندازه پیش‌نمایش انجام شده، نه تبدیل کامل
+        shown = []
+        presenter.present(lambda image: shown.append(image.shape))
+        assert shown == [(180, 320, 3)]
+        assert ('rgb24', 1280, 720) not in frame._cache
+        
+        presenter.set_active(False)
+        presenter.submit(frame)
+        time.sleep(0.1)
+        assert presenter.get_stats()['submitted'] == stats['submitted']
+        frame.release()
+    finally:
+        presenter.stop()
+    print("✓ preview budget")
+
+def main():
+    print("\n" + "="*60)
+    print("تست پیش‌نمایش")
+    print("="*60)
+    test_latest_frame_wins()
+    test_buffers_reused()
+    test_reduced_size_conversion()
+    test_preview_budget()
+
+if __name__ == "__main__":
+    main()
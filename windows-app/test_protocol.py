@@ -0,0 +1,82 @@
+"""
+تست پروتکل: خواندن هدر بدون کپی، رفت و برگشت pack_into و تجزیه دسته‌ای هدرها
+"""
+import numpy as np
+from protocol import Packet, PacketHeader, PacketType, MAGIC_NUMBER, HEADER_STRUCT, parse_headers
+
+def make_stream(count: int) -> bytes:
+    return b''.join(Packet(PacketType.VIDEO_FRAME if i % 2 == 0 else PacketType.AUDIO_FRAME,
+                           bytes([i]) * (10 + i), 1000 * i, i).to_bytes() for i in range(count))
+
+def test_header_from_buffer():
+    """تست PacketHeader.from_buffer در offset دلخواه و خطا برای نوع نامعتبر"""
+    data = bytearray(b'pad') + Packet(PacketType.VIDEO_CONFIG, b'sps', 123, 7).to_bytes()
+    header = PacketHeader.from_buffer(memoryview(data), 3)
+    assert header == PacketHeader(MAGIC_NUMBER, PacketType.VIDEO_CONFIG, 3, 123, 7)
+    assert header.packet_type is PacketType.VIDEO_CONFIG
+    assert PacketHeader.from_bytes(bytes(data[3:])) == header
+    
+    try:
+        PacketHeader.from_buffer(HEADER_STRUCT.pack(MAGIC_NUMBER, 0x77, 0, 0, 0))
+        assert False, "invalid packet type accepted"
+    except ValueError:
+        pass
+    print("✓ header from buffer")
+
+def test_pack_into_round_trip():
+    """تست نوشتن هدر با pack_into در بافر از پیش تخصیص یافته و خواندن دوباره آن"""
+    header = PacketHeader(MAGIC_NUMBER, PacketType.AUDIO_FRAME, 1024, 2**40 + 5, 2**32 - 1)
+    buffer = bytearray(64)
+    header.pack_into(buffer, 10)
+    assert bytes(buffer[10:10 + PacketHeader.HEADER_SIZE]) == header.to_bytes()
+    assert buffer[:10] == bytes(10) and buffer[31:] == bytes(33)
+    assert PacketHeader.from_buffer(buffer, 10) == header
+    
+    # payload بسته از bytes یک view است نه کپی
+    data = bytearray(Packet(PacketType.AUDIO_FRAME, b'aac-frame', 5, 1).to_bytes())
+    packet = Packet.from_bytes(data)
+    assert isinstance(packet.payload, memoryview) and bytes(packet.payload) == b'aac-frame'
+    data[-1] = ord('X')
+    assert bytes(packet.payload) == b'aac-framX'
+    print("✓ pack_into round trip")
+
+def test_parse_headers():
+    """تست تجزیه همه هدرها با offset، توقف در بسته ناقص و خطا برای magic یا نوع نامعتبر"""
+    data = make_stream(20)
+    headers = parse_headers(data)
+    assert len(headers) == 20
+    assert list(headers['timestamp']) == [1000 * i for i in range(20)]
+    assert list(headers['sequence_number']) == list(range(20))
+    assert list(headers['payload_size']) == [10 + i for i in range(20)]
+    assert headers['packet_type'][0] == PacketType.VIDEO_FRAME and headers['packet_type'][1] == PacketType.AUDIO_FRAME
+    # offset هر رکورد همان جایی است که from_buffer هدر را می‌خواند
+    for record in headers[::7]:
+        header = PacketHeader.from_buffer(data, int(record['offset']))
+        assert header.timestamp == record['timestamp'] and header.payload_size == record['payload_size']
+    
+    # بسته آخر ناقص و بافر خالی
+    assert len(parse_headers(data[:-1])) == 19
+    assert len(parse_headers(data[:10])) == 0 and len(parse_headers(b'')) == 0
+    assert len(parse_headers(np.frombuffer(data, dtype=np.uint8))) == 20
+    
+    third = int(headers['offset'][3])
+    for corrupt in ((third, 0x00), (third + 4, 0x77)):
+        broken = bytearray(data)
+        broken[corrupt[0]] = corrupt[1]
+        try:
+            parse_headers(broken)
+            assert False, "corrupt header accepted"
+        except ValueError as e:
+            assert f"offset {third}" in str(e)
+    print("✓ parse headers")
+
+def main():
+    print("\n" + "="*60)
+    print("تست پروتکل")
+    print("="*60)
+    test_header_from_buffer()
+    test_pack_into_round_trip()
+    test_parse_headers()
+
+if __name__ == "__main__":
+    main()
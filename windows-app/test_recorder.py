@@ -0,0 +1,182 @@
+"""
+تست ضبط بدون transcode: remux بسته‌های H.264 و AAC دریافتی به MP4/MKV
+"""
+import os
+import struct
+import tempfile
+import threading
+from fractions import Fraction
+import av
+import numpy as np
+from protocol import PacketHeader, PacketType, MAGIC_NUMBER
+from streaming.h264 import index_nal_units, split_nal_units, NAL_IDR, NAL_SPS, NAL_PPS
+from streaming.recorder import StreamRecorder
+
+FPS = 30
+FRAME_US = 1_000_000 // FPS
+AAC_FRAME_US = 1024 * 1_000_000 / 48000
+
+def encode_video(frame_count: int, width: int = 320, height: int = 240, gop: int = 15):
+    """H.264 مصنوعی مانند MediaCodec: (config = SPS/PPS, access units)"""
+    codec = av.CodecContext.create('libx264', 'w')
+    codec.width = width
+    codec.height = height
+    codec.pix_fmt = 'yuv420p'
+    codec.time_base = Fraction(1, FPS)
+    codec.gop_size = gop
+    codec.options = {'tune': 'zerolatency', 'bf': '0', 'repeat-headers': '0'}
+    codec.open()
+    
+    packets = []
+    for i in range(frame_count):
+        image = np.zeros((height, width, 3), dtype=np.uint8)
+        image[:, (i * 4) % width] = 255
+        frame = av.VideoFrame.from_ndarray(image, format='rgb24').reformat(format='yuv420p')
+        frame.pts = i
+        packets.extend(bytes(p) for p in codec.encode(frame))
+    packets.extend(bytes(p) for p in codec.encode(None))
+    
+    first = packets[0]
+    idr = next(unit for unit in index_nal_units(first) if unit.nal_type == NAL_IDR)
+    config_end = idr.offset - 4 if first[idr.offset - 4] == 0 else idr.offset - 3
+    packets[0] = first[config_end:]
+    return first[:config_end], packets
+
+def encode_audio(frame_count: int, sample_rate: int = 48000):
+    """AAC مصنوعی: (config با قالب پروتکل، فریم‌ها)"""
+    encoder = av.CodecContext.create('aac', 'w')
+    encoder.sample_rate = sample_rate
+    encoder.layout = 'stereo'
+    encoder.format = 'fltp'
+    encoder.open()
+    
+    t = np.arange((frame_count + 2) * 1024) / sample_rate
+    planar = np.stack([np.sin(2 * np.pi * 440 * t), np.sin(2 * np.pi * 660 * t)]).astype(np.float32) * 0.3
+    packets = []
+    for i in range(frame_count + 2):
+        frame = av.AudioFrame.from_ndarray(np.ascontiguousarray(planar[:, i * 1024:(i + 1) * 1024]),
+                                           format='fltp', layout='stereo')
+        frame.sample_rate = sample_rate
+        frame.pts = i * 1024
+        packets.extend(bytes(p) for p in encoder.encode(frame))
+    config = struct.pack('>II', sample_rate, 2) + bytes(encoder.extradata)
+    return config, packets[:frame_count]
+
+def stream_packets(video_config, video, audio_config, audio, start_us: int = 5_000_000):
+    """بسته‌ها به ترتیب زمان رسیدن با timestamp دستگاه"""
+    packets = [(0, PacketType.VIDEO_CONFIG, video_config), (0, PacketType.AUDIO_CONFIG, audio_config)]
+    packets += [(start_us + i * FRAME_US, PacketType.VIDEO_FRAME, data) for i, data in enumerate(video)]
+    packets += [(start_us + int(i * AAC_FRAME_US), PacketType.AUDIO_FRAME, data) for i, data in enumerate(audio)]
+    return sorted(packets, key=lambda packet: packet[0])
+
+def feed(recorder: StreamRecorder, packets):
+    for timestamp, packet_type, data in packets:
+        header = PacketHeader(MAGIC_NUMBER, packet_type, len(data), timestamp, 0)
+        recorder.on_packet(header, memoryview(data))
+
+def test_remux_mp4_and_mkv():
+    """تست بسته‌های ضبط شده: همان بایت‌ها، timestamp های هدر به عنوان PTS و فایل قابل دیکود"""
+    video_config, video = encode_video(60)
+    audio_config, audio = encode_audio(90)
+    packets = stream_packets(video_config, video, audio_config, audio)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        for extension in ('mp4', 'mkv'):
+            path = os.path.join(directory, f'session.{extension}')
+            recorder = StreamRecorder(path)
+            recorder.start()
+            feed(recorder, packets)
+            recorder.stop()
+            stats = recorder.get_stats()
+            assert stats['video_frames'] == 60 and stats['audio_frames'] == 90 and stats['dropped'] == 0
+            
+            with av.open(path) as container:
+                video_stream = container.streams.video[0]
+                assert (video_stream.codec_context.width, video_stream.codec_context.height) == (320, 240)
+                # SPS/PPS دستگاه به صورت avcC در header ذخیره شده است، نه SPS یک encoder محلی
+                extradata = bytes(video_stream.codec_context.extradata)
+                assert extradata[0] == 1
+                assert all(bytes(unit) in extradata for unit in split_nal_units(video_config)
+                           if unit[0] & 0x1F in (NAL_SPS, NAL_PPS))
+                assert bytes(container.streams.audio[0].codec_context.extradata) == audio_config[8:]
+                recorded = [p for p in container.demux(video_stream) if p.size]
+                assert len(recorded) == 60
+                # دقت مقایسه یک tick واحد زمانی container است (90kHz در MP4 و 1ms در MKV)
+                tick_us = float(recorded[0].time_base) * 1e6
+                pts_us = [float(p.pts * p.time_base) * 1e6 for p in recorded]
+                assert all(abs(pts - i * FRAME_US) <= tick_us for i, pts in enumerate(pts_us))
+                assert [p.is_keyframe for p in recorded] == [i % 15 == 0 for i in range(60)]
+            
+            with av.open(path) as container:
+                assert sum(1 for _ in container.decode(video=0)) == 60
+            with av.open(path) as container:
+                assert container.streams.audio[0].codec_context.sample_rate == 48000
+                samples = sum(frame.samples for frame in container.decode(audio=0))
+                assert samples >= 88 * 1024
+    print("✓ remux mp4 and mkv")
+
+def test_start_mid_stream_and_config_change():
+    """تست شروع وسط استریم (از keyframe بعدی) و فایل جدید با تغییر رزولوشن"""
+    video_config, video = encode_video(45)
+    audio_config, audio = encode_audio(60)
+    small_config, small = encode_video(30, 160, 120)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'session.mkv')
+        recorder = StreamRecorder(path)
+        # ضبط بعد از دریافت config ها شروع می‌شود؛ فریم‌های قبل از keyframe 15 کنار گذاشته می‌شوند
+        recorder.start(video_config, audio_config)
+        packets = stream_packets(video_config, video, audio_config, audio)
+        feed(recorder, [p for p in packets if p[1] not in (PacketType.VIDEO_CONFIG, PacketType.AUDIO_CONFIG)
+                        and p[0] >= 5_000_000 + 5 * FRAME_US])
+        feed(recorder, stream_packets(small_config, small, audio_config, [], start_us=7_000_000))
+        recorder.stop()
+        
+        stats = recorder.get_stats()
+        assert stats['files'] == [path, os.path.join(directory, 'session_part2.mkv')]
+        with av.open(stats['files'][0]) as container:
+            assert sum(1 for _ in container.decode(video=0)) == 30
+        with av.open(stats['files'][1]) as container:
+            stream = container.streams.video[0]
+            assert (stream.codec_context.width, stream.codec_context.height) == (160, 120)
+            assert sum(1 for _ in container.decode(video=0)) == 30
+    print("✓ start mid-stream and config change")
+
+def test_stop_waits_for_writer():
+    """تست stop با نویسنده کند: فایل فقط توسط thread نویسنده و بعد از نوشتن صف بسته می‌شود"""
+    video_config, video = encode_video(15)
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'session.mp4')
+        recorder = StreamRecorder(path)
+        release = threading.Event()
+        mux = recorder._mux
+        
+        def slow_mux(*args):
+            release.wait()
+            mux(*args)
+        
+        recorder._mux = slow_mux
+        recorder.start(video_config)
+        feed(recorder, stream_packets(video_config, video, b'', [])[2:])
+        
+        # نویسنده هنوز روی اولین فریم است: stop بدون بستن فایل برمی‌گردد
+        recorder.stop(timeout=0.1)
+        assert recorder._thread is not None and recorder._container is not None
+        release.set()
+        recorder._thread.join(timeout=5.0)
+        assert recorder._container is None and recorder.video_frames == 15
+        with av.open(path) as container:
+            assert sum(1 for _ in container.decode(video=0)) == 15
+    print("✓ stop waits for writer")
+
+def main():
+    print("\n" + "="*60)
+    print("تست ضبط استریم")
+    print("="*60)
+    test_remux_mp4_and_mkv()
+    test_start_mid_stream_and_config_change()
+    test_stop_waits_for_writer()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+تست بافر بازپخش فوری: نگهداری بسته‌های کدشده در حلقه هم‌تراز با GOP و ذخیره بدون transcode
+"""
+import os
+import tempfile
+import av
+from protocol import PacketType
+from streaming.replay_buffer import ReplayBuffer
+from test_recorder import encode_video, encode_audio, stream_packets, feed, FRAME_US
+
+def test_trim_at_keyframes():
+    """تست کوتاه‌سازی حلقه فقط در مرز GOP با محدودیت زمان و حجم"""
+    video_config, video = encode_video(60)
+    audio_config, audio = encode_audio(90)
+    packets = stream_packets(video_config, video, audio_config, audio, start_us=0)
+    
+    replay = ReplayBuffer(max_seconds=1.0)
+    feed(replay, packets)
+    stats = replay.get_stats()
+    # GOP های 15 فریمی (0.5 ثانیه): حداقل 1 ثانیه باقی می‌ماند و ابتدای حلقه keyframe است
+    assert stats['gops'] == 3 and stats['gops_trimmed'] == 1
+    assert 1.0 <= stats['duration_s'] < 1.5
+    snapshot = replay.snapshot()
+    first_video = next(p for p in snapshot if p[0] == PacketType.VIDEO_FRAME)
+    assert first_video[2] == 15 * FRAME_US and first_video[1] == video[15]
+    
+    # محدودیت حجم: فقط آخرین GOP نگه داشته می‌شود
+    replay = ReplayBuffer(max_seconds=30.0, max_bytes=1)
+    feed(replay, packets)
+    assert replay.get_stats()['gops'] == 1
+    last_gop = [data for timestamp, packet_type, data in packets
+                if timestamp >= 45 * FRAME_US and packet_type in (PacketType.VIDEO_FRAME, PacketType.AUDIO_FRAME)]
+    assert replay.get_stats()['bytes'] == sum(len(data) for data in last_gop)
+    print("✓ trim at keyframes")
+
+def test_save_last_seconds():
+    """تست ذخیره N ثانیه آخر در worker، از keyframe قبل از آن نقطه"""
+    video_config, video = encode_video(60)
+    audio_config, audio = encode_audio(90)
+    
+    replay = ReplayBuffer(max_seconds=30.0)
+    # قبل از اولین keyframe چیزی قابل دیکود نیست
+    replay.set_configs(video_config, audio_config)
+    packets = stream_packets(video_config, video, audio_config, audio, start_us=0)
+    feed(replay, [p for p in packets if p[1] not in (PacketType.VIDEO_CONFIG, PacketType.AUDIO_CONFIG)])
+    
+    saved = []
+    replay.on_saved = lambda files, error: saved.append((files, error))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'replay.mp4')
+        assert replay.save(path, seconds=0.5)
+        replay.wait_saved(30.0)
+        assert saved == [([path], None)]
+        with av.open(path) as container:
+            # آخرین timestamp برابر 1.966 ثانیه است؛ keyframe قبل از 1.466 ثانیه فریم 30 است
+            assert sum(1 for _ in container.decode(video=0)) == 30
+        with av.open(path) as container:
+            assert sum(frame.samples for frame in container.decode(audio=0)) >= 40 * 1024
+        
+        path = os.path.join(directory, 'replay.mkv')
+        assert replay.save(path)
+        replay.wait_saved(30.0)
+        with av.open(path) as container:
+            assert sum(1 for _ in container.decode(video=0)) == 60
+    assert replay.get_stats()['saves'] == 2
+    print("✓ save last seconds")
+
+def test_clear_on_new_session():
+    """تست clear در اتصال دوباره: timestamp های جلسه جدید از نو شروع می‌شوند"""
+    video_config, video = encode_video(60)
+    audio_config, audio = encode_audio(90)
+    replay = ReplayBuffer(max_seconds=30.0)
+    feed(replay, stream_packets(video_config, video, audio_config, audio, start_us=100_000_000))
+    
+    # بدون config جلسه جدید چیزی نگه داشته نمی‌شود
+    replay.clear()
+    feed(replay, [packet for packet in stream_packets(video_config, video, audio_config, audio, start_us=0)
+                  if packet[1] == PacketType.VIDEO_FRAME][:15])
+    assert replay.get_stats()['gops'] == 0
+    
+    replay.clear()
+    feed(replay, stream_packets(video_config, video, audio_config, audio, start_us=0))
+    stats = replay.get_stats()
+    assert stats['gops'] == 4 and stats['gops_trimmed'] == 0
+    assert abs(replay.duration_s() - 59 * FRAME_US / 1e6) < 0.1
+    assert len([p for p in replay.snapshot(30.0) if p[0] == PacketType.VIDEO_FRAME]) == 60
+    print("✓ clear on new session")
+
+def main():
+    print("\n" + "="*60)
+    print("تست بافر بازپخش فوری")
+    print("="*60)
+    test_trim_at_keyframes()
+    test_save_last_seconds()
+    test_clear_on_new_session()
+
+if __name__ == "__main__":
+    main()
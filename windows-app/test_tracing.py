@@ -0,0 +1,137 @@
+"""
+تست ردیابی تأخیر مراحل: هیستوگرام‌های HDR، فاصله بین مراحل و هزینه مهر زمانی
+"""
+import os
+import json
+import time
+import random
+import tempfile
+from streaming.tracing import (LatencyHistogram, FrameTracer, TRACE_RECEIVE, TRACE_PARSE,
+                               TRACE_DECODE_START, TRACE_DECODE_END, TRACE_CONVERT,
+                               TRACE_PRESENT, TRACE_VCAM_SENT)
+from streaming.decoder import VideoDecoder, DecodeMode
+from test_recorder import encode_video, FRAME_US
+
+def test_histogram_accuracy():
+    """تست دقت صدک‌ها (خطای نسبی زیر 1%) در بازه میکروثانیه تا ثانیه"""
+    random.seed(1)
+    values = sorted(int(random.lognormvariate(8, 1.5)) for _ in range(20000))
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    
+    assert histogram.count == len(values)
+    assert histogram.min == values[0] and histogram.max == values[-1]
+    for percentile in (50, 90, 99, 99.9):
+        exact = values[max(0, int(percentile / 100 * len(values) + 0.5) - 1)]
+        assert abs(histogram.percentile(percentile) - exact) <= max(1, exact * 0.01), percentile
+    
+    # مقادیر کوچک دقیق شمرده می‌شوند و مقادیر بزرگ به سقف محدود می‌شوند
+    small = LatencyHistogram()
+    for value in (0, 5, 127):
+        small.record(value)
+    assert small.percentile(50) == 5
+    small.record(10**12)
+    assert small.max == small.max_value_us
+    
+    merged = LatencyHistogram()
+    merged.merge(histogram)
+    merged.merge(small)
+    assert merged.count == histogram.count + small.count and merged.min == 0
+    print("✓ histogram accuracy")
+
+def test_stage_intervals():
+    """تست فاصله هر مرحله از مرحله قبل، انتها به انتها، حافظه محدود و خروجی JSON"""
+    tracer = FrameTracer(max_frames=8)
+    ms = 1_000_000
+    for i in range(20):
+        timestamp = i * FRAME_US
+        base = i * 100 * ms
+        tracer.mark(TRACE_RECEIVE, timestamp, base)
+        tracer.mark(TRACE_PARSE, timestamp, base + ms)
+        tracer.mark(TRACE_DECODE_START, timestamp, base + 2 * ms)
+        tracer.mark(TRACE_DECODE_END, timestamp, base + 7 * ms)
+        tracer.mark(TRACE_CONVERT, timestamp, base + 9 * ms)
+        # فقط اولین مهر هر مرحله حساب می‌شود
+        tracer.mark(TRACE_CONVERT, timestamp, base + 50 * ms)
+        tracer.mark(TRACE_VCAM_SENT, timestamp, base + 12 * ms)
+        if i % 2 == 0:
+            tracer.mark(TRACE_PRESENT, timestamp, base + 25 * ms)
+    
+    stats = tracer.dump()
+    stages = stats['stages']
+    assert stages[TRACE_PARSE]['p50_ms'] == 1.0
+    assert stages[TRACE_DECODE_END]['p99_ms'] == 5.0
+    assert stages[TRACE_CONVERT]['count'] == 20 and stages[TRACE_CONVERT]['max_ms'] == 2.0
+    assert stages[TRACE_VCAM_SENT]['p50_ms'] == 3.0
+    assert stages[TRACE_PRESENT]['count'] == 10 and stages[TRACE_PRESENT]['p50_ms'] == 16.0
+    assert stats['end_to_end'][TRACE_VCAM_SENT]['p50_ms'] == 12.0
+    assert stats['frames_traced'] == 20 and stats['frames_evicted'] == 12
+    assert len(tracer._frames) == 8
+    
+    # فریم حذف شده یا فریمی که دریافتش دیده نشده نادیده گرفته می‌شود
+    tracer.mark(TRACE_PRESENT, 0, 10**12)
+    tracer.mark(TRACE_PARSE, 10**9, 10**12)
+    assert tracer.dump()['stages'][TRACE_PRESENT]['count'] == 10
+    
+    # دوربین مجازی صفحه‌های خام را قبل از تبدیل پیش‌نمایش فرستاده: از پایان دیکود حساب می‌شود
+    tracer.mark(TRACE_RECEIVE, 10**9, 0)
+    tracer.mark(TRACE_DECODE_END, 10**9, 4 * ms)
+    tracer.mark(TRACE_VCAM_SENT, 10**9, 6 * ms)
+    tracer.mark(TRACE_CONVERT, 10**9, 8 * ms)
+    assert tracer.stage_histograms[TRACE_VCAM_SENT].min == 2000
+    assert tracer.stage_histograms[TRACE_DECODE_END].count == 21
+    
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'latency.json')
+        tracer.dump(path)
+        with open(path) as f:
+            dumped = json.load(f)
+    assert dumped['stages'][TRACE_PARSE]['buckets'] == [[1000, 1008, 20]]
+    
+    tracer.reset()
+    assert tracer.get_stats()['frames_traced'] == 0
+    print("✓ stage intervals")
+
+def test_decoder_marks_and_cost():
+    """تست مهرهای دیکودر و تبدیل روی جریان واقعی و هزینه هر مهر"""
+    video_config, video = encode_video(30)
+    decoder = VideoDecoder(mode=DecodeMode.SINGLE)
+    tracer = FrameTracer()
+    decoder.tracer = tracer
+    decoder.add_sink(lambda frame: None, 'bgr24')
+    decoder.set_config(video_config)
+    for i, data in enumerate(video[:30]):
+        tracer.mark(TRACE_RECEIVE, i * FRAME_US)
+        tracer.mark(TRACE_PARSE, i * FRAME_US)
+        decoder.decode(data, i * FRAME_US, i % 15 == 0)
+    decoder.close()
+    
+    stages = tracer.get_stats()['stages']
+    assert stages[TRACE_DECODE_START]['count'] == 30
+    assert stages[TRACE_DECODE_END]['count'] == 30 and stages[TRACE_DECODE_END]['p50_ms'] > 0
+    assert stages[TRACE_CONVERT]['count'] == 30
+    
+    # 7 مهر برای هر فریم در 60fps باید بسیار کمتر از 1% یک هسته باشد
+    tracer = FrameTracer()
+    count = 20000
+    started = time.perf_counter()
+    for i in range(count):
+        tracer.mark(TRACE_RECEIVE, i)
+        tracer.mark(TRACE_PARSE, i)
+    per_mark_us = (time.perf_counter() - started) / (2 * count) * 1e6
+    cpu_share = per_mark_us * 7 * 60 / 1e6
+    print(f"  {per_mark_us:.2f} µs per mark, {cpu_share * 100:.3f}% CPU at 60 fps")
+    assert cpu_share < 0.005
+    print("✓ decoder marks and cost")
+
+def main():
+    print("\n" + "="*60)
+    print("تست ردیابی تأخیر مراحل")
+    print("="*60)
+    test_histogram_accuracy()
+    test_stage_intervals()
+    test_decoder_marks_and_cost()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+تست VideoDecoder: انتخاب حالت threading، سقف تعداد thread و تاخیر گزارش شده بر حسب فریم
+"""
+from streaming.decoder import VideoDecoder, DecodeMode
+from test_recorder import encode_video
+
+WIDTH = 320
+HEIGHT = 240
+
+def decode_all(decoder: VideoDecoder, config: bytes, packets: list):
+    """دیکود همه access unitها با یک sink خالی"""
+    decoder.add_sink(lambda frame: None)
+    decoder.set_config(config)
+    for i, data in enumerate(packets):
+        decoder.decode(data, i, i == 0)
+
+def test_auto_mode_threshold():
+    """تست انتخاب SLICE تا 1920x1080 و FRAME بالاتر از آن در حالت AUTO"""
+    for width, height, expected in ((1280, 720, DecodeMode.SLICE),
+                                    (1920, 1080, DecodeMode.SLICE),
+                                    (2560, 1440, DecodeMode.FRAME)):
+        config, _ = encode_video(1, width, height)
+        decoder = VideoDecoder(thread_count=4)
+        decoder._select_mode(config)
+        assert decoder.resolution == (width, height)
+        assert decoder.active_mode == expected, (width, height, decoder.active_mode)
+        assert decoder.active_threads == 4
+    print("✓ auto mode threshold")
+
+def test_thread_cap():
+    """تست سقف 8 thread در حالت FRAME، بدون سقف در SLICE و یک thread در SINGLE"""
+    config, _ = encode_video(1, WIDTH, HEIGHT)
+    for mode, expected in ((DecodeMode.FRAME, 8), (DecodeMode.SLICE, 16), (DecodeMode.SINGLE, 1)):
+        decoder = VideoDecoder(mode=mode, thread_count=16)
+        decoder._select_mode(config)
+        assert decoder.active_mode == mode and decoder.active_threads == expected, mode
+    
+    # حالت AUTO بالای آستانه هم همان سقف را دارد
+    config, _ = encode_video(1, 2560, 1440)
+    decoder = VideoDecoder(thread_count=16)
+    decoder._select_mode(config)
+    assert decoder.active_threads == 8 and decoder.expected_delay_frames == 7
+    print("✓ thread cap")
+
+def test_reported_delay():
+    """تست تاخیر frame threading (threads - 1 فریم) گزارش شده و اندازه‌گیری شده"""
+    config, packets = encode_video(20, WIDTH, HEIGHT)
+    for mode, threads, delay in ((DecodeMode.FRAME, 4, 3), (DecodeMode.FRAME, 2, 1),
+                                 (DecodeMode.SLICE, 4, 0)):
+        decoder = VideoDecoder(mode=mode, thread_count=threads)
+        decode_all(decoder, config, packets)
+        stats = decoder.get_stats()
+        decoder.close()
+        assert stats['expected_delay_frames'] == delay, (mode, threads)
+        assert stats['measured_delay_frames'] == delay and stats['max_delay_frames'] == delay
+        assert stats['frames_decoded'] == len(packets) - delay
+    print("✓ reported delay")
+
+def test_video_decoder_stats():
+    """تست آمار VideoDecoder: حالت threading، تاخیر و تعداد فریم‌ها قبل و بعد از دیکود"""
+    decoder = VideoDecoder(mode='single')
+    stats = decoder.get_stats()
+    assert stats['mode'] == 'single' and stats['frames_decoded'] == 0
+    config, packets = encode_video(10, WIDTH, HEIGHT)
+    decode_all(decoder, config, packets)
+    stats = decoder.get_stats()
+    decoder.close()
+    assert stats['frames_decoded'] == len(packets) and stats['packets_decoded'] == len(packets)
+    assert stats['measured_delay_frames'] == 0 and stats['resolution'] == (WIDTH, HEIGHT)
+    print("✓ video decoder stats")
+
+def main():
+    print("\n" + "="*60)
+    print("تست VideoDecoder")
+    print("="*60)
+    test_auto_mode_threshold()
+    test_thread_cap()
+    test_reported_delay()
+    test_video_decoder_stats()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+تست بافر IOCTL دوربین VirtuCore با backend جایگزین (قابل اجرا روی Linux)
+"""
+import time
+import numpy as np
+import cv2
+from virtual_camera.interface import VirtualCameraInterface
+from virtual_camera.scaler import FrameScaler
+from virtual_camera.driver_backend import LoopbackDriverBackend
+from virtual_camera.virtucore_camera import (
+    VirtuCoreCamera, FRAME_HEADER, FORMAT_RGB24, FORMAT_NV12, FORMAT_YUY2
+)
+
+def make_frame(width: int, height: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+def make_planes(width: int, height: int, seed: int):
+    """صفحه‌های Y, U, V تصادفی مانند خروجی yuv420p دیکودر"""
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, 255, (height, width), dtype=np.uint8)
+    u = rng.integers(0, 255, (height // 2, width // 2), dtype=np.uint8)
+    v = rng.integers(0, 255, (height // 2, width // 2), dtype=np.uint8)
+    return y, u, v
+
+def open_camera(**backend_options):
+    backend = LoopbackDriverBackend(**backend_options)
+    camera = VirtuCoreCamera(backend=backend)
+    assert camera.open()
+    return camera, backend
+
+def test_bgr_frame_bytes():
+    """تست محتوای بایت‌ها: header + RGB دقیقاً مانند مسیر قدیمی (cvtColor + tobytes)"""
+    camera, backend = open_camera()
+    for seed in range(3):
+        frame = make_frame(64, 48, seed)
+        assert camera.send_frame(frame)
+        
+        sent = backend.sent[-1]
+        width, height, fmt, size, _ = FRAME_HEADER.unpack_from(sent)
+        expected = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).tobytes()
+        assert (width, height, fmt, size) == (64, 48, FORMAT_RGB24, len(expected))
+        assert sent[FRAME_HEADER.size:] == expected
+    
+    # فقط یک کپی فریم (تبدیل رنگ به داخل بافر IOCTL) و بدون ساخت بافر جدید
+    stats = camera.get_stats()
+    assert stats['bytes_copied_per_frame'] == 64 * 48 * 3
+    assert stats['buffer_size'] == FRAME_HEADER.size + 64 * 48 * 3
+    print("✓ BGR frame bytes")
+
+def test_rgb_resize_bytes():
+    """تست فریم RGB با resize: مستقیماً در ناحیه داده نوشته می‌شود"""
+    camera, backend = open_camera()
+    frame = make_frame(64, 48, 7)
+    assert camera.send_frame(frame, 32, 24, pixel_format='rgb24')
+    
+    expected = cv2.resize(frame, (32, 24)).tobytes()
+    assert backend.sent[-1][FRAME_HEADER.size:] == expected
+    assert camera.get_stats()['bytes_copied_per_frame'] == 32 * 24 * 3
+    print("✓ RGB resize bytes")
+
+def test_format_negotiation():
+    """تست SET_FORMAT: NV12 ترجیح دارد، فرمت pin در حال استریم اولویت دارد، RGB24 آخرین گزینه است"""
+    camera, backend = open_camera()
+    backend.status = (0, 0, 0, 0, 0)
+    assert camera.negotiate_format(64, 48) == FORMAT_NV12
+    assert backend.requested_format == (64, 48, FORMAT_NV12, 30)
+    
+    camera, backend = open_camera()
+    backend.status = (1, 64, 48, FORMAT_YUY2, 0)
+    assert camera.negotiate_format(64, 48) == FORMAT_YUY2
+    
+    camera, backend = open_camera(supported_formats=(FORMAT_RGB24,))
+    backend.status = (0, 0, 0, 0, 0)
+    assert camera.negotiate_format(64, 48) == FORMAT_RGB24
+    assert backend.rejected == 2
+    print("✓ format negotiation")
+
+def test_nv12_planes():
+    """تست چیدمان NV12: صفحه Y و سپس U/V درهم، از منبع yuv420p و nv12"""
+    camera, backend = open_camera()
+    backend.status = (0, 0, 0, 0, 0)
+    camera.negotiate_format(64, 48)
+    y, u, v = make_planes(64, 48, 3)
+    
+    assert camera.send_planes((y, u, v), 'yuv420p')
+    width, height, fmt, size, _ = FRAME_HEADER.unpack_from(backend.sent[-1])
+    assert (width, height, fmt, size) == (64, 48, FORMAT_NV12, 64 * 48 * 3 // 2)
+    planes = backend.unpack_planes(backend.sent[-1])
+    assert np.array_equal(planes['y'], y)
+    assert np.array_equal(planes['u'], u)
+    assert np.array_equal(planes['v'], v)
+    
+    uv = np.stack([u, v], axis=-1).reshape(24, 64)
+    assert camera.send_planes((y, uv), 'nv12')
+    assert backend.sent[-1][FRAME_HEADER.size:] == backend.sent[-2][FRAME_HEADER.size:]
+    
+    # بدون تبدیل RGB: فقط یک بار داده NV12 کپی می‌شود
+    assert camera.get_stats()['bytes_copied_per_frame'] == 64 * 48 * 3 // 2
+    assert backend.rejected == 0
+    print("✓ NV12 planes")
+
+def test_yuy2_planes():
+    """تست چیدمان YUY2 با تکرار عمودی chroma"""
+    camera, backend = open_camera(supported_formats=(FORMAT_YUY2,))
+    backend.status = (0, 0, 0, 0, 0)
+    assert camera.negotiate_format(64, 48) == FORMAT_YUY2
+    y, u, v = make_planes(64, 48, 5)
+    
+    assert camera.send_planes((y, u, v), 'yuv420p')
+    planes = backend.unpack_planes(backend.sent[-1])
+    assert np.array_equal(planes['y'], y)
+    assert np.array_equal(planes['u'], np.repeat(u, 2, axis=0))
+    assert np.array_equal(planes['v'], np.repeat(v, 2, axis=0))
+    print("✓ YUY2 planes")
+
+def test_paced_delivery():
+    """تست تحویل با نرخ ثابت: فریم‌های اضافه drop و در توقف گوشی فریم قبلی تکرار می‌شود"""
+    backend = LoopbackDriverBackend(max_recorded=1000)
+    interface = VirtualCameraInterface(backend=backend, fps=50)
+    interface.width, interface.height = 32, 24
+    assert interface.start()
+    try:
+        # گوشی سریع‌تر از مصرف‌کننده: فقط آخرین فریم هر tick تحویل می‌شود
+        frames = [make_frame(32, 24, seed) for seed in range(20)]
+        for frame in frames:
+            interface.send_frame(frame)
+        time.sleep(0.1)
+        stats = interface.get_stats()
+        assert stats['delivered'] <= 2
+        assert stats['delivered'] + stats['dropped'] == 20
+        expected = cv2.cvtColor(frames[-1], cv2.COLOR_BGR2RGB).tobytes()
+        backend.sent = [sent for sent in backend.sent if sent[FRAME_HEADER.size:] == expected]
+        
+        # گوشی متوقف شده: همان فریم با نرخ ثابت تکرار می‌شود
+        time.sleep(0.2)
+        stats = interface.get_stats()
+        assert stats['repeated'] >= 5
+        assert len(backend.sent) >= stats['repeated']
+        assert stats['frames_sent'] == stats['delivered'] + stats['repeated']
+    finally:
+        interface.stop()
+    print("✓ paced delivery")
+
+def test_follow_stream_resolution():
+    """تست دنبال کردن رزولوشن استریم: بدون تغییر اندازه، با SET_FORMAT برای اندازه جدید"""
+    backend = LoopbackDriverBackend()
+    backend.status = (0, 0, 0, 0, 0)
+    interface = VirtualCameraInterface(backend=backend, paced=False)
+    assert interface.start()
+    
+    interface.send_frame(make_frame(64, 48, 1))
+    assert backend.requested_format[:2] == (64, 48)
+    assert interface.scaler is None
+    assert FRAME_HEADER.unpack_from(backend.sent[-1])[:2] == (64, 48)
+    
+    interface.send_frame(make_frame(32, 24, 2))
+    assert backend.requested_format[:2] == (32, 24)
+    assert FRAME_HEADER.unpack_from(backend.sent[-1])[:2] == (32, 24)
+    
+    # استریم 4K در بافرهای 1080p درایور جا نمی‌شود و کوچک می‌شود
+    interface.send_frame(np.zeros((2160, 3840, 3), dtype=np.uint8))
+    assert backend.requested_format[:2] == (1920, 1080)
+    assert interface.scaler is not None
+    assert FRAME_HEADER.unpack_from(backend.sent[-1])[:2] == (1920, 1080)
+    interface.stop()
+    print("✓ follow stream resolution")
+
+def test_fixed_size_letterbox():
+    """تست اندازه ثابت: نگاشت letterbox یک بار ساخته و برای هر فریم استفاده می‌شود"""
+    backend = LoopbackDriverBackend()
+    backend.status = (0, 0, 0, 0, 0)
+    interface = VirtualCameraInterface(backend=backend, paced=False, output_size=(64, 48))
+    assert interface.start()
+    assert interface.camera.format == FORMAT_NV12
+    
+    class Frame:
+        """جایگزین DecodedFrame با صفحه‌های yuv420p ثابت"""
+        native_format = 'yuv420p'
+        width, height = 32, 16
+        def planes(self):
+            return (np.full((16, 32), 200, np.uint8), np.full((8, 16), 90, np.uint8), np.full((8, 16), 160, np.uint8))
+    
+    interface.send_frame(Frame())
+    scaler = interface.scaler
+    interface.send_frame(Frame())
+    assert interface.scaler is scaler
+    assert scaler.content_rect == (0, 8, 64, 32)
+    
+    planes = backend.unpack_planes(backend.sent[-1])
+    assert (planes['y'][:8] == 16).all() and (planes['y'][40:] == 16).all()
+    assert (planes['y'][8:40] == 200).all()
+    assert (planes['u'][:4] == 128).all() and (planes['v'][20:] == 128).all()
+    assert (planes['u'][4:20] == 90).all() and (planes['v'][4:20] == 160).all()
+    interface.stop()
+    print("✓ fixed size letterbox")
+
+def test_scaler_matches_resize():
+    """تست نگاشت کشیده (بدون letterbox) در برابر cv2.resize"""
+    frame = make_frame(64, 48, 9)
+    frame = cv2.GaussianBlur(frame, (5, 5), 0)
+    scaler = FrameScaler(64, 48, 96, 72, letterbox=False)
+    scaled = scaler.scale(frame, np.empty((72, 96, 3), np.uint8))
+    reference = cv2.resize(frame, (96, 72))
+    assert np.abs(scaled.astype(int) - reference.astype(int)).max() <= 2
+    print("✓ scaler matches resize")
+
+def test_scaler_thin_borders():
+    """تست نوار حاشیه 1-2 پیکسلی که محتوا فقط به یک لبه آن نمی‌رسد (Y و UV)"""
+    for src_size, dst_size in (((1918, 1080), (1920, 1080)), ((64, 46), (64, 48))):
+        scaler = FrameScaler(*src_size, *dst_size)
+        x, y, width, height = scaler.content_rect
+        assert (x, y) == (0, 0) and (width, height) == src_size
+        
+        luma = scaler.scale(np.full(src_size[::-1], 200, np.uint8), np.full(dst_size[::-1], 255, np.uint8), 16)
+        assert (luma[:height, :width] == 200).all()
+        assert (luma[:, width:] == 16).all() and (luma[height:] == 16).all()
+        
+        chroma_size = (dst_size[1] // 2, dst_size[0] // 2)
+        chroma = scaler.scale(np.full((src_size[1] // 2, src_size[0] // 2), 90, np.uint8),
+                              np.full(chroma_size, 255, np.uint8), 128, chroma=True)
+        assert (chroma[:, width // 2:] == 128).all() and (chroma[height // 2:] == 128).all()
+        assert (chroma[:height // 2, :width // 2] == 90).all()
+    print("✓ scaler thin borders")
+
+def main():
+    print("\n" + "="*60)
+    print("تست بافر IOCTL دوربین VirtuCore")
+    print("="*60)
+    test_bgr_frame_bytes()
+    test_rgb_resize_bytes()
+    test_format_negotiation()
+    test_nv12_planes()
+    test_yuy2_planes()
+    test_paced_delivery()
+    test_follow_stream_resolution()
+    test_fixed_size_letterbox()
+    test_scaler_matches_resize()
+    test_scaler_thin_borders()
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,35 @@
+import os
+import time
 import logging
-import cv2
 import numpy as np
 from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                               QPushButton, QLabel, QComboBox, QSlider, QGroupBox,
                               QLineEdit, QMessageBox, QCheckBox, QRadioButton, QButtonGroup,
-                              QSpinBox, QScrollArea)
-from PyQt6.QtCore import Qt, QTimer, pyqtSignal
-from PyQt6.QtGui import QImage, QPixmap
+                              QScrollArea)
+from PyQt6.QtCore import Qt, QEvent, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap, QGuiApplication
 from streaming.connection import ConnectionManager
 from streaming.receiver import StreamReceiver
 from streaming.decoder import VideoDecoder, AudioDecoder
+from streaming.av_sync import AVSyncEngine
+from streaming.recorder import StreamRecorder
+from streaming.replay_buffer import ReplayBuffer
+from streaming.tracing import FrameTracer
 from control.commands import ControlCommands
 from virtual_camera.interface import VirtualCameraInterface
 from virtual_camera.virtucore_microphone import VirtuCoreMicrophone
+from .preview import PreviewPresenter
 
 logger = logging.getLogger(__name__)
 
 class MainWindow(QMainWindow):
-    frame_received = pyqtSignal(np.ndarray)
+    preview_ready = pyqtSignal()
+    replay_saved = pyqtSignal(list, str)
+    
+    # Preview budget choices; None = follow the display refresh / window size
+    PREVIEW_FPS = [15, 30, None]
+    PREVIEW_SIZES = [None, (1280, 720), (640, 360)]
+    REPLAY_SECONDS = 30
     
     def __init__(self):
         super().__init__()
@@ -34,6 +46,25 @@ class MainWindow(QMainWindow):
         
         self.control_commands = ControlCommands(self.connection_manager)
         self.virtual_camera = VirtualCameraInterface()
+        
+        # Audio is the master clock: the receiver maps device timestamps, the audio
+        # decoder reports what is playing, the virtual camera schedules frames against it
+        self.av_sync = AVSyncEngine()
+        self.stream_receiver.av_sync = self.av_sync
+        self.audio_decoder.av_sync = self.av_sync
+        self.virtual_camera.av_sync = self.av_sync
+        self.recorder = None
+        
+        # Always-on per-stage latency histograms, written to a file from the recording group
+        self.tracer = FrameTracer()
+        self.stream_receiver.tracer = self.tracer
+        self.video_decoder.tracer = self.tracer
+        self.virtual_camera.tracer = self.tracer
+        
+        # Always-on instant replay of the last REPLAY_SECONDS, kept as encoded packets
+        self.replay_buffer = ReplayBuffer(max_seconds=self.REPLAY_SECONDS)
+        self.replay_buffer.on_saved = lambda files, error: self.replay_saved.emit(files, str(error or ''))
+        self.stream_receiver.add_packet_sink(self.replay_buffer.on_packet)
         self.device_manager = None
         
         self.is_streaming = False
@@ -50,11 +81,21 @@ class MainWindow(QMainWindow):
         self.shutter_min_ns = 125000  # 1/8000s
         self.shutter_max_ns = 30000000000  # 30s
         
+        # Preview frames are scaled off the GUI thread; at most one update is queued at a time
+        screen = QGuiApplication.primaryScreen()
+        refresh_hz = screen.refreshRate() if screen and screen.refreshRate() > 0 else 60.0
+        self.preview = PreviewPresenter(refresh_hz=refresh_hz, max_fps=self.PREVIEW_FPS[1])
+        self.preview.tracer = self.tracer
+        
         self.setup_ui()
         self.setup_connections()
         
-        self.frame_received.connect(self.update_frame)
-        
+        self.preview.set_target_size(self.video_label.width(), self.video_label.height())
+        self.preview.on_frame_ready = self.preview_ready.emit
+        self.preview_ready.connect(self.update_frame)
+        self.replay_saved.connect(self.on_replay_saved)
+        self.preview.start()
+    
     def setup_ui(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -128,6 +169,12 @@ class MainWindow(QMainWindow):
         vcam_group = self.create_vcam_group()
         layout.addWidget(vcam_group)
         
+        recording_group = self.create_recording_group()
+        layout.addWidget(recording_group)
+        
+        preview_group = self.create_preview_group()
+        layout.addWidget(preview_group)
+        
         layout.addStretch()
         panel.setLayout(layout)
         
@@ -372,16 +419,65 @@ class MainWindow(QMainWindow):
         group.setLayout(layout)
         return group
     
+    def create_recording_group(self):
+        group = QGroupBox("ضبط")
+        layout = QVBoxLayout()
+        
+        self.record_status_label = QLabel("وضعیت: متوقف")
+        layout.addWidget(self.record_status_label)
+        
+        self.record_toggle_btn = QPushButton("شروع ضبط")
+        self.record_toggle_btn.clicked.connect(self.toggle_recording)
+        layout.addWidget(self.record_toggle_btn)
+        
+        self.save_replay_btn = QPushButton(f"ذخیره {self.REPLAY_SECONDS} ثانیه آخر")
+        self.save_replay_btn.clicked.connect(self.save_replay)
+        layout.addWidget(self.save_replay_btn)
+        
+        self.dump_trace_btn = QPushButton("ذخیره گزارش تأخیر")
+        self.dump_trace_btn.clicked.connect(self.dump_latency_trace)
+        layout.addWidget(self.dump_trace_btn)
+        
+        group.setLayout(layout)
+        return group
+    
+    def create_preview_group(self):
+        group = QGroupBox("پیش‌نمایش")
+        layout = QVBoxLayout()
+        
+        fps_layout = QHBoxLayout()
+        fps_label = QLabel("FPS پیش‌نمایش:")
+        self.preview_fps_combo = QComboBox()
+        self.preview_fps_combo.addItems(["15", "30", "نرخ نمایشگر"])
+        self.preview_fps_combo.setCurrentIndex(1)
+        self.preview_fps_combo.currentIndexChanged.connect(self.change_preview_budget)
+        fps_layout.addWidget(fps_label)
+        fps_layout.addWidget(self.preview_fps_combo)
+        layout.addLayout(fps_layout)
+        
+        size_layout = QHBoxLayout()
+        size_label = QLabel("حداکثر اندازه:")
+        self.preview_size_combo = QComboBox()
+        self.preview_size_combo.addItems(["اندازه پنجره", "1280x720", "640x360"])
+        self.preview_size_combo.currentIndexChanged.connect(self.change_preview_budget)
+        size_layout.addWidget(size_label)
+        size_layout.addWidget(self.preview_size_combo)
+        layout.addLayout(size_layout)
+        
+        group.setLayout(layout)
+        return group
+    
     def setup_connections(self):
         self.connection_manager.on_connected = self.on_connected
         self.connection_manager.on_disconnected = self.on_disconnected
         
-        self.video_decoder.on_frame_decoded = self.on_frame_decoded
+        self.video_decoder.add_sink(self.on_frame_decoded)
         
         self.stream_receiver.on_video_config = self.video_decoder.set_config
         self.stream_receiver.on_video_frame = self.video_decoder.decode
         self.stream_receiver.on_audio_config = self.audio_decoder.set_config
         self.stream_receiver.on_audio_frame = self.audio_decoder.decode
+        self.stream_receiver.on_audio_conceal = self.audio_decoder.conceal
     
     def on_mode_changed(self):
         self.is_manual_mode = self.manual_radio.isChecked()
@@ -424,6 +520,9 @@ class MainWindow(QMainWindow):
     
     def on_connected(self):
         self.status_label.setText("وضعیت: متصل")
+        # Device timestamps restart with a new session
+        self.replay_buffer.clear()
+        self.tracer.clear_frames()
         self.connect_wifi_btn.setEnabled(False)
         self.connect_usb_btn.setEnabled(False)
         self.disconnect_btn.setEnabled(True)
@@ -443,31 +542,26 @@ class MainWindow(QMainWindow):
         self.video_label.setText("در انتظار اتصال...")
         logger.info("Disconnected from Android device")
     
-    def on_frame_decoded(self, frame: np.ndarray):
-        self.current_frame = frame
-        self.frame_received.emit(frame)
+    def on_frame_decoded(self, frame):
+        # Both sinks retain the frame only if they keep it past this call
+        self.preview.submit(frame)
         
         if self.virtual_camera.is_active():
             self.virtual_camera.send_frame(frame)
     
-    def update_frame(self, frame: np.ndarray):
+    def update_frame(self):
         try:
-            height, width, channel = frame.shape
-            bytes_per_line = 3 * width
-            
-            q_image = QImage(frame.data, width, height, bytes_per_line, QImage.Format.Format_BGR888)
-            pixmap = QPixmap.fromImage(q_image)
-            
-            scaled_pixmap = pixmap.scaled(
-                self.video_label.size(),
-                Qt.AspectRatioMode.KeepAspectRatio,
-                Qt.TransformationMode.SmoothTransformation
-            )
-            
-            self.video_label.setPixmap(scaled_pixmap)
+            self.preview.set_target_size(self.video_label.width(), self.video_label.height())
+            self.preview.present(self._show_preview)
         except Exception as e:
             logger.error(f"Error updating frame display: {e}", exc_info=True)
     
+    def _show_preview(self, frame: np.ndarray):
+        """Draw an already scaled RGB frame; fromImage copies it out of the presenter's buffer"""
+        height, width = frame.shape[:2]
+        q_image = QImage(frame.data, width, height, 3 * width, QImage.Format.Format_RGB888)
+        self.video_label.setPixmap(QPixmap.fromImage(q_image))
+    
     def change_resolution(self):
         index = self.resolution_combo.currentIndex()
         resolutions = [(640, 480), (1280, 720), (1920, 1080)]
@@ -551,6 +645,29 @@ class MainWindow(QMainWindow):
         self.control_commands.get_camera_capabilities()
         logger.info("Requested camera capabilities")
     
+    def change_preview_budget(self):
+        max_fps = self.PREVIEW_FPS[self.preview_fps_combo.currentIndex()]
+        max_size = self.PREVIEW_SIZES[self.preview_size_combo.currentIndex()]
+        self.preview.set_budget(max_fps, max_size)
+        logger.info(f"Preview budget: {max_fps or 'display'} fps, max size {max_size or 'window'}")
+    
+    def _update_preview_activity(self):
+        # Hidden or minimized: the decode thread skips the preview entirely
+        self.preview.set_active(self.isVisible() and not self.isMinimized())
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        self._update_preview_activity()
+    
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self._update_preview_activity()
+    
+    def changeEvent(self, event):
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange:
+            self._update_preview_activity()
+    
     def toggle_virtual_camera(self):
         if self.virtual_camera.is_active():
             self.virtual_camera.stop()
@@ -563,8 +680,55 @@ class MainWindow(QMainWindow):
             else:
                 QMessageBox.warning(self, "خطا", "فعال‌سازی دوربین مجازی ناموفق بود")
     
+    def toggle_recording(self):
+        if self.recorder:
+            self.stream_receiver.remove_packet_sink(self.recorder.on_packet)
+            self.recorder.stop()
+            files = self.recorder.files
+            self.recorder = None
+            self.record_status_label.setText(f"وضعیت: متوقف ({len(files)} فایل)")
+            self.record_toggle_btn.setText("شروع ضبط")
+        else:
+            path = os.path.join("recordings", time.strftime("recording_%Y%m%d_%H%M%S.mp4"))
+            self.recorder = StreamRecorder(path)
+            # Starts mid-stream from the configs already received; the file begins at the next keyframe
+            self.recorder.start(self.stream_receiver.last_video_config, self.stream_receiver.last_audio_config)
+            self.stream_receiver.add_packet_sink(self.recorder.on_packet)
+            self.record_status_label.setText(f"وضعیت: در حال ضبط - {path}")
+            self.record_toggle_btn.setText("توقف ضبط")
+    
+    def save_replay(self):
+        path = os.path.join("recordings", time.strftime("replay_%Y%m%d_%H%M%S.mp4"))
+        # Remuxed on a worker; the result comes back through replay_saved
+        if self.replay_buffer.save(path, self.REPLAY_SECONDS):
+            self.save_replay_btn.setEnabled(False)
+        else:
+            QMessageBox.warning(self, "خطا", "چیزی برای ذخیره در بافر بازپخش نیست")
+    
+    def on_replay_saved(self, files: list, error: str):
+        self.save_replay_btn.setEnabled(True)
+        if error:
+            QMessageBox.warning(self, "خطا", f"ذخیره بازپخش ناموفق بود: {error}")
+        else:
+            self.record_status_label.setText(f"بازپخش ذخیره شد: {', '.join(files)}")
+    
+    def dump_latency_trace(self):
+        path = os.path.join("traces", time.strftime("latency_%Y%m%d_%H%M%S.json"))
+        try:
+            os.makedirs("traces", exist_ok=True)
+            stats = self.tracer.dump(path)
+        except OSError as e:
+            QMessageBox.warning(self, "خطا", f"ذخیره گزارش تأخیر ناموفق بود: {e}")
+            return
+        total = stats['end_to_end']['vcam_sent']
+        self.record_status_label.setText(f"گزارش تأخیر ذخیره شد: {path} "
+                                         f"(p50 {total['p50_ms']:.1f} / p99 {total['p99_ms']:.1f} ms)")
+    
     def closeEvent(self, event):
+        if self.recorder:
+            self.toggle_recording()
         self.disconnect()
+        self.preview.stop()
         self.virtual_camera.stop()
         self.video_decoder.close()
         self.audio_decoder.close()
@@ -0,0 +1,226 @@
+import time
+import logging
+import threading
+import cv2
+import numpy as np
+from typing import Optional, Callable, Tuple
+from streaming.tracing import TRACE_PRESENT
+
+logger = logging.getLogger(__name__)
+
+class PreviewPresenter:
+    """Latest-frame-wins preview: frames are scaled for display on a worker thread.
+    
+    The decoder hands frames to submit(), which only swaps them into a
+    single-slot mailbox, so a slow GUI can never make frames pile up. The
+    worker scales the newest frame to fit the preview widget into a reused
+    back buffer, swaps it with the front buffer and calls on_frame_ready.
+    It does that at most refresh_hz times per second. It does not call again
+    until present() has taken the previous frame, so the GUI event queue
+    holds at most one pending preview update.
+    
+    The preview has its own budget, independent of the virtual camera and
+    recording. A max_fps below the refresh rate decimates frames in submit()
+    before any work is done, and max_size caps the preview resolution.
+    Decoded frames are converted straight at the preview size. While
+    inactive (window hidden or minimized) submit() returns immediately.
+    """
+    def __init__(self, refresh_hz: float = 60.0, max_fps: Optional[float] = None,
+                 max_size: Optional[Tuple[int, int]] = None, pixel_format: str = 'rgb24'):
+        self.refresh_hz = refresh_hz
+        self.pixel_format = pixel_format
+        self.set_budget(max_fps, max_size)
+        self.active = True
+        
+        # Called on the worker thread when a new front buffer is ready
+        self.on_frame_ready: Optional[Callable[[], None]] = None
+        # Optional FrameTracer, stamped when a decoded frame has been drawn
+        self.tracer = None
+        
+        self.target_size: Tuple[int, int] = (0, 0)
+        self._mailbox = None
+        self._cond = threading.Condition()
+        self._front: Optional[np.ndarray] = None
+        self._back: Optional[np.ndarray] = None
+        # Device timestamps of the frames in the buffers (None for ndarray frames)
+        self._front_timestamp: Optional[int] = None
+        self._back_timestamp: Optional[int] = None
+        self._buffer_lock = threading.Lock()
+        self._ready_pending = False
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        
+        self.frames_submitted = 0
+        self.frames_decimated = 0
+        self.frames_coalesced = 0
+        self.frames_scaled = 0
+        self.frames_presented = 0
+    
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._present_loop, name='preview', daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        with self._cond:
+            self._running = False
+            pending, self._mailbox = self._mailbox, None
+            self._cond.notify_all()
+        self._release(pending)
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+    
+    def set_target_size(self, width: int, height: int):
+        """Size of the preview widget; picked up with the next frame"""
+        self.target_size = (width, height)
+    
+    def set_budget(self, max_fps: Optional[float] = None, max_size: Optional[Tuple[int, int]] = None):
+        """Preview frame rate and size limits; None follows the display refresh / widget size"""
+        self.max_fps = max_fps
+        self.max_size = max_size
+        rate = min(self.refresh_hz, max_fps) if max_fps else self.refresh_hz
+        self.refresh_interval = 1.0 / rate
+        self._next_due = 0.0
+    
+    def set_active(self, active: bool):
+        """Stop all preview work while nothing is visible; the pending frame is dropped"""
+        self.active = active
+        if not active:
+            with self._cond:
+                pending, self._mailbox = self._mailbox, None
+            self._release(pending)
+    
+    def submit(self, frame):
+        """Offer a decoded frame (DecodedFrame or RGB ndarray); replaces any frame not yet scaled"""
+        if not self._running or not self.active:
+            return
+        if time.monotonic() < self._next_due:
+            # Within the preview frame interval: decimated without touching the frame
+            self.frames_decimated += 1
+            return
+        if not isinstance(frame, np.ndarray):
+            frame.retain()
+        
+        with self._cond:
+            stale, self._mailbox = self._mailbox, frame
+            self.frames_submitted += 1
+            if stale is not None:
+                self.frames_coalesced += 1
+            self._cond.notify()
+        self._release(stale)
+    
+    @staticmethod
+    def _release(frame):
+        if frame is not None and not isinstance(frame, np.ndarray):
+            frame.release()
+    
+    @staticmethod
+    def fit_size(width: int, height: int, target_width: int, target_height: int) -> Tuple[int, int]:
+        """Largest size with the frame's aspect ratio that fits the target"""
+        scale = min(target_width / width, target_height / height)
+        return max(1, int(width * scale)), max(1, int(height * scale))
+    
+    def _present_loop(self):
+        next_present = time.monotonic()
+        while True:
+            with self._cond:
+                while self._running and self._mailbox is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+            
+            # Coalesce to display refresh: frames arriving meanwhile replace each other in the mailbox
+            delay = next_present - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            
+            with self._cond:
+                frame, self._mailbox = self._mailbox, None
+            if frame is None:
+                continue
+            if self.max_fps and self.max_fps < self.refresh_hz:
+                self._next_due = time.monotonic() + self.refresh_interval * 0.9
+            
+            try:
+                if self._scale(frame):
+                    self._publish()
+            except Exception as e:
+                logger.error(f"Error scaling preview frame: {e}", exc_info=True)
+            finally:
+                self._release(frame)
+            next_present = max(next_present + self.refresh_interval, time.monotonic())
+    
+    def _scale(self, frame) -> bool:
+        """Scale into the back buffer, reallocating it only when the fitted size changes"""
+        target_width, target_height = self.target_size
+        if self.max_size:
+            target_width = min(target_width, self.max_size[0])
+            target_height = min(target_height, self.max_size[1])
+        if target_width <= 0 or target_height <= 0:
+            return False
+        
+        if isinstance(frame, np.ndarray):
+            source = frame
+            size = self.fit_size(source.shape[1], source.shape[0], target_width, target_height)
+        else:
+            # Converted directly at the preview size; full-size conversions stay with other consumers
+            size = self.fit_size(frame.width, frame.height, target_width, target_height)
+            size = (size[0] // 2 * 2 or size[0], size[1] // 2 * 2 or size[1])
+            source = frame.to_ndarray(self.pixel_format, *size)
+        height, width = source.shape[:2]
+        
+        back = self._back
+        if back is None or (back.shape[1], back.shape[0]) != size:
+            back = self._back = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        
+        if size == (width, height):
+            np.copyto(back, source)
+        else:
+            interpolation = cv2.INTER_AREA if size[0] < width else cv2.INTER_LINEAR
+            cv2.resize(source, size, dst=back, interpolation=interpolation)
+        self._back_timestamp = getattr(frame, 'timestamp', None)
+        self.frames_scaled += 1
+        return True
+    
+    def _publish(self):
+        with self._buffer_lock:
+            self._front, self._back = self._back, self._front
+            self._front_timestamp, self._back_timestamp = self._back_timestamp, self._front_timestamp
+            notify = not self._ready_pending
+            self._ready_pending = True
+        if notify and self.on_frame_ready:
+            self.on_frame_ready()
+    
+    def present(self, draw: Callable[[np.ndarray], None]) -> bool:
+        """
+        GUI thread: call draw with the newest scaled frame
+        
+        The buffer is only valid inside draw (the worker reuses it afterwards),
+        so draw must copy it, e.g. QPixmap.fromImage.
+        """
+        with self._buffer_lock:
+            self._ready_pending = False
+            if self._front is None:
+                return False
+            draw(self._front)
+            self.frames_presented += 1
+            if self.tracer and self._front_timestamp is not None:
+                self.tracer.mark(TRACE_PRESENT, self._front_timestamp)
+            return True
+    
+    def get_stats(self) -> dict:
+        return {
+            'active': self.active,
+            'max_fps': self.max_fps,
+            'max_size': self.max_size,
+            'submitted': self.frames_submitted,
+            'decimated': self.frames_decimated,
+            'coalesced': self.frames_coalesced,
+            'scaled': self.frames_scaled,
+            'presented': self.frames_presented,
+            'target_size': self.target_size,
+            'buffer_size': None if self._front is None else (self._front.shape[1], self._front.shape[0])
+        }
@@ -1,12 +1,15 @@
 from .interface import VirtualCameraInterface
 from .device_manager import VirtualDeviceManager
-from .obs_controller import OBSController
-from .audio_setup import VirtualAudioSetup
+from .virtucore_camera import VirtuCoreCamera
+from .driver_backend import Win32DriverBackend, LoopbackDriverBackend
+from .frame_ring import SharedFrameRing, SharedFrameRingReader
 
 __all__ = [
     'VirtualCameraInterface',
-    'VirtualDeviceManager', 
-    'OBSController',
-    'VirtualAudioSetup'
+    'VirtualDeviceManager',
+    'VirtuCoreCamera',
+    'Win32DriverBackend',
+    'LoopbackDriverBackend',
+    'SharedFrameRing',
+    'SharedFrameRingReader'
 ]
-
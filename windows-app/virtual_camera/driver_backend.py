@@ -0,0 +1,193 @@
+import ctypes
+import struct
+import logging
+import numpy as np
+from typing import Optional, List
+
+logger = logging.getLogger(__name__)
+
+GENERIC_READ = 0x80000000
+GENERIC_WRITE = 0x40000000
+OPEN_EXISTING = 3
+INVALID_HANDLE_VALUE = -1
+
+ERROR_INVALID_PARAMETER = 87
+ERROR_INSUFFICIENT_BUFFER = 122
+
+class Win32DriverBackend:
+    """ارتباط با درایور از طریق CreateFileW/DeviceIoControl"""
+    def __init__(self):
+        self._kernel32 = None
+        self.handle = None
+    
+    @property
+    def kernel32(self):
+        if self._kernel32 is None:
+            self._kernel32 = ctypes.windll.kernel32
+        return self._kernel32
+    
+    def probe(self, device_path: str) -> bool:
+        """بررسی وجود دستگاه بدون باز نگه داشتن آن"""
+        handle = self.kernel32.CreateFileW(device_path, GENERIC_READ, 0, None, OPEN_EXISTING, 0, None)
+        if handle == INVALID_HANDLE_VALUE:
+            return False
+        self.kernel32.CloseHandle(handle)
+        return True
+    
+    def open(self, device_path: str) -> bool:
+        self.handle = self.kernel32.CreateFileW(
+            device_path,
+            GENERIC_READ | GENERIC_WRITE,
+            0, None, OPEN_EXISTING, 0, None
+        )
+        if self.handle == INVALID_HANDLE_VALUE:
+            self.handle = None
+            return False
+        return True
+    
+    def close(self):
+        if self.handle is not None:
+            self.kernel32.CloseHandle(self.handle)
+        self.handle = None
+    
+    def ioctl(self, code: int, in_buffer, in_size: int, out_buffer=None, out_size: int = 0) -> Optional[int]:
+        """اجرای DeviceIoControl؛ خروجی: تعداد بایت برگشتی یا None در صورت خطا"""
+        from ctypes import wintypes
+        bytes_returned = wintypes.DWORD()
+        result = self.kernel32.DeviceIoControl(
+            self.handle,
+            code,
+            in_buffer,
+            in_size,
+            out_buffer,
+            out_size,
+            ctypes.byref(bytes_returned),
+            None
+        )
+        if not result:
+            return None
+        return bytes_returned.value
+    
+    def last_error(self) -> int:
+        return self.kernel32.GetLastError()
+
+class LoopbackDriverBackend:
+    """جایگزین درایور برای تست و benchmark روی Linux.
+    
+    بافرهای ارسالی را (در صورت record=True) کپی و نگهداری می‌کند تا
+    محتوای بایت‌ها قابل مقایسه باشد، و به IOCTL وضعیت پاسخ می‌دهد.
+    header و اندازه داده هر فریم را مانند VCamHandleSendFrame بررسی می‌کند
+    و SET_FORMAT را فقط برای فرمت‌های supported_formats می‌پذیرد.
+    """
+    def __init__(self, record: bool = True, max_recorded: int = 16, supported_formats=(0, 1, 2)):
+        self.record = record
+        self.max_recorded = max_recorded
+        self.supported_formats = tuple(supported_formats)
+        self.is_open = False
+        self.calls = 0
+        self.bytes_received = 0
+        self.rejected = 0
+        self.sent: List[bytes] = []
+        self.status = (1, 0, 0, 0, 0)
+        self.requested_format = None
+        self._error = 0
+    
+    def probe(self, device_path: str) -> bool:
+        return True
+    
+    def open(self, device_path: str) -> bool:
+        self.is_open = True
+        return True
+    
+    def close(self):
+        self.is_open = False
+    
+    def ioctl(self, code: int, in_buffer, in_size: int, out_buffer=None, out_size: int = 0) -> Optional[int]:
+        from .virtucore_camera import IOCTL_VCAM_SEND_FRAME, IOCTL_VCAM_SET_FORMAT
+        
+        if not self.is_open:
+            return None
+        
+        self.calls += 1
+        data = b''
+        if in_buffer is not None and in_size:
+            self.bytes_received += in_size
+            data = bytes(memoryview(in_buffer).cast('B')[:in_size])
+        
+        if code == IOCTL_VCAM_SET_FORMAT:
+            return self._set_format(data)
+        
+        if code == IOCTL_VCAM_SEND_FRAME:
+            error = self.validate_frame(data)
+            if error:
+                return self._fail(error)
+            if self.record:
+                self.sent.append(data)
+                if len(self.sent) > self.max_recorded:
+                    self.sent.pop(0)
+        
+        if out_buffer is not None and out_size >= 20:
+            status = struct.pack('IIIII', *self.status)
+            ctypes.memmove(out_buffer, status, len(status))
+            return len(status)
+        return 0
+    
+    def _fail(self, error: int) -> None:
+        self.rejected += 1
+        self._error = error
+        return None
+    
+    def _set_format(self, data: bytes) -> Optional[int]:
+        from .virtucore_camera import FORMAT_REQUEST
+        
+        if len(data) < FORMAT_REQUEST.size:
+            return self._fail(ERROR_INSUFFICIENT_BUFFER)
+        
+        width, height, fmt, fps = FORMAT_REQUEST.unpack_from(data)
+        if fmt not in self.supported_formats or width == 0 or height == 0:
+            return self._fail(ERROR_INVALID_PARAMETER)
+        
+        self.requested_format = (width, height, fmt, fps)
+        return 0
+    
+    def validate_frame(self, data: bytes) -> int:
+        """بررسی مشابه درایور؛ کد خطای Win32 یا 0"""
+        from .virtucore_camera import FRAME_HEADER, FORMAT_NAMES, frame_data_size
+        
+        if len(data) < FRAME_HEADER.size:
+            return ERROR_INSUFFICIENT_BUFFER
+        
+        width, height, fmt, size, _ = FRAME_HEADER.unpack_from(data)
+        if fmt not in FORMAT_NAMES:
+            return ERROR_INVALID_PARAMETER
+        
+        expected = frame_data_size(width, height, fmt)
+        if size < expected or len(data) < FRAME_HEADER.size + expected:
+            return ERROR_INSUFFICIENT_BUFFER
+        
+        # NV12 و YUY2 به عرض و ارتفاع زوج نیاز دارند (chroma نصف رزولوشن)
+        if fmt != 0 and (width % 2 or height % 2):
+            return ERROR_INVALID_PARAMETER
+        return 0
+    
+    @staticmethod
+    def unpack_planes(data: bytes) -> dict:
+        """تفکیک داده یک فریم ارسالی به صفحه‌ها برای مقایسه در تست"""
+        from .virtucore_camera import FRAME_HEADER, FORMAT_NV12, FORMAT_YUY2
+        
+        width, height, fmt, size, timestamp = FRAME_HEADER.unpack_from(data)
+        payload = np.frombuffer(data, dtype=np.uint8, count=size, offset=FRAME_HEADER.size)
+        if fmt == FORMAT_NV12:
+            luma = width * height
+            uv = payload[luma:].reshape(height // 2, width // 2, 2)
+            return {'y': payload[:luma].reshape(height, width), 'u': uv[:, :, 0], 'v': uv[:, :, 1]}
+        if fmt == FORMAT_YUY2:
+            packed = payload.reshape(height, width // 2, 4)
+            y = np.empty((height, width), dtype=np.uint8)
+            y[:, 0::2] = packed[:, :, 0]
+            y[:, 1::2] = packed[:, :, 2]
+            return {'y': y, 'u': packed[:, :, 1], 'v': packed[:, :, 3]}
+        return {'rgb': payload.reshape(height, width, 3)}
+    
+    def last_error(self) -> int:
+        return self._error
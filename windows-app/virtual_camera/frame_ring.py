@@ -0,0 +1,295 @@
+"""
+Ring چندخانه‌ای فریم در حافظه مشترک برای دوربین مجازی
+
+چیدمان (little-endian، همه بخش‌ها روی مرز 64 بایت):
+    RING_HEADER  magic, version, slot_count, slot_capacity, latest_seq
+    هر slot:     SLOT_HEADER (seq, width, height, format, data_size, timestamp) + داده
+
+تحویل بدون قفل (seqlock در هر slot): نویسنده فریم n را در slot (n-1) % slot_count
+می‌نویسد. قبل از نوشتن seq آن slot را 2n-1 (فرد = در حال نوشتن) و بعد از نوشتن 2n
+(زوج = منتشر شده) می‌کند و در پایان latest_seq = n. خواننده اگر seq قبل و بعد از
+کپی برابر و زوج باشد فریم سالم است. نویسنده هیچ‌وقت منتظر خواننده نمی‌ماند.
+"""
+import os
+import mmap
+import struct
+import logging
+import numpy as np
+from typing import Optional, Tuple
+from multiprocessing import shared_memory
+
+logger = logging.getLogger(__name__)
+
+RING_MAGIC = 0x47524356  # 'VCRG'
+RING_VERSION = 1
+
+# نام mapping در virtual-camera/include/common.h
+SHARED_MEMORY_NAME = 'VirtualCameraSharedMemory'
+
+# magic, version, slot_count, slot_capacity, latest_seq
+RING_HEADER = struct.Struct('<IIIIQ')
+RING_HEADER_SIZE = 64
+LATEST_SEQ_OFFSET = 16
+
+# seq, width, height, format, data_size, timestamp (100ns)
+SLOT_HEADER = struct.Struct('<QIIIIQ')
+SLOT_HEADER_SIZE = 64
+
+ALIGNMENT = 64
+
+def _align(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def ring_size(slot_count: int, slot_capacity: int) -> int:
+    """اندازه کل حافظه مشترک"""
+    return RING_HEADER_SIZE + slot_count * (SLOT_HEADER_SIZE + _align(slot_capacity))
+
+def _read_ring_header(buf, name: str) -> Tuple[int, int, int]:
+    """(slot_count, slot_capacity, latest_seq) یک ring موجود؛ ValueError اگر segment یک ring نیست"""
+    if len(buf) < RING_HEADER_SIZE:
+        raise ValueError(f"{name} is not a frame ring: {len(buf)} bytes")
+    magic, version, slot_count, slot_capacity, latest_seq = RING_HEADER.unpack_from(buf, 0)
+    if magic != RING_MAGIC or version != RING_VERSION:
+        raise ValueError(f"{name} is not a frame ring: magic=0x{magic:08X} version={version}")
+    return slot_count, slot_capacity, latest_seq
+
+class _Mapping:
+    """اتصال به segment موجود بدون ثبت در resource_tracker؛ حذف segment فقط کار نویسنده است"""
+    def __init__(self, name: str):
+        if os.name == 'nt':
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._mmap = None
+            self.buf = self._shm.buf
+        else:
+            # همان فایلی که SharedMemory روی POSIX در /dev/shm می‌سازد
+            fd = os.open(os.path.join('/dev/shm', name.lstrip('/')), os.O_RDWR)
+            try:
+                self._mmap = mmap.mmap(fd, os.fstat(fd).st_size)
+            finally:
+                os.close(fd)
+            self._shm = None
+            self.buf = memoryview(self._mmap)
+    
+    def close(self):
+        self.buf.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        else:
+            self._shm.close()
+
+class SharedFrameRing:
+    """
+    نویسنده ring: فریم مستقیماً در slot بعدی نوشته می‌شود
+    
+    با create=False به ring موجود وصل می‌شود: چیدمان و latest_seq از header آن
+    خوانده می‌شود و header بازنویسی نمی‌شود.
+    """
+    def __init__(self, name: str = SHARED_MEMORY_NAME, slot_count: int = 3,
+                 slot_capacity: int = 1920 * 1080 * 3, create: bool = True):
+        if slot_count < 2:
+            raise ValueError("slot_count must be at least 2")
+        
+        self.name = name
+        self.owner = create
+        
+        seq = 0
+        if create:
+            size = ring_size(slot_count, slot_capacity)
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            except FileExistsError:
+                self._remove_stale(name)
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            RING_HEADER.pack_into(self.shm.buf, 0, RING_MAGIC, RING_VERSION, slot_count, slot_capacity, 0)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            try:
+                slot_count, slot_capacity, seq = _read_ring_header(self.shm.buf, name)
+            except ValueError:
+                self.shm.close()
+                raise
+        
+        self.slot_count = slot_count
+        self.slot_capacity = slot_capacity
+        self.slot_stride = SLOT_HEADER_SIZE + _align(slot_capacity)
+        self.buf = self.shm.buf
+        self._array = np.frombuffer(self.buf, dtype=np.uint8)
+        
+        self.seq = seq
+        self._pending = None
+        self.frames_written = 0
+        self.bytes_written = 0
+        
+        logger.info(f"✓ ring حافظه مشترک {name}: {slot_count} خانه × {slot_capacity} بایت")
+    
+    @staticmethod
+    def _remove_stale(name: str):
+        """حذف segment باقی‌مانده از اجرای قبلی؛ segmentی که ring نیست دست نمی‌خورد"""
+        mapping = _Mapping(name)
+        try:
+            _read_ring_header(mapping.buf, name)
+        except ValueError as e:
+            raise FileExistsError(f"shared memory {name} already exists and is not a frame ring: {e}") from None
+        finally:
+            mapping.close()
+        
+        stale = shared_memory.SharedMemory(name=name)
+        stale.close()
+        stale.unlink()
+        logger.warning(f"ring باقی‌مانده {name} از اجرای قبلی حذف شد")
+    
+    def _slot_offset(self, seq: int) -> int:
+        return RING_HEADER_SIZE + ((seq - 1) % self.slot_count) * self.slot_stride
+    
+    def begin_write(self, size: int) -> np.ndarray:
+        """
+        رزرو slot بعدی و برگرداندن نمای numpy روی ناحیه داده آن
+        
+        تا commit() خواننده این slot را در حال نوشتن می‌بیند و از آن رد می‌شود.
+        """
+        if size > self.slot_capacity:
+            raise ValueError(f"frame of {size} bytes exceeds slot capacity {self.slot_capacity}")
+        
+        seq = self.seq + 1
+        offset = self._slot_offset(seq)
+        struct.pack_into('<Q', self.buf, offset, 2 * seq - 1)
+        self._pending = (seq, offset, size)
+        
+        start = offset + SLOT_HEADER_SIZE
+        return self._array[start:start + size]
+    
+    def commit(self, width: int, height: int, fmt: int, timestamp: int) -> int:
+        """انتشار slot رزرو شده؛ شماره ترتیب فریم را برمی‌گرداند"""
+        if self._pending is None:
+            raise RuntimeError("commit() without begin_write()")
+        
+        seq, offset, size = self._pending
+        self._pending = None
+        
+        # اول metadata، سپس seq زوج و در پایان latest_seq
+        struct.pack_into('<IIIIQ', self.buf, offset + 8, width, height, fmt, size, timestamp)
+        struct.pack_into('<Q', self.buf, offset, 2 * seq)
+        struct.pack_into('<Q', self.buf, LATEST_SEQ_OFFSET, seq)
+        
+        self.seq = seq
+        self.frames_written += 1
+        self.bytes_written += size
+        return seq
+    
+    def latest_view(self) -> np.ndarray:
+        """نمای داده آخرین فریم منتشر شده"""
+        if self.seq == 0:
+            raise RuntimeError("no frame has been published")
+        
+        offset = self._slot_offset(self.seq)
+        size = SLOT_HEADER.unpack_from(self.buf, offset)[4]
+        start = offset + SLOT_HEADER_SIZE
+        return self._array[start:start + size]
+    
+    def write_frame(self, data, width: int, height: int, fmt: int, timestamp: int) -> int:
+        """کپی یک فریم آماده در ring"""
+        source = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data.reshape(-1)
+        np.copyto(self.begin_write(source.size), source)
+        return self.commit(width, height, fmt, timestamp)
+    
+    def get_stats(self) -> dict:
+        return {
+            'frames_written': self.frames_written,
+            'bytes_written': self.bytes_written,
+            'slot_count': self.slot_count,
+            'slot_capacity': self.slot_capacity,
+            'latest_seq': self.seq
+        }
+    
+    def close(self):
+        """آزادسازی؛ نویسنده segment را حذف می‌کند"""
+        self._array = None
+        self.buf = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # نمای numpy از begin_write/latest_view هنوز زنده است؛ mapping همراه آن آزاد می‌شود
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                # ring دیگری با همین نام جای این segment را گرفته و آن را حذف کرده است
+                pass
+
+class SharedFrameRingReader:
+    """خواننده جایگزین مصرف‌کننده (فیلتر دوربین) برای تست و benchmark"""
+    def __init__(self, name: str = SHARED_MEMORY_NAME):
+        self.mapping = _Mapping(name)
+        self.buf = self.mapping.buf
+        
+        try:
+            self.slot_count, self.slot_capacity, _ = _read_ring_header(self.buf, name)
+        except ValueError:
+            self.mapping.close()
+            raise
+        
+        self.slot_stride = SLOT_HEADER_SIZE + _align(self.slot_capacity)
+        self._array = np.frombuffer(self.buf, dtype=np.uint8)
+        self._data = None
+        self.last_seq = 0
+        self.frames_read = 0
+        self.frames_skipped = 0
+        self.torn_reads = 0
+    
+    def latest_seq(self) -> int:
+        return struct.unpack_from('<Q', self.buf, LATEST_SEQ_OFFSET)[0]
+    
+    def read_latest(self, retries: int = 3) -> Optional[Tuple[int, tuple, np.ndarray]]:
+        """
+        خواندن آخرین فریم منتشر شده
+        
+        Returns:
+            (seq, (width, height, format, timestamp), data) یا None اگر فریم جدیدی نیست.
+            data تا فراخوانی بعدی معتبر است.
+        """
+        for _ in range(retries):
+            seq = self.latest_seq()
+            if seq == 0 or seq == self.last_seq:
+                return None
+            
+            offset = RING_HEADER_SIZE + ((seq - 1) % self.slot_count) * self.slot_stride
+            slot_seq, width, height, fmt, size, timestamp = SLOT_HEADER.unpack_from(self.buf, offset)
+            if slot_seq != 2 * seq or size > self.slot_capacity:
+                self.torn_reads += 1
+                continue
+            
+            if self._data is None or self._data.size < size:
+                self._data = np.empty(self.slot_capacity, dtype=np.uint8)
+            data = self._data[:size]
+            start = offset + SLOT_HEADER_SIZE
+            np.copyto(data, self._array[start:start + size])
+            
+            # نویسنده در حین کپی به این slot برگشته است
+            if struct.unpack_from('<Q', self.buf, offset)[0] != slot_seq:
+                self.torn_reads += 1
+                continue
+            
+            if self.last_seq:
+                self.frames_skipped += seq - self.last_seq - 1
+            self.last_seq = seq
+            self.frames_read += 1
+            return seq, (width, height, fmt, timestamp), data
+        
+        return None
+    
+    def get_stats(self) -> dict:
+        return {
+            'frames_read': self.frames_read,
+            'frames_skipped': self.frames_skipped,
+            'torn_reads': self.torn_reads,
+            'last_seq': self.last_seq
+        }
+    
+    def close(self):
+        self._array = None
+        self._data = None
+        try:
+            self.mapping.close()
+        except BufferError:
+            pass
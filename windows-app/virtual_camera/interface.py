@@ -1,22 +1,76 @@
+import time
 import logging
+import threading
 import numpy as np
-from .virtucore_camera import VirtuCoreCamera
+from collections import deque
+from .virtucore_camera import VirtuCoreCamera, FORMAT_RGB24, FORMAT_NAMES
+from .scaler import FrameScaler
+from streaming.tracing import TRACE_VCAM_SENT
 
 logger = logging.getLogger(__name__)
 
 class VirtualCameraInterface:
-    def __init__(self):
-        self.camera = VirtuCoreCamera()
+    # فرمت RGB برای زمانی که درایور فرمت YUV را نپذیرد
+    PIXEL_FORMAT = 'rgb24'
+    # فرمت‌های native دیکودر که صفحه‌هایشان مستقیماً ارسال می‌شوند
+    PLANAR_SOURCES = ('yuv420p', 'nv12')
+    # بافرهای درایور برای 1920x1080 RGB24 تخصیص داده می‌شوند (VCamAllocateFrameBuffers)
+    # و فریم بزرگ‌تر رد می‌شود؛ استریم بزرگ‌تر با FrameScaler کوچک می‌شود
+    MAX_OUTPUT_SIZE = (1920, 1080)
+    # بازه زمانی صف فریم‌های منتظر زمان نمایش در حالت همگام با صدا: ساعت صدا تا حداکثر
+    # تاخیر jitter buffer (300ms) به علاوه بافر خروجی و تاخیر دستگاه از ورود فریم‌ها عقب است
+    MAX_PENDING_US = 750_000
+    # سقف تعداد فریم‌های صف برای محدود ماندن حافظه
+    MAX_PENDING = 120
+    # فریمی که بیش از این جلوتر از ساعت است یعنی ساعت معتبر نیست (شروع دوباره encoder)
+    MAX_LEAD_US = 1_000_000
+    
+    def __init__(self, backend=None, preferred_formats=None, fps: int = 30, paced: bool = True,
+                 output_size=None, letterbox: bool = True):
+        self.camera = VirtuCoreCamera(backend=backend)
+        self.preferred_formats = preferred_formats
         self.is_running = False
-        self.width = 1920
-        self.height = 1080
         
+        # اندازه خروجی: به طور پیش‌فرض همان رزولوشن استریم؛ output_size آن را ثابت می‌کند
+        self.output_size = output_size
+        self.letterbox = letterbox
+        self.width, self.height = output_size or (1920, 1080)
+        self.source_size = None
+        self.scaler = None
+        
+        # تحویل در thread جدا با نرخ ثابت؛ mailbox فقط آخرین فریم را نگه می‌دارد
+        self.fps = fps
+        self.paced = paced
+        self._mailbox = None
+        self._mailbox_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._delivery_thread = None
+        
+        # AVSyncEngine اختیاری: فریم‌ها به ترتیب timestamp صف می‌شوند و وقتی
+        # ساعت صدا به آن‌ها برسد تحویل می‌شوند؛ بدون آن آخرین فریم برنده است
+        self.av_sync = None
+        self._pending = deque()
+        # FrameTracer اختیاری: پس از پذیرفته شدن فریم دیکود شده توسط درایور مهر زمانی می‌خورد
+        self.tracer = None
+        
+        self.frames_delivered = 0
+        self.frames_repeated = 0
+        self.frames_dropped = 0
+        self.late_ticks = 0
+    
     def start(self) -> bool:
         """راه‌اندازی دوربین مجازی VirtuCore"""
         try:
             if self.camera.open():
+                fmt = self._negotiate()
+                self.source_size = None
                 self.is_running = True
-                logger.info("✓ دوربین مجازی VirtuCore فعال شد")
+                
+                if self.paced:
+                    self._stop_event.clear()
+                    self._delivery_thread = threading.Thread(target=self._delivery_loop, daemon=True)
+                    self._delivery_thread.start()
+                logger.info(f"✓ دوربین مجازی VirtuCore فعال شد ({FORMAT_NAMES[fmt]})")
                 return True
             else:
                 logger.error("خطا در باز کردن درایور دوربین")
@@ -27,6 +81,20 @@ class VirtualCameraInterface:
     
     def stop(self):
         """توقف دوربین مجازی"""
+        self.is_running = False
+        self._stop_event.set()
+        if self._delivery_thread:
+            self._delivery_thread.join(timeout=2.0)
+            self._delivery_thread = None
+        
+        with self._mailbox_lock:
+            pending, self._mailbox = self._mailbox, None
+            scheduled = list(self._pending)
+            self._pending.clear()
+        self._release(pending)
+        for frame in scheduled:
+            self._release(frame)
+        
         if self.camera:
             try:
                 self.camera.close()
@@ -34,15 +102,215 @@ class VirtualCameraInterface:
                 pass
         self.is_running = False
     
-    def send_frame(self, frame: np.ndarray):
-        """ارسال فریم به دوربین مجازی"""
+    def _negotiate(self) -> int:
+        if self.preferred_formats:
+            return self.camera.negotiate_format(self.width, self.height, self.fps, preferred=self.preferred_formats)
+        return self.camera.negotiate_format(self.width, self.height, self.fps)
+    
+    def _configure_output(self, width: int, height: int):
+        """
+        تنظیم اندازه خروجی برای رزولوشن جدید استریم
+        
+        اندازه ثابت فقط وقتی لازم است که output_size داده شده یا برنامه مصرف‌کننده
+        با اندازه مشخصی در حال استریم است؛ در غیر این صورت خروجی همان اندازه استریم
+        است و هیچ تغییر اندازه‌ای انجام نمی‌شود.
+        """
+        self.source_size = (width, height)
+        target = self.output_size
+        if target is None:
+            status = self.camera.get_status()
+            if status and status['is_streaming'] and status['width'] and status['height']:
+                target = (status['width'], status['height'])
+            else:
+                target = (width, height)
+        target = self._fit_driver(*target)
+        
+        if target != (self.width, self.height):
+            self.width, self.height = target
+            fmt = self._negotiate()
+            logger.info(f"اندازه خروجی دوربین مجازی: {self.width}x{self.height} ({FORMAT_NAMES[fmt]})")
+        
+        if target == (width, height):
+            self.scaler = None
+        elif self.scaler is None or not self.scaler.matches(width, height, *target):
+            self.scaler = FrameScaler(width, height, *target, letterbox=self.letterbox)
+            logger.info(f"نگاشت مقیاس {width}x{height} → {target[0]}x{target[1]} ساخته شد")
+    
+    def _fit_driver(self, width: int, height: int):
+        """بزرگ‌ترین اندازه زوج با همان نسبت تصویر که در بافر درایور جا می‌شود"""
+        max_width, max_height = self.MAX_OUTPUT_SIZE
+        if width <= max_width and height <= max_height:
+            return width, height
+        scale = min(max_width / width, max_height / height)
+        return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+    
+    def send_frame(self, frame):
+        """
+        ارسال فریم به دوربین مجازی (DecodedFrame یا آرایه BGR)
+        
+        در حالت paced فقط فریم در mailbox قرار می‌گیرد و thread دیکود منتظر درایور نمی‌ماند؛
+        فریمی که هنوز تحویل نشده با فریم جدیدتر جایگزین و drop شمرده می‌شود.
+        با av_sync فریم‌های دیکود شده به جای mailbox در صف زمان نمایش قرار می‌گیرند.
+        """
         if not self.is_running:
             return
         
+        if not self.paced:
+            if self._deliver(frame):
+                self._trace_sent(frame)
+            return
+        
+        if not isinstance(frame, np.ndarray):
+            frame.retain()
+        
+        with self._mailbox_lock:
+            if not self.is_running:
+                # stop() در همین فاصله mailbox را خالی کرده است
+                stale = frame
+            elif self.av_sync is not None and not isinstance(frame, np.ndarray):
+                stale = None
+                self._pending.append(frame)
+                if (len(self._pending) > self.MAX_PENDING or
+                        frame.timestamp - self._pending[0].timestamp > self.MAX_PENDING_US):
+                    # ساعت صدا بیش از ظرفیت صف عقب است: قدیمی‌ترین فریم به جای drop شدن
+                    # بدون نمایش در mailbox می‌رود و در tick بعد بدون زمان نمایش تحویل می‌شود
+                    stale, self._mailbox = self._mailbox, self._pending.popleft()
+                    if stale is not None:
+                        self.frames_dropped += 1
+            else:
+                stale, self._mailbox = self._mailbox, frame
+                if stale is not None:
+                    self.frames_dropped += 1
+        self._release(stale)
+    
+    @staticmethod
+    def _release(frame):
+        if frame is not None and not isinstance(frame, np.ndarray):
+            frame.release()
+    
+    def _take_due(self, period_us: float):
+        """
+        انتخاب فریم این tick از صف زمان‌بندی (با قفل mailbox)
+        
+        جدیدترین فریمی که تا نیم tick بعد موعدش رسیده تحویل می‌شود و فریم‌های
+        قدیمی‌تر از آن drop می‌شوند؛ فریم‌های آینده در صف می‌مانند.
+        Returns:
+            (frame, presentation_timestamp_100ns) یا (None, None)
+        """
+        if not self._pending:
+            return None, None
+        
+        clock = self.av_sync.master_clock_us()
+        if clock is None:
+            # هنوز نگاشت ساعتی نیست: مثل حالت عادی آخرین فریم برنده است
+            due = len(self._pending)
+        else:
+            due = 0
+            for frame in self._pending:
+                lead = frame.timestamp - clock
+                if lead > period_us / 2 and lead < self.MAX_LEAD_US:
+                    break
+                due += 1
+        if due == 0:
+            return None, None
+        
+        stale = [self._pending.popleft() for _ in range(due - 1)]
+        frame = self._pending.popleft()
+        self.frames_dropped += len(stale)
+        for old in stale:
+            self._release(old)
+        
+        if clock is None:
+            return frame, None
+        return frame, self.av_sync.to_host_100ns(frame.timestamp)
+    
+    def _next_frame(self, period_us: float):
+        """فریم این tick: فریم mailbox، یا فریم موعد رسیده صف زمان‌بندی؛ (frame, timestamp_100ns)"""
+        with self._mailbox_lock:
+            frame, self._mailbox = self._mailbox, None
+            if frame is None and self.av_sync is not None:
+                return self._take_due(period_us)
+        return frame, None
+    
+    def _delivery_loop(self):
+        """هر 1/fps ثانیه یک فریم: آخرین فریم رسیده (یا فریمی که موعدش رسیده)، یا تکرار فریم قبلی"""
+        period = 1.0 / self.fps
+        deadline = time.monotonic()
+        
+        while not self._stop_event.is_set():
+            frame, timestamp = self._next_frame(period * 1e6)
+            if frame is not None:
+                try:
+                    if self._deliver(frame, timestamp):
+                        self.frames_delivered += 1
+                        self._trace_sent(frame)
+                        if timestamp is not None:
+                            self.av_sync.record_video_presented(frame.timestamp)
+                finally:
+                    self._release(frame)
+            elif self.camera.resend_last():
+                self.frames_repeated += 1
+            
+            deadline += period
+            now = time.monotonic()
+            if now > deadline:
+                # درایور یا CPU عقب افتاده: به جای ارسال پشت سر هم، زمان‌بندی از نو شروع می‌شود
+                self.late_ticks += 1
+                deadline = now
+            else:
+                self._stop_event.wait(deadline - now)
+    
+    def _trace_sent(self, frame):
+        if self.tracer and not isinstance(frame, np.ndarray):
+            self.tracer.mark(TRACE_VCAM_SENT, frame.timestamp)
+    
+    def _deliver(self, frame, timestamp: int = None) -> bool:
+        """نوشتن یک فریم در درایور با فرمت مذاکره شده؛ timestamp زمان نمایش (100ns) است"""
         try:
-            self.camera.send_frame(frame, self.width, self.height)
+            if isinstance(frame, np.ndarray):
+                size = (frame.shape[1], frame.shape[0])
+            else:
+                size = (frame.width, frame.height)
+            if size != self.source_size:
+                self._configure_output(*size)
+            
+            if isinstance(frame, np.ndarray):
+                return self.camera.send_frame(frame, self.width, self.height, scaler=self.scaler,
+                                              timestamp=timestamp)
+            elif self.camera.format != FORMAT_RGB24:
+                if frame.native_format in self.PLANAR_SOURCES:
+                    # صفحه‌های YUV دیکودر بدون رفت و برگشت به RGB
+                    return self.camera.send_planes(frame.planes(), frame.native_format, timestamp,
+                                                   scaler=self.scaler)
+                else:
+                    nv12 = frame.to_ndarray('nv12', self.width, self.height)
+                    return self.camera.send_planes((nv12[:self.height], nv12[self.height:]), 'nv12', timestamp)
+            else:
+                # تبدیل رنگ بین همه مصرف‌کننده‌های همین فرمت مشترک است
+                rgb = frame.to_ndarray(self.PIXEL_FORMAT)
+                return self.camera.send_frame(rgb, self.width, self.height, pixel_format=self.PIXEL_FORMAT,
+                                              scaler=self.scaler, timestamp=timestamp)
         except Exception as e:
             logger.error(f"خطا در ارسال فریم: {e}")
+            return False
+    
+    def get_stats(self) -> dict:
+        """آمار تحویل: delivered, repeated, dropped"""
+        stats = {
+            'fps': self.fps,
+            'paced': self.paced,
+            'delivered': self.frames_delivered,
+            'repeated': self.frames_repeated,
+            'dropped': self.frames_dropped,
+            'late_ticks': self.late_ticks,
+            'output_size': (self.width, self.height),
+            'source_size': self.source_size,
+            'scaled': self.scaler is not None,
+            'synced': self.av_sync is not None,
+            'pending': len(self._pending)
+        }
+        stats.update(self.camera.get_stats())
+        return stats
     
     def is_active(self) -> bool:
         """بررسی وضعیت فعال بودن"""
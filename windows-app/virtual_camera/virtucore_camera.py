@@ -4,15 +4,12 @@ import numpy as np
 import cv2
 import time
 import logging
-from ctypes import wintypes
+from streaming.buffer_pool import default_pool
+from .driver_backend import Win32DriverBackend
+from .scaler import YUV_BLACK_LUMA, YUV_BLACK_CHROMA
 
 logger = logging.getLogger(__name__)
 
-GENERIC_READ = 0x80000000
-GENERIC_WRITE = 0x40000000
-OPEN_EXISTING = 3
-INVALID_HANDLE_VALUE = -1
-
 IOCTL_VCAM_SEND_FRAME = 0x222000
 IOCTL_VCAM_GET_STATUS = 0x222001
 IOCTL_VCAM_SET_FORMAT = 0x222002
@@ -21,27 +18,49 @@ FORMAT_RGB24 = 0
 FORMAT_NV12 = 1
 FORMAT_YUY2 = 2
 
+FORMAT_NAMES = {
+    FORMAT_RGB24: 'rgb24',
+    FORMAT_NV12: 'nv12',
+    FORMAT_YUY2: 'yuy2'
+}
+
+# width, height, format, data size, timestamp (100ns)
+FRAME_HEADER = struct.Struct('IIIIQ')
+
+# width, height, format, fps
+FORMAT_REQUEST = struct.Struct('IIII')
+
+def frame_data_size(width: int, height: int, fmt: int) -> int:
+    """اندازه داده فریم مطابق محاسبه درایور در VCamHandleSendFrame"""
+    if fmt == FORMAT_NV12:
+        return width * height * 3 // 2
+    if fmt == FORMAT_YUY2:
+        return width * height * 2
+    return width * height * 3
+
 class VirtuCoreCamera:
-    def __init__(self, device_path="\\\\.\\VirtualCamera"):
-        self.kernel32 = ctypes.windll.kernel32
+    def __init__(self, device_path="\\\\.\\VirtualCamera", buffer_pool=None, backend=None, frame_ring=None):
+        self.backend = backend or Win32DriverBackend()
+        # در صورت وجود، فریم‌ها به جای DeviceIoControl در ring حافظه مشترک نوشته می‌شوند
+        self.frame_ring = frame_ring
         self.device_path = device_path
-        self.handle = None
+        self.buffer_pool = buffer_pool or default_pool
         self.is_open = False
+        self.format = FORMAT_RGB24
+        
+        # بافر ثابت IOCTL: header + داده فریم، برای هر فریم دوباره ساخته نمی‌شود
+        self._frame_buffer = None
+        self._frame_buffer_ptr = None
+        # (width, height, format, size) آخرین فریمی که کامل ارسال شد
+        self._last_sent = None
+        
+        self.frames_sent = 0
+        self.bytes_copied = 0
         
     def check_driver_installed(self) -> bool:
         """بررسی نصب درایور"""
         try:
-            handle = self.kernel32.CreateFileW(
-                self.device_path,
-                GENERIC_READ,
-                0, None, OPEN_EXISTING, 0, None
-            )
-            
-            if handle == INVALID_HANDLE_VALUE:
-                return False
-            
-            self.kernel32.CloseHandle(handle)
-            return True
+            return self.backend.probe(self.device_path)
         except Exception as e:
             logger.error(f"خطا در بررسی درایور: {e}")
             return False
@@ -51,15 +70,14 @@ class VirtuCoreCamera:
         if self.is_open:
             return True
         
+        if self.frame_ring is not None:
+            self.is_open = True
+            logger.info(f"✓ ارسال فریم از طریق حافظه مشترک {self.frame_ring.name}")
+            return True
+        
         try:
-            self.handle = self.kernel32.CreateFileW(
-                self.device_path,
-                GENERIC_READ | GENERIC_WRITE,
-                0, None, OPEN_EXISTING, 0, None
-            )
-            
-            if self.handle == INVALID_HANDLE_VALUE:
-                error_code = self.kernel32.GetLastError()
+            if not self.backend.open(self.device_path):
+                error_code = self.backend.last_error()
                 logger.error(f"خطا در باز کردن درایور دوربین. کد خطا: {error_code}")
                 return False
             
@@ -73,29 +91,233 @@ class VirtuCoreCamera:
     
     def close(self):
         """بستن اتصال"""
-        if self.handle and self.handle != INVALID_HANDLE_VALUE:
+        if self.is_open:
             try:
-                self.kernel32.CloseHandle(self.handle)
+                self.backend.close()
                 logger.info("اتصال به درایور دوربین بسته شد")
             except:
                 pass
         
-        self.handle = None
         self.is_open = False
     
-    def send_frame(self, frame: np.ndarray, width: int = None, height: int = None) -> bool:
+    def _payload_view(self, size: int) -> np.ndarray:
+        """نمای numpy روی ناحیه داده بافر IOCTL؛ بافر فقط با تغییر اندازه دوباره ساخته می‌شود"""
+        self._last_sent = None
+        if self.frame_ring is not None:
+            return self.frame_ring.begin_write(size)
+        
+        total = FRAME_HEADER.size + size
+        if self._frame_buffer is None or len(self._frame_buffer) != total:
+            self._frame_buffer = bytearray(total)
+            self._frame_buffer_ptr = (ctypes.c_char * total).from_buffer(self._frame_buffer)
+            logger.info(f"بافر IOCTL دوربین: {total} بایت")
+        
+        return np.frombuffer(self._frame_buffer, dtype=np.uint8, count=size, offset=FRAME_HEADER.size)
+    
+    def _submit(self, width: int, height: int, fmt: int, size: int, timestamp: int = None) -> bool:
+        """نوشتن header در ابتدای بافر و ارسال آن به درایور"""
+        if timestamp is None:
+            # همان ساعت monotonic که AVSyncEngine زمان نمایش را روی آن نگاشت می‌کند
+            timestamp = int(time.monotonic() * 1e7)
+        
+        if self.frame_ring is not None:
+            self.frame_ring.commit(width, height, fmt, timestamp)
+            self.frames_sent += 1
+            self._last_sent = (width, height, fmt, size)
+            return True
+        
+        FRAME_HEADER.pack_into(
+            self._frame_buffer, 0,
+            width,
+            height,
+            fmt,
+            size,
+            timestamp
+        )
+        
+        result = self.backend.ioctl(
+            IOCTL_VCAM_SEND_FRAME,
+            self._frame_buffer_ptr,
+            len(self._frame_buffer)
+        )
+        
+        if result is None:
+            error_code = self.backend.last_error()
+            logger.error(f"خطا در ارسال فریم. کد خطا: {error_code}")
+            return False
+        
+        self.frames_sent += 1
+        self._last_sent = (width, height, fmt, size)
+        return True
+    
+    def resend_last(self, timestamp: int = None) -> bool:
+        """ارسال دوباره آخرین فریم بدون بسته‌بندی دوباره؛ داده هنوز در بافر IOCTL است"""
+        if not self.is_open or self._last_sent is None:
+            return False
+        
+        width, height, fmt, size = self._last_sent
+        try:
+            if self.frame_ring is not None:
+                np.copyto(self.frame_ring.begin_write(size), self.frame_ring.latest_view())
+            return self._submit(width, height, fmt, size, timestamp)
+        except Exception as e:
+            logger.error(f"خطا در resend_last: {e}")
+            return False
+    
+    def set_format(self, width: int, height: int, fmt: int, fps: int = 30) -> bool:
+        """اعلام فرمت خروجی به درایور (IOCTL_VCAM_SET_FORMAT)"""
+        if not self.is_open:
+            return False
+        
+        # هر slot حافظه مشترک فرمت خودش را دارد
+        if self.frame_ring is not None:
+            self.format = fmt
+            return True
+        
+        request = ctypes.create_string_buffer(FORMAT_REQUEST.pack(width, height, fmt, fps), FORMAT_REQUEST.size)
+        if self.backend.ioctl(IOCTL_VCAM_SET_FORMAT, request, FORMAT_REQUEST.size) is None:
+            logger.warning(f"درایور فرمت {FORMAT_NAMES.get(fmt, fmt)} را نپذیرفت. کد خطا: {self.backend.last_error()}")
+            return False
+        
+        self.format = fmt
+        logger.info(f"فرمت دوربین مجازی: {width}x{height} {FORMAT_NAMES.get(fmt, fmt)} @ {fps}fps")
+        return True
+    
+    def negotiate_format(self, width: int, height: int, fps: int = 30,
+                         preferred=(FORMAT_NV12, FORMAT_YUY2, FORMAT_RGB24)) -> int:
+        """
+        انتخاب فرمت خروجی
+        
+        اگر برنامه مصرف‌کننده در حال استریم است، فرمت pin آن (از GET_STATUS) اولویت دارد
+        چون درایور داده را بدون تبدیل به pin تحویل می‌دهد؛ وگرنه اولین فرمت قابل قبول از preferred.
+        """
+        candidates = list(preferred)
+        status = self.get_status()
+        if status and status['is_streaming'] and status['format'] in FORMAT_NAMES:
+            candidates.insert(0, status['format'])
+        
+        for fmt in candidates:
+            if self.set_format(width, height, fmt, fps):
+                return fmt
+        
+        self.format = FORMAT_RGB24
+        return self.format
+    
+    def send_planes(self, planes, source_format: str, timestamp: int = None, scaler=None) -> bool:
+        """
+        ارسال مستقیم صفحه‌های YUV دیکودر (yuv420p یا nv12) بدون عبور از RGB
+        
+        Args:
+            planes: (Y, U, V) برای yuv420p یا (Y, UV) برای nv12
+            source_format: فرمت native فریم دیکودر
+            scaler: FrameScaler برای خروجی با اندازه ثابت (اختیاری)
+        """
+        if not self.is_open:
+            logger.warning("درایور دوربین باز نیست")
+            return False
+        
+        leased = []
+        try:
+            if scaler is not None:
+                width, height = scaler.dst_size
+            else:
+                height, width = planes[0].shape
+            fmt = self.format if self.format in (FORMAT_NV12, FORMAT_YUY2) else FORMAT_NV12
+            size = frame_data_size(width, height, fmt)
+            payload = self._payload_view(size)
+            
+            if scaler is None:
+                if fmt == FORMAT_NV12:
+                    self._pack_nv12(payload, planes, source_format, width, height)
+                else:
+                    self._pack_yuy2(payload, planes, source_format, width, height)
+            elif fmt == FORMAT_NV12:
+                self._scale_nv12(payload, planes, source_format, width, height, scaler, leased)
+            else:
+                scratch = self.buffer_pool.lease((width * height * 3 // 2,))
+                leased.append(scratch)
+                self._scale_nv12(scratch.array, planes, source_format, width, height, scaler, leased)
+                self._pack_yuy2(payload, self._split_nv12(scratch.array, width, height), 'nv12', width, height)
+                self.bytes_copied += scratch.array.nbytes
+            self.bytes_copied += size
+            
+            return self._submit(width, height, fmt, size, timestamp)
+            
+        except Exception as e:
+            logger.error(f"خطا در send_planes: {e}")
+            return False
+        finally:
+            for buffer in leased:
+                buffer.release()
+    
+    @staticmethod
+    def _split_nv12(buffer: np.ndarray, width: int, height: int):
+        luma = width * height
+        return buffer[:luma].reshape(height, width), buffer[luma:].reshape(height // 2, width)
+    
+    def _scale_nv12(self, buffer: np.ndarray, planes, source_format: str, width: int, height: int,
+                    scaler, leased: list):
+        """تغییر اندازه صفحه‌ها با نگاشت از پیش محاسبه شده، مستقیماً در چیدمان NV12"""
+        y, uv = self._split_nv12(buffer, width, height)
+        scaler.scale(planes[0], y, YUV_BLACK_LUMA)
+        
+        src_height, src_width = planes[0].shape
+        if source_format == 'nv12':
+            src_uv = planes[1].reshape(src_height // 2, src_width // 2, 2)
+        else:
+            merged = self.buffer_pool.lease((src_height // 2, src_width // 2, 2))
+            leased.append(merged)
+            src_uv = cv2.merge((planes[1], planes[2]), dst=merged.array)
+            self.bytes_copied += merged.array.nbytes
+        scaler.scale(src_uv, uv.reshape(height // 2, width // 2, 2), YUV_BLACK_CHROMA, chroma=True)
+    
+    @staticmethod
+    def _pack_nv12(payload: np.ndarray, planes, source_format: str, width: int, height: int):
+        """NV12: صفحه Y و سپس U/V درهم (interleaved) با نصف رزولوشن"""
+        luma = width * height
+        payload[:luma].reshape(height, width)[:] = planes[0]
+        uv = payload[luma:].reshape(height // 2, width // 2, 2)
+        if source_format == 'nv12':
+            uv.reshape(height // 2, width)[:] = planes[1]
+        else:
+            uv[:, :, 0] = planes[1]
+            uv[:, :, 1] = planes[2]
+    
+    @staticmethod
+    def _pack_yuy2(payload: np.ndarray, planes, source_format: str, width: int, height: int):
+        """YUY2: Y0 U Y1 V برای هر دو پیکسل، chroma عمودی تکرار می‌شود"""
+        if source_format == 'nv12':
+            uv = planes[1].reshape(height // 2, width // 2, 2)
+            u, v = uv[:, :, 0], uv[:, :, 1]
+        else:
+            u, v = planes[1], planes[2]
+        
+        packed = payload.reshape(height, width // 2, 4)
+        packed[:, :, 0] = planes[0][:, 0::2]
+        packed[:, :, 2] = planes[0][:, 1::2]
+        packed[0::2, :, 1] = u
+        packed[1::2, :, 1] = u
+        packed[0::2, :, 3] = v
+        packed[1::2, :, 3] = v
+    
+    def send_frame(self, frame: np.ndarray, width: int = None, height: int = None,
+                   pixel_format: str = 'bgr24', scaler=None, timestamp: int = None) -> bool:
         """
         ارسال یک فریم به درایور
         
         Args:
-            frame: آرایه numpy در فرمت BGR (OpenCV)
+            frame: آرایه numpy در فرمت BGR (OpenCV) یا RGB
             width: عرض فریم (اختیاری، از shape استخراج می‌شود)
             height: ارتفاع فریم (اختیاری، از shape استخراج می‌شود)
+            pixel_format: 'bgr24' یا 'rgb24'؛ فریم rgb24 بدون تبدیل رنگ ارسال می‌شود
+            scaler: FrameScaler از پیش ساخته شده به جای cv2.resize (اختیاری)
+            timestamp: زمان نمایش به واحد 100ns (اختیاری، پیش‌فرض زمان فعلی)
         """
-        if not self.is_open or self.handle == INVALID_HANDLE_VALUE:
+        if not self.is_open:
             logger.warning("درایور دوربین باز نیست")
             return False
         
+        leased = []
         try:
             h, w = frame.shape[:2]
             if width is None:
@@ -103,73 +325,57 @@ class VirtuCoreCamera:
             if height is None:
                 height = h
             
-            # تبدیل BGR به RGB
-            if len(frame.shape) == 3 and frame.shape[2] == 3:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            else:
-                frame_rgb = frame
+            payload = self._payload_view(width * height * 3).reshape(height, width, 3)
+            source = frame
             
-            # Resize اگر لازم باشد
+            # Resize اگر لازم باشد؛ اگر تبدیل رنگ لازم نیست مستقیماً در بافر IOCTL نوشته می‌شود
+            needs_color = pixel_format == 'bgr24' and len(frame.shape) == 3 and frame.shape[2] == 3
             if w != width or h != height:
-                frame_rgb = cv2.resize(frame_rgb, (width, height))
-            
-            frame_bytes = frame_rgb.tobytes()
+                if needs_color:
+                    resize_buffer = self.buffer_pool.lease((height, width) + frame.shape[2:])
+                    leased.append(resize_buffer)
+                    target = resize_buffer.array
+                    self.bytes_copied += target.nbytes
+                else:
+                    target = payload
+                
+                if scaler is not None:
+                    source = scaler.scale(frame, target)
+                else:
+                    source = cv2.resize(frame, (width, height), dst=target)
             
-            # ساخت header
-            header = struct.pack('IIIIQ', 
-                width,
-                height,
-                FORMAT_RGB24,
-                len(frame_bytes),
-                int(time.time() * 1e7)
-            )
-            
-            # ترکیب header و داده
-            buffer = header + frame_bytes
-            bytes_returned = wintypes.DWORD()
-            
-            # ارسال به درایور
-            result = self.kernel32.DeviceIoControl(
-                self.handle,
-                IOCTL_VCAM_SEND_FRAME,
-                buffer,
-                len(buffer),
-                None, 0,
-                ctypes.byref(bytes_returned),
-                None
-            )
+            # تبدیل BGR به RGB مستقیماً در ناحیه داده بافر IOCTL
+            if needs_color:
+                cv2.cvtColor(source, cv2.COLOR_BGR2RGB, dst=payload)
+            elif source is not payload:
+                np.copyto(payload, source.reshape(payload.shape))
+            self.bytes_copied += payload.nbytes
             
-            if not result:
-                error_code = self.kernel32.GetLastError()
-                logger.error(f"خطا در ارسال فریم. کد خطا: {error_code}")
-                return False
-            
-            return True
+            return self._submit(width, height, FORMAT_RGB24, payload.nbytes, timestamp)
             
         except Exception as e:
             logger.error(f"خطا در send_frame: {e}")
             return False
+        finally:
+            for buffer in leased:
+                buffer.release()
     
     def get_status(self) -> dict:
         """دریافت وضعیت درایور"""
-        if not self.is_open or self.handle == INVALID_HANDLE_VALUE:
+        if not self.is_open or self.frame_ring is not None:
             return None
         
         try:
             status_buffer = ctypes.create_string_buffer(20)
-            bytes_returned = wintypes.DWORD()
             
-            result = self.kernel32.DeviceIoControl(
-                self.handle,
+            result = self.backend.ioctl(
                 IOCTL_VCAM_GET_STATUS,
                 None, 0,
                 status_buffer,
-                len(status_buffer),
-                ctypes.byref(bytes_returned),
-                None
+                len(status_buffer)
             )
             
-            if not result:
+            if result is None:
                 return None
             
             is_streaming, width, height, format_type, frames_delivered = struct.unpack(
@@ -188,6 +394,15 @@ class VirtuCoreCamera:
             logger.error(f"خطا در get_status: {e}")
             return None
     
+    def get_stats(self) -> dict:
+        """آمار ارسال: تعداد فریم و بایت‌های کپی شده در هر فریم"""
+        return {
+            'frames_sent': self.frames_sent,
+            'bytes_copied': self.bytes_copied,
+            'bytes_copied_per_frame': self.bytes_copied / self.frames_sent if self.frames_sent else 0.0,
+            'buffer_size': len(self._frame_buffer) if self._frame_buffer is not None else 0
+        }
+    
     def __enter__(self):
         self.open()
         return self
@@ -195,4 +410,3 @@ class VirtuCoreCamera:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
         return False
-
@@ -2,19 +2,22 @@ import pyaudio
 import numpy as np
 import logging
 from typing import Optional
+from streaming.audio_output import CallbackAudioOutput
 
 logger = logging.getLogger(__name__)
 
 class VirtuCoreMicrophone:
-    def __init__(self):
+    def __init__(self, target_latency_ms: float = 40.0):
         self.pa = pyaudio.PyAudio()
         self.render_device_index = None
-        self.stream: Optional[pyaudio.Stream] = None
+        # stream در حالت callback؛ send_audio فقط در ring buffer می‌نویسد
+        self.output: Optional[CallbackAudioOutput] = None
         self.is_open = False
         
         self.sample_rate = 48000
         self.channels = 2
         self.format = pyaudio.paInt16
+        self.target_latency_ms = target_latency_ms
         
     def check_driver_installed(self) -> bool:
         """بررسی نصب درایور میکروفون مجازی"""
@@ -54,15 +57,15 @@ class VirtuCoreMicrophone:
                 logger.error("Virtual Microphone Input یافت نشد")
                 return False
             
-            self.stream = self.pa.open(
-                format=self.format,
-                channels=self.channels,
-                rate=self.sample_rate,
-                output=True,
-                output_device_index=self.render_device_index,
-                frames_per_buffer=1024
+            output = CallbackAudioOutput(
+                self.pa, self.sample_rate, self.channels,
+                target_latency_ms=self.target_latency_ms,
+                device_index=self.render_device_index
             )
+            if not output.open():
+                return False
             
+            self.output = output
             self.is_open = True
             logger.info("✓ اتصال به میکروفون مجازی VirtuCore برقرار شد")
             return True
@@ -73,40 +76,48 @@ class VirtuCoreMicrophone:
     
     def close(self):
         """بستن stream صوتی"""
-        if self.stream:
-            try:
-                self.stream.stop_stream()
-                self.stream.close()
-                logger.info("اتصال به میکروفون مجازی بسته شد")
-            except:
-                pass
-            self.stream = None
+        if self.output:
+            self.output.close()
+            self.output = None
+            logger.info("اتصال به میکروفون مجازی بسته شد")
         
         self.is_open = False
     
+    def configure(self, sample_rate: int, channels: int) -> bool:
+        """تغییر فرمت stream مطابق config صدای گوشی"""
+        self.sample_rate = sample_rate
+        self.channels = channels
+        if self.output and (self.output.sample_rate, self.output.channels) != (sample_rate, channels):
+            return self.output.reconfigure(sample_rate, channels)
+        return True
+    
     def send_audio(self, audio_data: np.ndarray) -> bool:
         """
-        ارسال داده صوتی به میکروفون مجازی
+        ارسال داده صوتی به میکروفون مجازی (بدون انتظار برای کارت صدا)
         
         Args:
-            audio_data: آرایه numpy شامل sample های صوتی (int16)
+            audio_data: آرایه numpy شامل sample های صوتی (int16) یا bytes
         """
-        if not self.is_open or not self.stream:
+        if not self.is_open or not self.output:
             return False
         
         try:
-            if isinstance(audio_data, np.ndarray):
-                audio_bytes = audio_data.tobytes()
-            else:
-                audio_bytes = audio_data
+            if not isinstance(audio_data, np.ndarray):
+                audio_data = np.frombuffer(audio_data, dtype=np.int16)
             
-            self.stream.write(audio_bytes)
+            self.output.write(audio_data)
             return True
             
         except Exception as e:
             logger.error(f"خطا در ارسال صدا: {e}")
             return False
     
+    def get_stats(self) -> dict:
+        """آمار ring buffer: underrun, overrun و تاخیر بافر"""
+        if self.output:
+            return self.output.get_stats()
+        return {}
+    
     def list_audio_devices(self):
         """لیست تمام دستگاه‌های صوتی (برای debugging)"""
         logger.info("=== دستگاه‌های صوتی موجود ===")